@@ -0,0 +1,240 @@
+import contextvars
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.metrics import registry, time_stage
+
+
+ADMISSION_DECISIONS = registry.counter(
+    "llm_admission_total",
+    "LLM admission decisions by outcome",
+    labelnames=("priority", "outcome")
+)
+
+
+# Set while code runs inside a slot admitted further up, so its LLM calls are not admitted twice
+_slot_held = contextvars.ContextVar("admission_slot_held", default=False)
+
+
+class Priority(IntEnum):
+    """Lower values are admitted first"""
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class AdmissionRejected(Exception):
+    """Raised when an LLM call cannot be admitted before its deadline"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float, outcome: str = "rejected"):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.outcome = outcome
+
+
+class TokenBucket:
+    """Classic token bucket; refills continuously at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, now: float) -> float:
+        """Take a token if one is available; otherwise return seconds until one will be"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for a while, e.g. after the provider returned 429"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class AdmissionController:
+    """Global and per-user concurrency caps, rate limiting and priority ordering for LLM calls"""
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_per_user: int,
+        max_queued_per_user: int,
+        requests_per_minute: float,
+        burst: int,
+        queue_timeout: float
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queued_per_user = max_queued_per_user
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate=requests_per_minute / 60.0, capacity=burst)
+
+        self._condition = threading.Condition()
+        self._waiting: List[Tuple[int, int, Optional[int]]] = []  # heap of (priority, seq, user_id)
+        self._sequence = itertools.count()
+        self._active = 0
+        self._active_per_user: Dict[Optional[int], int] = {}
+        self._queued_per_user: Dict[Optional[int], int] = {}
+        # Moving average of how long an admitted call holds its slot, used to estimate queue wait
+        self._avg_service_time = 2.0
+
+    def _next_eligible(self) -> Optional[Tuple[int, int, Optional[int]]]:
+        """Highest-priority waiter whose user is still under the per-user cap"""
+        for entry in sorted(self._waiting):
+            if self._active_per_user.get(entry[2], 0) < self.max_per_user:
+                return entry
+        return None
+
+    def _estimated_wait(self, entry: Tuple[int, int, Optional[int]]) -> float:
+        ahead = sum(1 for other in self._waiting if other < entry)
+        slots_needed = ahead + 1 - (self.max_concurrent - self._active)
+        if slots_needed <= 0:
+            return 0.0
+        return math.ceil(slots_needed / self.max_concurrent) * self._avg_service_time
+
+    def _reject(self, entry, priority: Priority, outcome: str, status_code: int, detail: str, retry_after: float):
+        self._remove_waiter(entry)
+        ADMISSION_DECISIONS.inc(priority=priority.name.lower(), outcome=outcome)
+        raise AdmissionRejected(status_code, detail, retry_after, outcome)
+
+    def _remove_waiter(self, entry):
+        self._waiting.remove(entry)
+        heapq.heapify(self._waiting)
+        user_id = entry[2]
+        self._queued_per_user[user_id] -= 1
+        if not self._queued_per_user[user_id]:
+            del self._queued_per_user[user_id]
+        self._condition.notify_all()
+
+    def _acquire(self, user_id: Optional[int], priority: Priority, deadline: float):
+        with self._condition:
+            if self._queued_per_user.get(user_id, 0) >= self.max_queued_per_user:
+                ADMISSION_DECISIONS.inc(priority=priority.name.lower(), outcome="rejected_user_queue")
+                raise AdmissionRejected(
+                    429,
+                    "Too many AI requests in progress for this account. Please wait for earlier questions to finish.",
+                    self._avg_service_time,
+                    "rejected_user_queue"
+                )
+
+            entry = (int(priority), next(self._sequence), user_id)
+            heapq.heappush(self._waiting, entry)
+            self._queued_per_user[user_id] = self._queued_per_user.get(user_id, 0) + 1
+
+            while True:
+                now = time.monotonic()
+                remaining = deadline - now
+
+                # Reject early when the expected wait already overshoots the deadline
+                estimated_wait = self._estimated_wait(entry)
+                if remaining <= 0 or estimated_wait > remaining:
+                    self._reject(
+                        entry, priority, "rejected_deadline", 503,
+                        "The AI service is busy. Please try again shortly.",
+                        max(estimated_wait, 1)
+                    )
+
+                wait_time = remaining
+                if self._active < self.max_concurrent and self._next_eligible() == entry:
+                    token_wait = self.bucket.try_acquire(now)
+                    if token_wait == 0:
+                        self._remove_waiter(entry)
+                        self._active += 1
+                        self._active_per_user[user_id] = self._active_per_user.get(user_id, 0) + 1
+                        ADMISSION_DECISIONS.inc(priority=priority.name.lower(), outcome="admitted")
+                        return
+                    if token_wait > remaining:
+                        self._reject(
+                            entry, priority, "rejected_rate_limit", 429,
+                            "AI request rate limit reached. Please wait a moment and try again.",
+                            token_wait
+                        )
+                    wait_time = token_wait
+
+                self._condition.wait(timeout=min(wait_time, remaining))
+
+    def _release(self, user_id: Optional[int], service_time: float):
+        with self._condition:
+            self._active -= 1
+            self._active_per_user[user_id] -= 1
+            if not self._active_per_user[user_id]:
+                del self._active_per_user[user_id]
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+            self._condition.notify_all()
+
+    def acquire(self, user_id: Optional[int], priority: Priority = Priority.INTERACTIVE, deadline: Optional[float] = None) -> float:
+        """Block until a slot is free, or raise AdmissionRejected; returns the admission time to release() with"""
+        if deadline is None:
+            deadline = time.monotonic() + self.queue_timeout
+        with time_stage("llm_queue_wait"):
+            self._acquire(user_id, priority, deadline)
+        return time.monotonic()
+
+    def release(self, user_id: Optional[int], admitted_at: float):
+        self._release(user_id, time.monotonic() - admitted_at)
+
+    @contextmanager
+    def holding(self, user_id: Optional[int], admitted_at: float):
+        """Run LLM calls in a slot taken earlier with acquire(), possibly on another thread; releases it on exit"""
+        token = _slot_held.set(True)
+        try:
+            yield
+        finally:
+            _slot_held.reset(token)
+            self.release(user_id, admitted_at)
+
+    @contextmanager
+    def admit(self, user_id: Optional[int], priority: Priority = Priority.INTERACTIVE, deadline: Optional[float] = None):
+        """Block until the call may proceed, or raise AdmissionRejected"""
+        if _slot_held.get():
+            # Already admitted by the caller, e.g. before generation was handed to its pool
+            yield
+            return
+        admitted_at = self.acquire(user_id, priority, deadline)
+        try:
+            yield
+        finally:
+            self.release(user_id, admitted_at)
+
+    def backoff(self, seconds: float):
+        """Pause admissions after the provider itself signalled a rate limit"""
+        with self._condition:
+            self.bucket.pause(seconds)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "active": self._active,
+                "queued": len(self._waiting),
+                "active_per_user": dict(self._active_per_user),
+                "avg_service_time": round(self._avg_service_time, 3)
+            }
+
+
+# Global instance
+admission_controller = AdmissionController(
+    max_concurrent=settings.llm_max_concurrent,
+    max_per_user=settings.llm_max_concurrent_per_user,
+    max_queued_per_user=settings.llm_max_queued_per_user,
+    requests_per_minute=settings.llm_requests_per_minute,
+    burst=settings.llm_burst,
+    queue_timeout=settings.llm_queue_timeout
+)
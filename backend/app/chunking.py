@@ -0,0 +1,105 @@
+import re
+from typing import Callable, List, Optional
+from pydantic import BaseModel
+
+
+# Form feed separates PDF pages in extracted text
+PAGE_BREAK = "\f"
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+|\n\s*\n")
+
+
+class Chunk(BaseModel):
+    text: str
+    token_count: int
+    page: int
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split on sentence punctuation and blank lines, keeping the punctuation"""
+    return [sentence.strip() for sentence in _SENTENCE_BOUNDARY.split(text) if sentence and sentence.strip()]
+
+
+def whitespace_token_counter(texts: List[str]) -> List[int]:
+    """Cheap stand-in when no model tokenizer is available"""
+    return [len(text.split()) for text in texts]
+
+
+class TokenChunker:
+    """Packs whole sentences into chunks sized in model tokens.
+
+    Chunks never cross a page break when `respect_pages` is set; sentences longer
+    than the budget are split on word boundaries. Consecutive chunks share up to
+    `overlap_tokens` worth of trailing sentences.
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: int,
+        overlap_tokens: int,
+        respect_pages: bool = True,
+        count_tokens: Optional[Callable[[List[str]], List[int]]] = None
+    ):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+        self.respect_pages = respect_pages
+        self.count_tokens = count_tokens or whitespace_token_counter
+
+    def _split_long_sentence(self, sentence: str) -> List[str]:
+        words = sentence.split()
+        counts = self.count_tokens(words)
+        pieces, current, current_tokens = [], [], 0
+        for word, tokens in zip(words, counts):
+            if current and current_tokens + tokens > self.chunk_tokens:
+                pieces.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(word)
+            current_tokens += tokens
+        if current:
+            pieces.append(" ".join(current))
+        return pieces
+
+    def _chunk_section(self, text: str, page: int) -> List[Chunk]:
+        sentences = split_sentences(text)
+        if not sentences:
+            return []
+
+        # Tokenize every sentence in one batch, then break up the oversized ones
+        units = []
+        for sentence, tokens in zip(sentences, self.count_tokens(sentences)):
+            if tokens > self.chunk_tokens:
+                pieces = self._split_long_sentence(sentence)
+                units.extend(zip(pieces, self.count_tokens(pieces)))
+            else:
+                units.append((sentence, tokens))
+
+        chunks = []
+        current: List[tuple] = []
+        current_tokens = 0
+        for unit in units:
+            if current and current_tokens + unit[1] > self.chunk_tokens:
+                chunks.append(Chunk(text=" ".join(u[0] for u in current), token_count=current_tokens, page=page))
+                # Carry trailing sentences forward as overlap
+                overlap, overlap_tokens = [], 0
+                for previous in reversed(current):
+                    if overlap_tokens + previous[1] > self.overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_tokens += previous[1]
+                # Never let the overlap push the next chunk over budget
+                while overlap and overlap_tokens + unit[1] > self.chunk_tokens:
+                    overlap_tokens -= overlap.pop(0)[1]
+                current, current_tokens = overlap, overlap_tokens
+            current.append(unit)
+            current_tokens += unit[1]
+        if current:
+            chunks.append(Chunk(text=" ".join(u[0] for u in current), token_count=current_tokens, page=page))
+        return chunks
+
+    def split(self, text: str) -> List[Chunk]:
+        if not self.respect_pages:
+            return self._chunk_section(text.replace(PAGE_BREAK, "\n"), page=0)
+        chunks = []
+        for page, page_text in enumerate(text.split(PAGE_BREAK)):
+            chunks.extend(self._chunk_section(page_text, page=page))
+        return chunks
@@ -0,0 +1,59 @@
+import asyncio
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from app.metrics import registry, time_stage
+
+
+COALESCED_REQUESTS = registry.counter(
+    "qa_coalesced_requests_total",
+    "Requests that waited on an identical in-flight computation instead of starting their own"
+)
+INFLIGHT_COMPUTATIONS = registry.counter(
+    "qa_inflight_computations_total",
+    "Computations started by a single-flight leader"
+)
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question so trivially different spellings share a key"""
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one in-flight computation"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def inflight_count(self) -> int:
+        return len(self._inflight)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every caller had already gone
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run fn once per key; returns (result, shared) where shared means we were a follower
+
+        The computation runs in its own task and every caller awaits it through a
+        shield, so a caller that disconnects, the first one included, cancels only
+        its own wait.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            COALESCED_REQUESTS.inc()
+            with time_stage("coalesced_wait"):
+                return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(partial(self._finished, key))
+        INFLIGHT_COMPUTATIONS.inc()
+        return await asyncio.shield(task), False
+
+
+# Global instance for /qa/ask
+question_flight = SingleFlight()
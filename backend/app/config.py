@@ -11,17 +11,93 @@ class Settings(BaseSettings):
     secret_key: str = "your-secret-key-here-change-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    admin_emails: List[str] = []
     
     # OpenAI
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     
+    # LLM admission control (defaults match the OpenAI tier 1 limit for gpt-3.5-turbo)
+    llm_max_concurrent: int = 16
+    llm_max_concurrent_per_user: int = 2
+    llm_max_queued_per_user: int = 8
+    llm_requests_per_minute: float = 3500
+    llm_burst: int = 20
+    llm_queue_timeout: float = 30.0  # seconds a call may wait for admission, capped by the answer deadline
+    
+    # Answer deadline; past it /qa/ask returns a degraded extractive answer (0 disables)
+    qa_answer_deadline: float = 20.0
+    answer_cache_size: int = 1024
+    # /qa/ask/batch limits; parallelism stays within the per-user LLM cap by default
+    qa_batch_max_questions: int = 20
+    qa_batch_parallelism: int = 2
+    answer_cache_ttl: float = 3600.0
+    # Conversation sessions (/qa/ask with conversation_id), kept in memory per worker
+    conversation_max_sessions: int = 10000
+    conversation_idle_ttl: float = 1800.0
+    conversation_max_turns: int = 10
+    # Token budget of the standalone query condensed from a follow-up and earlier turns
+    conversation_history_tokens: int = 128
+    # Lexical similarity above which a follow-up reuses the previous turn's chunks
+    conversation_reuse_min_score: float = 0.2
+    # Extractive fallback: sentences returned, minimum score, and embedding vs TF-IDF blend (0 = TF-IDF only)
+    fallback_answer_sentences: int = 3
+    fallback_min_score: float = 0.1
+    fallback_embedding_weight: float = 0.7
+    
+    # Uploads larger than this are rejected while they stream in
+    max_upload_mb: int = 10
+    # Snapshots carry vectors as well as text, so they get a separate, larger limit
+    max_snapshot_mb: int = 500
+    
+    # Embedding model; changing it takes effect through /admin/embedding-migration
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    embedding_migration_docs_per_second: float = 5.0
+    # Cache of question embeddings, pre-warmed at startup from recent frequent questions
+    query_embedding_cache_size: int = 10000
+    query_embedding_warm_days: int = 7
+    query_embedding_warm_per_user: int = 20
+    
     # Vector Database
     chroma_persist_directory: str = "./chroma_db"
+    # "embedded" loads the model and Chroma in every worker; "sidecar" talks to app.vector_service
+    vector_store_mode: str = "embedded"
+    vector_service_address: str = "/tmp/ai_qa_vector_store.sock"
+    # Shared by the sidecar and the API workers; kept apart from secret_key so it can't sign tokens
+    vector_service_authkey: str = "your-vector-service-key-here-change-in-production"
+    # Bounds on open per-user collection handles
+    vector_max_open_collections: int = 256
+    vector_collections_memory_mb: int = 512
+    # "auto" keeps small tenants on a memory-mapped exact index and promotes them to Chroma
+    vector_index_backend: str = "auto"
+    exact_index_directory: str = "./exact_index"
+    exact_index_max_chunks: int = 2000
+    # Users are spread over this many shards by consistent hashing (1 = unsharded)
+    vector_shards: int = 1
+    # Sidecar address per shard when VECTOR_STORE_MODE=sidecar and VECTOR_SHARDS > 1
+    vector_shard_addresses: List[str] = []
+    # Retrieval fetches up to retrieval_max_k chunks and keeps an adaptive number of them:
+    # "gap" cuts at the first score drop larger than retrieval_relative_gap x the best score,
+    # "threshold" drops chunks below retrieval_min_similarity, "fixed" keeps them all
+    retrieval_k_mode: str = "gap"
+    retrieval_max_k: int = 6
+    retrieval_min_k: int = 1
+    retrieval_relative_gap: float = 0.15
+    retrieval_min_similarity: float = 0.3
+    # Best cosine similarity below this answers "not found" without calling the LLM
+    retrieval_answer_cutoff: float = 0.2
+    # Default chunk size in embedding-model tokens; tenants can override via /documents/chunking
+    chunk_tokens: int = 200
+    chunk_overlap_tokens: int = 32
     
     # App Settings
     debug: bool = True
     allowed_hosts: List[str] = ["*"]
     
+    # Profiling (admins only, opt-in per request)
+    profiling_enabled: bool = False
+    profiling_sample_interval: float = 0.005  # seconds between stack samples
+    profiling_max_stored: int = 20  # slowest profiles kept for download
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -0,0 +1,181 @@
+"""Conversation sessions for follow-up questions.
+
+A session keeps the last few turns of one conversation in memory. For each
+follow-up the most recent turns that fit a fixed token budget are kept: they
+are folded into a standalone query for retrieval and handed to the LLM as
+earlier messages, while the question itself stays as asked. A follow-up that
+stays on the previous turn's topic reuses that turn's retrieved chunks instead
+of embedding and searching again.
+
+Sessions live in the worker that served them and are dropped after
+CONVERSATION_IDLE_TTL seconds without a turn or when the LRU is full; a
+question for an unknown conversation simply starts a new one.
+"""
+import hashlib
+import json
+import re
+import threading
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+from app.chunking import whitespace_token_counter
+from app.config import settings
+from app.extractive import content_terms, tfidf_scores
+from app.lru import LRUCache
+from app.metrics import registry
+from app.retrieval import ScoredDocument
+
+
+CONVERSATION_RETRIEVALS = registry.counter(
+    "qa_conversation_retrievals_total",
+    "Follow-up questions by whether the previous turn's chunks were reused",
+    labelnames=("outcome",)
+)
+
+# Words that point back at the previous turn ("what about the second one?")
+REFERRING_WORDS = frozenset(
+    "it its this that these those they them their one ones first second third last former latter above previous same".split()
+)
+
+# A follow-up with no more content words than this leans on the previous turn for its meaning
+SHORT_FOLLOW_UP_TERMS = 4
+
+CountTokens = Callable[[List[str]], List[int]]
+
+
+class Turn:
+    def __init__(self, question: str, answer: str):
+        self.question = question
+        self.answer = answer
+
+
+class ConversationSession:
+    def __init__(self, max_turns: int):
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        # What the last turn retrieved, and for which scope and corpus
+        self.results: List[ScoredDocument] = []
+        self.scope: Optional[Tuple[int, ...]] = None
+        self.corpus_version: Optional[int] = None
+        # Turns of one conversation are answered one at a time
+        self.lock = threading.Lock()
+
+    def add_turn(
+        self,
+        question: str,
+        answer: str,
+        results: List[ScoredDocument],
+        scope: Optional[Tuple[int, ...]],
+        corpus_version: int
+    ):
+        self.turns.append(Turn(question, answer))
+        self.results = results
+        self.scope = scope
+        self.corpus_version = corpus_version
+
+
+def _truncate_to_budget(text: str, budget: int, count_tokens: CountTokens) -> str:
+    """Keep the leading words of `text` that fit in `budget` tokens"""
+    words = text.split()
+    kept, used = [], 0
+    for word, tokens in zip(words, count_tokens(words)):
+        if used + tokens > budget:
+            break
+        kept.append(word)
+        used += tokens
+    return " ".join(kept)
+
+
+def condense_history(
+    turns: List[Turn],
+    question: str,
+    budget: int,
+    count_tokens: CountTokens = whitespace_token_counter
+) -> List[Tuple[str, str]]:
+    """The recent (question, answer) pairs that fit in `budget` tokens next to the new question.
+
+    The newest turns are kept first, each question before its answer; a piece
+    that does not fit whole is cut short. Pairs come back oldest first.
+    """
+    if not turns:
+        return []
+    # Newest turn first; every text is counted in one tokenizer call
+    texts = [text for turn in reversed(turns) for text in (turn.question, turn.answer)]
+    counts = count_tokens([question] + texts)
+    remaining = budget - counts[0]
+
+    kept: List[str] = []
+    for text, tokens in zip(texts, counts[1:]):
+        if remaining <= 0:
+            break
+        if tokens > remaining:
+            text = _truncate_to_budget(text, remaining, count_tokens)
+            tokens = remaining
+        kept.append(text)
+        remaining -= tokens
+    # Pad a question whose answer did not fit, then restore chronological order
+    if len(kept) % 2:
+        kept.append("")
+    pairs = [(kept[i], kept[i + 1]) for i in range(0, len(kept), 2) if kept[i]]
+    return list(reversed(pairs))
+
+
+def retrieval_query(history: List[Tuple[str, str]], question: str) -> str:
+    """A standalone query for embedding and search: the question with the condensed history"""
+    if not history:
+        return question
+    lines = [text for pair in history for text in pair if text]
+    return "Earlier in this conversation:\n" + "\n".join(lines) + f"\n\nCurrent question: {question}"
+
+
+def history_digest(history: List[Tuple[str, str]]) -> str:
+    """Short stable key for the history an answer was generated with"""
+    return hashlib.sha1(json.dumps(history).encode()).hexdigest()[:16]
+
+
+def is_on_topic(session: ConversationSession, question: str, min_score: float) -> bool:
+    """Whether a follow-up can be answered from the previous turn's chunks.
+
+    Short questions that refer back ("and the second one?") always qualify;
+    otherwise the question must overlap lexically with the previous question or
+    one of its chunks.
+    """
+    if not session.turns or not session.results:
+        return False
+    terms = content_terms(question)
+    refers_back = any(word in REFERRING_WORDS for word in re.findall(r"\w+", question.lower()))
+    if refers_back and len(terms) <= SHORT_FOLLOW_UP_TERMS:
+        return True
+    if not terms:
+        return False
+    previous = [session.turns[-1].question] + [doc.page_content for doc, _ in session.results]
+    return float(tfidf_scores(question, previous).max()) >= min_score
+
+
+def can_reuse_results(
+    session: ConversationSession,
+    question: str,
+    scope: Optional[Tuple[int, ...]],
+    corpus_version: int
+) -> bool:
+    """Reuse needs the same scope and corpus as the previous turn, and an on-topic question"""
+    reuse = (
+        session.scope == scope
+        and session.corpus_version == corpus_version
+        and is_on_topic(session, question, settings.conversation_reuse_min_score)
+    )
+    if session.turns:
+        CONVERSATION_RETRIEVALS.inc(outcome="reused" if reuse else "searched")
+    return reuse
+
+
+# (user_id, conversation_id) -> ConversationSession; each turn re-stores its session, so the TTL measures idle time
+conversation_sessions = LRUCache(maxsize=settings.conversation_max_sessions, ttl=settings.conversation_idle_ttl)
+
+
+def get_session(user_id: int, conversation_id: str) -> ConversationSession:
+    return conversation_sessions.get_or_create(
+        (user_id, conversation_id), lambda: ConversationSession(settings.conversation_max_turns)
+    )
+
+
+def touch_session(user_id: int, conversation_id: str, session: ConversationSession):
+    conversation_sessions.set((user_id, conversation_id), session)
@@ -0,0 +1,37 @@
+import contextvars
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a step of a request cannot finish before the request's deadline"""
+
+
+class Deadline:
+    """A point in time by which a request should have produced its answer"""
+
+    def __init__(self, seconds: Optional[float]):
+        # A missing or non-positive budget means the request never times out
+        self.expires_at = time.monotonic() + seconds if seconds and seconds > 0 else None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, None when unbounded; never negative"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+
+# Deadline of the request the current thread works for, so calls far down the stack can honour it
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+
+def bind_deadline(deadline: Optional[Deadline]):
+    """Make `deadline` the current request's; call it inside the worker thread's own context"""
+    _current_deadline.set(deadline)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
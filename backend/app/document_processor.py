@@ -1,19 +1,76 @@
 import PyPDF2
+import hashlib
 import io
-from typing import Tuple
+from typing import BinaryIO, Tuple
 import magic
+from fastapi import UploadFile
+from app.metrics import time_stage
+from app.chunking import PAGE_BREAK
+
+
+# Uploads are consumed in blocks of this size
+UPLOAD_READ_CHUNK = 64 * 1024
+
+# libmagic only needs the leading bytes to tell PDF from plain text
+SNIFF_BYTES = 8192
+
+
+class UploadTooLarge(ValueError):
+    """Raised as soon as an upload passes the size limit"""
+
+
+class SpooledUpload:
+    """An upload consumed once: its size, content hash, leading bytes and a rewound file"""
+    
+    def __init__(self, file: BinaryIO, size: int, content_hash: str, head: bytes):
+        self.file = file
+        self.size = size
+        self.content_hash = content_hash
+        self.head = head
 
 
 class DocumentProcessor:
+    @staticmethod
+    async def spool_upload(upload: UploadFile, max_size_mb: int = 10) -> SpooledUpload:
+        """Stream an upload block by block, hashing as it goes and stopping at the size limit"""
+        max_bytes = max_size_mb * 1024 * 1024
+        digest = hashlib.sha256()
+        head = b""
+        size = 0
+        
+        while True:
+            block = await upload.read(UPLOAD_READ_CHUNK)
+            if not block:
+                break
+            size += len(block)
+            if size > max_bytes:
+                raise UploadTooLarge(f"File size too large. Maximum size is {max_size_mb}MB.")
+            if len(head) < SNIFF_BYTES:
+                head += block[:SNIFF_BYTES - len(head)]
+            digest.update(block)
+        
+        # The upload is already spooled by the form parser; rewind it instead of copying it
+        await upload.seek(0)
+        return SpooledUpload(upload.file, size, digest.hexdigest(), head)
+    
     @staticmethod
     def extract_text_from_file(file_content: bytes, filename: str) -> Tuple[str, str]:
         """Extract text content from uploaded file"""
+        return DocumentProcessor.extract_text_from_stream(
+            io.BytesIO(file_content), file_content[:SNIFF_BYTES], filename
+        )
+    
+    @staticmethod
+    def extract_text_from_stream(file: BinaryIO, head: bytes, filename: str) -> Tuple[str, str]:
+        """Extract text from a seekable file, detecting its type from the leading bytes only"""
         
         # Detect file type
-        file_type = magic.from_buffer(file_content, mime=True)
+        with time_stage("mime_sniff"):
+            file_type = magic.from_buffer(head, mime=True)
         
         if file_type == "text/plain":
             # Handle .txt files
+            file_content = file.read()
             try:
                 text = file_content.decode('utf-8')
                 return text, "txt"
@@ -27,10 +84,11 @@ class DocumentProcessor:
         elif file_type == "application/pdf":
             # Handle .pdf files
             try:
-                pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
+                with time_stage("pdf_extract"):
+                    # PdfReader seeks within the file itself, so it never needs a bytes copy
+                    pdf_reader = PyPDF2.PdfReader(file)
+                    # Keep page boundaries so the chunker can avoid splitting across them
+                    text = PAGE_BREAK.join(page.extract_text() for page in pdf_reader.pages)
                 return text, "pdf"
             except Exception as e:
                 raise ValueError(f"Error processing PDF file: {str(e)}")
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+
+STATE_FILE = "embedding_versions.json"
+
+# The model every collection was embedded with before models were versioned
+LEGACY_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Loaded models by name, shared by every store (and shard) in the process
+_models = {}
+_models_lock = threading.Lock()
+
+
+def load_embeddings(model_name: str) -> HuggingFaceEmbeddings:
+    with _models_lock:
+        if model_name not in _models:
+            _models[model_name] = HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={'device': 'cpu'},
+                # Scores assume unit vectors (cosine = 1 - squared L2 / 2, or a plain dot product)
+                encode_kwargs={'normalize_embeddings': True}
+            )
+        return _models[model_name]
+
+
+def version_suffix(model_name: str) -> str:
+    """Storage suffix for collections embedded with a given model"""
+    return "_" + hashlib.sha1(model_name.encode()).hexdigest()[:8]
+
+
+class EmbeddingVersion:
+    """One embedding model and the storage suffix of the collections it produced.
+
+    The model that predates versioning keeps an empty suffix, so existing
+    collections and exact indexes are used as they are.
+    """
+
+    def __init__(self, model_name: str, suffix: str):
+        self.model_name = model_name
+        self.suffix = suffix
+        self._embeddings: Optional[HuggingFaceEmbeddings] = None
+
+    @property
+    def embeddings(self) -> HuggingFaceEmbeddings:
+        # Loaded on first use so a pending migration target costs nothing until needed
+        if self._embeddings is None:
+            self._embeddings = load_embeddings(self.model_name)
+        return self._embeddings
+
+    def to_dict(self) -> dict:
+        return {"model": self.model_name, "suffix": self.suffix}
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> Optional["EmbeddingVersion"]:
+        return cls(data["model"], data["suffix"]) if data else None
+
+
+class EmbeddingState:
+    """Which model serves queries and which one, if any, is being migrated to.
+
+    Persisted next to the Chroma data so a restart keeps serving the same
+    version and resumes dual writes to an unfinished migration target.
+    """
+
+    def __init__(self, directory: str, active: EmbeddingVersion, target: Optional[EmbeddingVersion] = None):
+        self.path = os.path.join(directory, STATE_FILE)
+        self.active = active
+        self.target = target
+
+    @classmethod
+    def load(cls, directory: str, configured_model: str) -> "EmbeddingState":
+        """Read the saved state, creating it on first start.
+
+        An empty directory starts out on the configured model. Data written
+        before versioning was embedded with LEGACY_MODEL, so that stays active
+        and a different configured model becomes the migration target.
+        """
+        path = os.path.join(directory, STATE_FILE)
+        if not os.path.exists(path):
+            if not os.listdir(directory):
+                state = cls(directory, EmbeddingVersion(configured_model, ""))
+            else:
+                target = None
+                if configured_model != LEGACY_MODEL:
+                    target = EmbeddingVersion(configured_model, version_suffix(configured_model))
+                state = cls(directory, EmbeddingVersion(LEGACY_MODEL, ""), target)
+            state.save()
+            return state
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(directory, EmbeddingVersion.from_dict(data["active"]), EmbeddingVersion.from_dict(data.get("target")))
+
+    def save(self):
+        """Write to a temporary file and swap it in, so the cutover is a single rename"""
+        data = {
+            "active": self.active.to_dict(),
+            "target": self.target.to_dict() if self.target else None
+        }
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(self.path + ".tmp", self.path)
@@ -0,0 +1,349 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock shared with other processes, e.g. several embedded-mode workers"""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)  # LK_LOCK gives up after ten seconds; keep waiting
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class _Segment:
+    """One immutable batch of rows: a memory-mapped float16 matrix plus its table"""
+
+    def __init__(self, name: str, vectors: np.ndarray, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        self.name = name
+        self.vectors = vectors
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+
+
+class ExactIndex:
+    """Brute-force cosine index for small tenants.
+
+    Rows are stored in immutable segments, each a float16 `.npy` file that is
+    memory-mapped on load plus a columnar JSON table of ids, texts and metadata.
+    A manifest lists the live segments and the ids of deleted rows; it is the
+    only file ever replaced, so a write is one atomic rename and no mapped file
+    is overwritten. Adds write a new segment and merge small trailing ones,
+    deletes only record tombstones, and a compaction rewrites live rows once
+    most of them are gone. Writers hold a file lock and re-read the manifest
+    first, so several processes can share the directory. A search is one
+    matmul plus an argpartition, which beats HNSW for a few hundred chunks.
+    """
+
+    MANIFEST_FILE = "manifest.json"
+    LOCK_FILE = ".lock"
+    VECTORS_FILE = "vectors.npy"
+    TABLE_FILE = "table.json"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._segments: List[_Segment] = []
+        self._tombstones: set = set()
+        # Identity of the manifest last read, to notice writes by other processes; () until first read
+        self._manifest_stat: Optional[Tuple[int, ...]] = ()
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        # Row columns used for pre-search filtering, chunk paging and skipping deleted rows
+        self._document_ids = np.empty(0, dtype=np.int64)
+        self._chunk_indexes = np.empty(0, dtype=np.int64)
+        self._live = np.empty(0, dtype=bool)
+        self._segment_starts: List[int] = []
+        with self._lock:
+            self._refresh()
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return (
+            os.path.exists(os.path.join(directory, cls.MANIFEST_FILE))
+            # Single-file layout written before segments existed
+            or os.path.exists(os.path.join(directory, cls.VECTORS_FILE))
+        )
+
+    def _path(self, *names: str) -> str:
+        return os.path.join(self.directory, *names)
+
+    @contextmanager
+    def _writing(self):
+        """Hold the cross-process lock with the on-disk state freshly loaded"""
+        os.makedirs(self.directory, exist_ok=True)
+        with _file_lock(self._path(self.LOCK_FILE)):
+            self._upgrade_single_file_layout()
+            self._refresh()
+            yield
+
+    def _stat_manifest(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self._path(self.MANIFEST_FILE))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _refresh(self):
+        """Reload the manifest if another writer replaced it; segments already mapped are kept"""
+        manifest_stat = self._stat_manifest()
+        if manifest_stat == self._manifest_stat:
+            return
+        if manifest_stat is None:
+            if os.path.exists(self._path(self.VECTORS_FILE)):
+                self._load_single_file_layout()
+            else:
+                self._set_state([], set())
+            self._manifest_stat = None
+            return
+        with open(self._path(self.MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        loaded = {segment.name: segment for segment in self._segments}
+        segments = [loaded.get(name) or self._read_segment(name) for name in manifest["segments"]]
+        self._set_state(segments, set(manifest["tombstones"]))
+        self._manifest_stat = manifest_stat
+
+    def _read_segment(self, name: str) -> _Segment:
+        vectors = np.load(self._path(name, self.VECTORS_FILE), mmap_mode="r")
+        with open(self._path(name, self.TABLE_FILE), encoding="utf-8") as f:
+            table = json.load(f)
+        return _Segment(name, vectors, table["ids"], table["texts"], table["metadatas"])
+
+    def _load_single_file_layout(self):
+        vectors = np.load(self._path(self.VECTORS_FILE), mmap_mode="r")
+        with open(self._path(self.TABLE_FILE), encoding="utf-8") as f:
+            table = json.load(f)
+        self._set_state([_Segment("", vectors, table["ids"], table["texts"], table["metadatas"])], set())
+
+    def _upgrade_single_file_layout(self):
+        """Move an index written before segments existed into the first segment"""
+        if os.path.exists(self._path(self.MANIFEST_FILE)) or not os.path.exists(self._path(self.VECTORS_FILE)):
+            return
+        name = self._new_segment_name()
+        os.makedirs(self._path(name))
+        for file_name in (self.TABLE_FILE, self.VECTORS_FILE):
+            os.replace(self._path(file_name), self._path(name, file_name))
+        self._write_manifest([name], set())
+
+    def _set_state(self, segments: List[_Segment], tombstones: set):
+        self._segments = segments
+        self._tombstones = tombstones
+        self._ids = [row_id for segment in segments for row_id in segment.ids]
+        self._texts = [text for segment in segments for text in segment.texts]
+        self._metadatas = [metadata for segment in segments for metadata in segment.metadatas]
+        self._document_ids = np.array([m.get("document_id", -1) for m in self._metadatas], dtype=np.int64)
+        self._chunk_indexes = np.array([m.get("chunk_index", -1) for m in self._metadatas], dtype=np.int64)
+        self._live = np.array([row_id not in tombstones for row_id in self._ids], dtype=bool)
+        self._segment_starts = list(np.cumsum([0] + [len(segment.ids) for segment in segments])[:-1])
+
+    @staticmethod
+    def _new_segment_name() -> str:
+        return f"segment_{uuid.uuid4().hex[:12]}"
+
+    def _write_segment(self, vectors: np.ndarray, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> _Segment:
+        """Write a new segment directory; it is invisible until the manifest lists it"""
+        name = self._new_segment_name()
+        os.makedirs(self._path(name))
+        with open(self._path(name, self.VECTORS_FILE), "wb") as f:
+            np.save(f, vectors)
+        with open(self._path(name, self.TABLE_FILE), "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "texts": texts, "metadatas": metadatas}, f)
+        return self._read_segment(name)
+
+    def _write_manifest(self, names: List[str], tombstones: set):
+        """Swap in a new manifest, so a write becomes visible in one rename"""
+        manifest_path = self._path(self.MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"segments": names, "tombstones": sorted(tombstones)}, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def _commit(self, segments: List[_Segment], tombstones: set):
+        self._write_manifest([segment.name for segment in segments], tombstones)
+        self._set_state(segments, tombstones)
+        self._manifest_stat = self._stat_manifest()
+        self._remove_unlisted_segments()
+
+    def _remove_unlisted_segments(self):
+        """Delete segments no longer in the manifest.
+
+        A segment still mapped by a search, here or in another process, cannot be
+        removed on Windows; it is left behind and retried on the next write.
+        """
+        listed = {segment.name for segment in self._segments}
+        for name in os.listdir(self.directory):
+            if name.startswith("segment_") and name not in listed:
+                shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def _merge(self, segments: List[_Segment], tombstones: set) -> Tuple[_Segment, set]:
+        """One segment holding the live rows of `segments`; returns it with the tombstones still needed"""
+        vectors, ids, texts, metadatas = [], [], [], []
+        for segment in segments:
+            keep = [i for i, row_id in enumerate(segment.ids) if row_id not in tombstones]
+            vectors.append(np.asarray(segment.vectors[keep]))
+            ids.extend(segment.ids[i] for i in keep)
+            texts.extend(segment.texts[i] for i in keep)
+            metadatas.extend(segment.metadatas[i] for i in keep)
+        merged_away = {row_id for segment in segments for row_id in segment.ids}
+        merged = self._write_segment(np.concatenate(vectors), ids, texts, metadatas)
+        return merged, tombstones - merged_away
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add(self, ids: List[str], embeddings: List[List[float]], texts: List[str], metadatas: List[Dict[str, Any]]):
+        new_vectors = self._normalize(np.asarray(embeddings, dtype=np.float32)).astype(np.float16)
+        with self._lock, self._writing():
+            segments = self._segments + [self._write_segment(new_vectors, list(ids), list(texts), list(metadatas))]
+            tombstones = self._tombstones
+            # Merge the newest segment into its neighbour while it is at least half that size,
+            # which keeps O(log n) segments and rewrites each row O(log n) times overall
+            while len(segments) > 1 and 2 * len(segments[-1].ids) >= len(segments[-2].ids):
+                merged, tombstones = self._merge(segments[-2:], tombstones)
+                segments = segments[:-2] + [merged]
+            self._commit(segments, tombstones)
+
+    def search(
+        self,
+        query_embedding: List[float],
+        k: int,
+        document_ids: Optional[List[int]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Top-k documents with their cosine similarity, best first, optionally within some documents"""
+        return self.search_many([query_embedding], k, document_ids)[0]
+
+    def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        k: int,
+        document_ids: Optional[List[int]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Top-k results for several queries, scored in a single matrix product per segment"""
+        with self._lock:
+            self._refresh()
+            segments, starts = self._segments, self._segment_starts
+            texts, metadatas = self._texts, self._metadatas
+            document_column, live = self._document_ids, self._live
+
+        # Filter before scoring so only candidate rows are read and multiplied
+        candidate = live if document_ids is None else live & np.isin(document_column, document_ids)
+        rows = np.flatnonzero(candidate)
+        if not len(rows):
+            return [[] for _ in query_embeddings]
+
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+        all_scores = self._vectors_at(segments, starts, rows) @ queries.T
+        k = min(k, all_scores.shape[0])
+        results = []
+        for scores in all_scores.T:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results.append([
+                (Document(page_content=texts[i], metadata=metadatas[i]), float(score))
+                for i, score in zip(rows[top], scores[top])
+            ])
+        return results
+
+    @staticmethod
+    def _vectors_at(segments: List[_Segment], starts: List[int], rows: np.ndarray) -> np.ndarray:
+        """float32 vectors of the given global rows, read segment by segment"""
+        parts = []
+        for segment, start in zip(segments, starts):
+            local = rows[(rows >= start) & (rows < start + len(segment.ids))] - start
+            if len(local):
+                parts.append(np.asarray(segment.vectors[local], dtype=np.float32))
+        return np.concatenate(parts)
+
+    def get_document_chunks(self, document_id: int, offset: int, limit: int) -> List[Document]:
+        """Chunks of one document ordered by chunk_index, one page at a time"""
+        with self._lock:
+            self._refresh()
+            rows = np.flatnonzero(
+                self._live
+                & (self._document_ids == document_id)
+                & (self._chunk_indexes >= offset)
+                & (self._chunk_indexes < offset + limit)
+            )
+            rows = rows[np.argsort(self._chunk_indexes[rows])]
+            return [Document(page_content=self._texts[i], metadata=self._metadatas[i]) for i in rows]
+
+    def delete_document(self, document_id: int) -> int:
+        """Tombstone one document's rows; returns how many were removed"""
+        with self._lock, self._writing():
+            rows = np.flatnonzero(self._live & (self._document_ids == document_id))
+            if not len(rows):
+                return 0
+            segments = self._segments
+            tombstones = self._tombstones | {self._ids[i] for i in rows}
+            # Rewrite once deleted rows outnumber live ones, so dead rows never dominate a search
+            if 2 * len(tombstones) > len(self._ids):
+                live_segments = [segment for segment in segments if not set(segment.ids) <= tombstones]
+                if live_segments:
+                    merged, tombstones = self._merge(live_segments, tombstones)
+                    segments = [merged]
+                else:
+                    segments, tombstones = [], set()
+            self._commit(segments, tombstones)
+            return len(rows)
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(self._live.sum())
+
+    def get(self, offset: int = 0, limit: Optional[int] = None, include_embeddings: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            end = None if limit is None else offset + limit
+            rows = np.flatnonzero(self._live)[offset:end]
+            result = {
+                "ids": [self._ids[i] for i in rows],
+                "documents": [self._texts[i] for i in rows],
+                "metadatas": [self._metadatas[i] for i in rows]
+            }
+            if include_embeddings:
+                vectors = self._vectors_at(self._segments, self._segment_starts, rows) if len(rows) else np.empty((0, 0))
+                result["embeddings"] = vectors.tolist()
+        return result
+
+    def approx_bytes(self) -> int:
+        # Vectors are memory-mapped, so only the table counts against process memory
+        return sum(len(text) for text in self._texts) + 256 * len(self._ids)
+
+    def destroy(self):
+        """Remove the index files, e.g. after promotion to an ANN collection"""
+        with self._lock, self._writing():
+            self._set_state([], set())
+            if os.path.exists(self._path(self.MANIFEST_FILE)):
+                os.remove(self._path(self.MANIFEST_FILE))
+            self._manifest_stat = None
+            self._remove_unlisted_segments()
@@ -0,0 +1,123 @@
+"""Extractive answers built from already-retrieved chunks.
+
+Used when no LLM answer is available. The chunks are split into sentences and
+every sentence is scored against the question at once: TF-IDF cosine over the
+sentences' own vocabulary, blended with embedding cosine when an embedding
+function is supplied. The best sentences are returned with their sources.
+"""
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+from app.chunking import split_sentences
+
+
+_WORD = re.compile(r"\w+")
+
+# Too common to say anything about relevance within a handful of chunks
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its of on or "
+    "that the their there these this to was were what when where which who why will with you your".split()
+)
+
+# Shorter fragments are usually headings or list markers
+MIN_SENTENCE_WORDS = 3
+
+EmbedTexts = Callable[[List[str]], List[List[float]]]
+
+
+def content_terms(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def tfidf_scores(question: str, sentences: List[str]) -> np.ndarray:
+    """Cosine between the question and each sentence in TF-IDF space"""
+    vocabulary: Dict[str, int] = {}
+    rows, columns = [], []
+    for row, sentence in enumerate(sentences):
+        for term in content_terms(sentence):
+            rows.append(row)
+            columns.append(vocabulary.setdefault(term, len(vocabulary)))
+    if not vocabulary:
+        return np.zeros(len(sentences))
+
+    counts = np.zeros((len(sentences), len(vocabulary)))
+    np.add.at(counts, (rows, columns), 1.0)
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(sentences)) / (1 + document_frequency)) + 1
+
+    # Sublinear term frequency so a repeated word does not dominate a sentence
+    weights = np.zeros_like(counts)
+    np.log(counts, out=weights, where=counts > 0)
+    weights = np.where(counts > 0, weights + 1, 0.0) * idf
+    weights /= np.maximum(np.linalg.norm(weights, axis=1, keepdims=True), 1e-12)
+
+    query = np.zeros(len(vocabulary))
+    for term in content_terms(question):
+        if term in vocabulary:
+            query[vocabulary[term]] = 1.0
+    query *= idf
+    norm = np.linalg.norm(query)
+    if norm == 0:
+        return np.zeros(len(sentences))
+    return weights @ (query / norm)
+
+
+def embedding_scores(question: str, sentences: List[str], embed_texts: EmbedTexts) -> np.ndarray:
+    """Cosine between the question and each sentence, embedded in one batch"""
+    vectors = np.asarray(embed_texts([question] + sentences), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors[1:] @ vectors[0]
+
+
+def rank_sentences(
+    question: str,
+    documents: List[Document],
+    embed_texts: Optional[EmbedTexts] = None,
+    embedding_weight: float = 0.7
+) -> List[Tuple[str, str, float]]:
+    """(sentence, source, score) for every distinct sentence, best first"""
+    sentences, sources, seen = [], [], set()
+    for document in documents:
+        source = document.metadata.get("source", "Unknown")
+        for sentence in split_sentences(document.page_content):
+            # Chunk overlap repeats sentences across neighbouring chunks
+            if sentence in seen or len(sentence.split()) < MIN_SENTENCE_WORDS:
+                continue
+            seen.add(sentence)
+            sentences.append(sentence)
+            sources.append(source)
+    if not sentences:
+        return []
+
+    scores = tfidf_scores(question, sentences)
+    if embed_texts is not None and embedding_weight > 0:
+        try:
+            scores = (
+                embedding_weight * embedding_scores(question, sentences, embed_texts)
+                + (1 - embedding_weight) * scores
+            )
+        except Exception as e:
+            print(f"⚠️  Sentence embedding failed, ranking by TF-IDF only: {e}")
+
+    order = np.argsort(-scores, kind="stable")
+    return [(sentences[i], sources[i], float(scores[i])) for i in order]
+
+
+def extractive_answer(
+    question: str,
+    documents: List[Document],
+    top_n: int = 3,
+    min_score: float = 0.1,
+    embed_texts: Optional[EmbedTexts] = None,
+    embedding_weight: float = 0.7
+) -> Optional[str]:
+    """The best-matching sentences labelled with their sources, or None if nothing matches"""
+    ranked = [
+        (sentence, source) for sentence, source, score in
+        rank_sentences(question, documents, embed_texts, embedding_weight)[:top_n]
+        if score >= min_score
+    ]
+    if not ranked:
+        return None
+    return "\n\n".join(f"{sentence} [{source}]" for sentence, source in ranked)
@@ -0,0 +1,140 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+from langchain.schema import Document
+from app.admission import AdmissionRejected, Priority, admission_controller
+from app.config import settings
+from app.deadline import Deadline
+from app.llm_service import llm_service
+from app.lru import LRUCache
+from app.metrics import registry
+
+
+DEGRADED_ANSWERS = registry.counter(
+    "qa_degraded_answers_total",
+    "Answers served from the extractive fallback instead of the LLM",
+    labelnames=("reason",)
+)
+
+# Generation keeps running after a request gives up on it, so it gets its own pool. Calls are
+# admitted before they are submitted, so every worker runs an admitted call and none sits in the queue
+_executor = ThreadPoolExecutor(max_workers=settings.llm_max_concurrent, thread_name_prefix="llm-generation")
+
+# (user_id, normalized question, scope, corpus version[, conversation history digest]) -> (answer, source_documents)
+answer_cache = LRUCache(maxsize=settings.answer_cache_size, ttl=settings.answer_cache_ttl)
+
+# Background generations still running, so a repeat question joins instead of starting over
+_pending: Dict[Hashable, Future] = {}
+_pending_lock = threading.Lock()
+
+
+def _store_result(cache_key: Hashable, source_documents: List[str], future: Future):
+    with _pending_lock:
+        _pending.pop(cache_key, None)
+    if future.cancelled() or future.exception() is not None:
+        return
+    answer, _ = future.result()
+    # Keyword fallback answers are cheap to recompute and should not mask a recovered API
+    if not llm_service.use_fallback:
+        answer_cache.set(cache_key, (answer, source_documents))
+
+
+def _admit(question: str, user_id: int, deadline: Deadline) -> Optional[float]:
+    """Take an LLM slot in the calling thread, waiting no longer than the answer deadline allows"""
+    if llm_service.use_fallback:
+        return None
+    priority = Priority.BULK if llm_service.is_summary_request(question) else Priority.INTERACTIVE
+    queue_deadline = time.monotonic() + settings.llm_queue_timeout
+    if deadline.expires_at is not None:
+        queue_deadline = min(queue_deadline, deadline.expires_at)
+    return admission_controller.acquire(user_id, priority, queue_deadline)
+
+
+def _generate(
+    question: str,
+    context_documents: List[Document],
+    user_id: int,
+    history: Sequence[Tuple[str, str]],
+    admitted_at: Optional[float]
+) -> Tuple[str, float]:
+    if admitted_at is None:
+        return llm_service.answer_question_with_timing(question, context_documents, user_id, True, history=history)
+    with admission_controller.holding(user_id, admitted_at):
+        return llm_service.answer_question_with_timing(question, context_documents, user_id, True, history=history)
+
+
+def _submit(
+    question: str,
+    context_documents: List[Document],
+    user_id: int,
+    deadline: Deadline,
+    cache_key: Hashable,
+    source_documents: List[str],
+    history: Sequence[Tuple[str, str]]
+) -> Future:
+    with _pending_lock:
+        future = _pending.get(cache_key)
+    if future is not None:
+        return future
+    
+    admitted_at = _admit(question, user_id, deadline)
+    with _pending_lock:
+        # Someone else may have started the same generation while this request waited for its slot
+        future = _pending.get(cache_key)
+        joined = future is not None
+        if not joined:
+            context = contextvars.copy_context()
+            future = _executor.submit(
+                context.run,
+                partial(_generate, question, context_documents, user_id, history, admitted_at)
+            )
+            _pending[cache_key] = future
+    if joined:
+        if admitted_at is not None:
+            admission_controller.release(user_id, admitted_at)
+        return future
+    future.add_done_callback(partial(_store_result, cache_key, source_documents))
+    return future
+
+
+def generate_answer(
+    question: str,
+    context_documents: List[Document],
+    user_id: int,
+    deadline: Deadline,
+    cache_key: Hashable,
+    source_documents: List[str],
+    history: Sequence[Tuple[str, str]] = ()
+) -> Tuple[str, float, bool]:
+    """Answer with the LLM within the deadline, else extractively; returns (answer, response_time, degraded)
+
+    `history` is the condensed earlier turns of a conversation and must be reflected in `cache_key`.
+    """
+    start_time = time.time()
+    if deadline.expired():
+        # Retrieval used up the budget; nobody would wait for a generation started now
+        DEGRADED_ANSWERS.inc(reason="deadline")
+        answer = llm_service.degraded_answer(question, context_documents)
+        return answer, time.time() - start_time, True
+    
+    try:
+        future = _submit(question, context_documents, user_id, deadline, cache_key, source_documents, history)
+        answer, response_time = future.result(timeout=deadline.remaining())
+        return answer, response_time, False
+    except FutureTimeoutError:
+        # The LLM keeps going in the background and fills the cache for the next asker
+        DEGRADED_ANSWERS.inc(reason="deadline")
+    except AdmissionRejected as e:
+        # No slot frees up before the answer is due; rate limits and full user queues still surface
+        if e.outcome != "rejected_deadline" or deadline.expires_at is None:
+            raise
+        DEGRADED_ANSWERS.inc(reason="deadline")
+    except Exception as e:
+        print(f"LLM generation failed, serving extractive answer: {e}")
+        DEGRADED_ANSWERS.inc(reason="error")
+    
+    answer = llm_service.degraded_answer(question, context_documents)
+    return answer, time.time() - start_time, True
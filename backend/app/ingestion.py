@@ -0,0 +1,302 @@
+import json
+import threading
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, Iterator, List
+import pyarrow as pa
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models import User, Document
+from app.schemas import ChunkingConfig, RechunkJobStatus, SnapshotImportResult, EmbeddingMigrationStatus
+from app.admission import TokenBucket
+from app.snapshot import SNAPSHOT_BATCH_SIZE, SnapshotError, SnapshotReader, write_snapshot
+from app.vector_store import vector_store_manager
+
+
+# Latest re-chunk job per user; only one may run per user at a time
+rechunk_jobs: Dict[int, RechunkJobStatus] = {}
+_jobs_lock = threading.Lock()
+
+# Progress of the latest embedding model migration in this process
+migration_job: Dict[str, Any] = {"status": "idle", "total": 0, "processed": 0, "error": None}
+
+
+def get_chunking_config(user: User) -> ChunkingConfig:
+    """The user's chunking settings, falling back to the server defaults"""
+    defaults = {"chunk_tokens": settings.chunk_tokens, "overlap_tokens": settings.chunk_overlap_tokens}
+    overrides = json.loads(user.chunking_config) if user.chunking_config else {}
+    return ChunkingConfig(**{**defaults, **overrides})
+
+
+def record_chunk_stats(document: Document, stats: dict):
+    document.chunk_count = stats["chunks"]
+    document.avg_chunk_tokens = stats["avg_tokens"]
+
+
+def get_rechunk_status(user_id: int) -> RechunkJobStatus:
+    return rechunk_jobs.get(user_id, RechunkJobStatus(status="idle"))
+
+
+def start_rechunk_job(user_id: int) -> bool:
+    """Mark a job as running; returns False when one is already in progress"""
+    with _jobs_lock:
+        if get_rechunk_status(user_id).status == "running":
+            return False
+        rechunk_jobs[user_id] = RechunkJobStatus(status="running")
+        return True
+
+
+def run_rechunk_job(user_id: int):
+    """Re-chunk and re-embed every document of a user under their current chunking settings"""
+    job = rechunk_jobs[user_id]
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        chunking = get_chunking_config(user).model_dump()
+        documents = db.query(Document).filter(Document.user_id == user_id).all()
+        job.total = len(documents)
+
+        # One document at a time keeps memory flat and lets progress be observed
+        for document in documents:
+            stats = vector_store_manager.rechunk_document(
+                {'id': document.id, 'filename': document.filename, 'content': document.content},
+                user_id,
+                chunking
+            )
+            record_chunk_stats(document, stats)
+            db.commit()
+            job.processed += 1
+
+        job.status = "completed"
+        print(f"✅ Re-chunked {job.processed} documents for user {user_id}")
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        print(f"❌ Re-chunk job failed for user {user_id}: {e}")
+    finally:
+        db.close()
+
+
+def get_migration_job_status() -> EmbeddingMigrationStatus:
+    return EmbeddingMigrationStatus(**vector_store_manager.get_migration_status(), **migration_job)
+
+
+def start_migration_job(model_name: str) -> bool:
+    """Register the target model and mark the job running; False if one is already running"""
+    with _jobs_lock:
+        if migration_job["status"] == "running":
+            return False
+        vector_store_manager.begin_migration(model_name)
+        migration_job.update(status="running", total=0, processed=0, error=None)
+        return True
+
+
+def run_migration_job():
+    """Re-embed every document into the target model's collections, then cut over.
+
+    Queries keep using the active model throughout. New uploads are written to
+    both versions meanwhile, and every write replaces the document's chunks, so
+    an interrupted job can simply be started again.
+    """
+    bucket = TokenBucket(rate=settings.embedding_migration_docs_per_second, capacity=1)
+    db = SessionLocal()
+    try:
+        migration_job["total"] = db.query(Document).count()
+        user_ids = []
+        for user in db.query(User).order_by(User.id).all():
+            user_ids.append(user.id)
+            chunking = get_chunking_config(user).model_dump()
+            documents = db.query(Document).filter(Document.user_id == user.id).order_by(Document.id)
+            for document in documents.yield_per(SNAPSHOT_BATCH_SIZE):
+                # Pace the job so re-embedding does not starve interactive traffic
+                wait = bucket.try_acquire(time.monotonic())
+                while wait:
+                    time.sleep(wait)
+                    wait = bucket.try_acquire(time.monotonic())
+                vector_store_manager.migrate_document(
+                    {'id': document.id, 'filename': document.filename, 'content': document.content},
+                    user.id,
+                    chunking
+                )
+                migration_job["processed"] += 1
+
+        vector_store_manager.complete_migration(user_ids)
+        migration_job["status"] = "completed"
+    except Exception as e:
+        migration_job.update(status="failed", error=str(e))
+        print(f"❌ Embedding migration failed: {e}")
+    finally:
+        db.close()
+
+
+def _user_document_batches(db: Session, user_id: int) -> Iterator[List[Dict[str, Any]]]:
+    query = db.query(Document).filter(Document.user_id == user_id).order_by(Document.id)
+    rows = []
+    for document in query.yield_per(SNAPSHOT_BATCH_SIZE):
+        rows.append({
+            "document_id": document.id,
+            "filename": document.filename,
+            "file_type": document.file_type,
+            "content": document.content,
+            "content_hash": document.content_hash,
+        })
+        if len(rows) == SNAPSHOT_BATCH_SIZE:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def _user_chunk_batches(user_id: int) -> Iterator[Dict[str, List[Any]]]:
+    offset = 0
+    while True:
+        page = vector_store_manager.get_user_chunks(
+            user_id, offset=offset, limit=SNAPSHOT_BATCH_SIZE, include_embeddings=True
+        )
+        if not page["ids"]:
+            return
+        yield {
+            "chunk_id": page["ids"],
+            "document_id": [metadata.get("document_id") for metadata in page["metadatas"]],
+            "chunk_index": [metadata.get("chunk_index") for metadata in page["metadatas"]],
+            "text": page["documents"],
+            "metadata": [json.dumps(metadata) for metadata in page["metadatas"]],
+            "embedding": page["embeddings"],
+        }
+        offset += len(page["ids"])
+
+
+def export_user_corpus(db: Session, user_id: int, target: BinaryIO):
+    """Write the user's documents and indexed chunks, vectors included, to `target`"""
+    write_snapshot(
+        target,
+        _user_document_batches(db, user_id),
+        _user_chunk_batches(user_id),
+        vector_store_manager.get_embedding_model()
+    )
+
+
+def _check_snapshot(reader: SnapshotReader) -> str:
+    """Refuse a snapshot this server cannot load before anything is written; returns the model"""
+    migration = vector_store_manager.get_migration_status()
+    if migration["target_model"]:
+        raise SnapshotError("An embedding model migration is in progress; import the snapshot after it completes")
+    model = migration["active_model"]
+    if reader.embedding_model != model:
+        raise SnapshotError(
+            f"Snapshot was embedded with {reader.embedding_model}, but this server uses {model}"
+        )
+    try:
+        next(reader.document_batches(batch_size=1), None)
+        first = next(reader.chunk_batches(batch_size=1), None)
+    except (pa.ArrowException, OSError) as e:
+        raise SnapshotError(f"Snapshot is corrupt: {e}")
+    if first and first["embedding"]:
+        _check_dimension(first["embedding"][0], vector_store_manager.get_embedding_dimension())
+    return model
+
+
+def _check_dimension(embedding: List[float], dimension: int):
+    if len(embedding) != dimension:
+        raise SnapshotError(f"Snapshot vectors have {len(embedding)} dimensions, but this server uses {dimension}")
+
+
+def _discard_import(db: Session, user_id: int, document_ids: List[int]):
+    """Remove the documents and chunks of an import that failed partway"""
+    db.rollback()
+    for document_id in document_ids:
+        try:
+            vector_store_manager.delete_document_chunks(document_id, user_id)
+        except Exception as e:
+            print(f"❌ Could not remove chunks of document {document_id} after a failed import: {e}")
+    for offset in range(0, len(document_ids), SNAPSHOT_BATCH_SIZE):
+        db.query(Document).filter(
+            Document.id.in_(document_ids[offset:offset + SNAPSHOT_BATCH_SIZE])
+        ).delete(synchronize_session=False)
+    db.commit()
+
+
+def import_user_corpus(db: Session, user_id: int, source: BinaryIO) -> SnapshotImportResult:
+    """Load a snapshot into the user's account without re-embedding anything.
+
+    Everything the import added is removed again if it fails partway, so a user
+    never keeps documents without vectors.
+    """
+    reader = SnapshotReader(source)
+    # Document ids are reassigned on import; files the user already has are skipped
+    id_map: Dict[int, int] = {}
+    try:
+        model = _check_snapshot(reader)
+        dimension = vector_store_manager.get_embedding_dimension()
+
+        skipped = 0
+        for rows in reader.document_batches():
+            hashes = [row["content_hash"] for row in rows if row["content_hash"]]
+            existing = {
+                content_hash for (content_hash,) in db.query(Document.content_hash).filter(
+                    Document.user_id == user_id, Document.content_hash.in_(hashes)
+                )
+            }
+            added = []
+            for row in rows:
+                if row["content_hash"] and row["content_hash"] in existing:
+                    skipped += 1
+                    continue
+                document = Document(
+                    user_id=user_id,
+                    filename=row["filename"],
+                    file_type=row["file_type"],
+                    content=row["content"],
+                    content_hash=row["content_hash"]
+                )
+                db.add(document)
+                added.append((row["document_id"], document))
+            # Flush to get the new ids, then let the rows go so memory stays flat
+            db.flush()
+            id_map.update((old_id, document.id) for old_id, document in added)
+            db.commit()
+            db.expunge_all()
+
+        chunk_stats: Dict[int, List[int]] = {}
+        chunks_imported = 0
+        for batch in reader.chunk_batches():
+            ids, embeddings, texts, metadatas = [], [], [], []
+            for old_document_id, text, metadata, embedding in zip(
+                batch["document_id"], batch["text"], batch["metadata"], batch["embedding"]
+            ):
+                document_id = id_map.get(old_document_id)
+                if document_id is None:
+                    continue
+                _check_dimension(embedding, dimension)
+                metadata = {**json.loads(metadata), "user_id": user_id, "document_id": document_id}
+                # Fresh ids so a snapshot can be loaded next to the corpus it came from
+                ids.append(str(uuid.uuid4()))
+                embeddings.append(embedding)
+                texts.append(text)
+                metadatas.append(metadata)
+                chunk_stats.setdefault(document_id, []).append(metadata.get("token_count", 0))
+            chunks_imported += vector_store_manager.import_chunks(user_id, ids, embeddings, texts, metadatas)
+
+        for document_id in id_map.values():
+            token_counts = chunk_stats.get(document_id, [])
+            db.query(Document).filter(Document.id == document_id).update({
+                Document.chunk_count: len(token_counts),
+                Document.avg_chunk_tokens: round(sum(token_counts) / len(token_counts), 1) if token_counts else 0.0
+            })
+        db.commit()
+
+        return SnapshotImportResult(
+            embedding_model=model,
+            documents_imported=len(id_map),
+            documents_skipped=skipped,
+            chunks_imported=chunks_imported
+        )
+    except Exception as e:
+        if id_map:
+            _discard_import(db, user_id, list(id_map.values()))
+        if isinstance(e, (pa.ArrowException, json.JSONDecodeError)):
+            raise SnapshotError(f"Snapshot is corrupt: {e}")
+        raise
+    finally:
+        reader.close()
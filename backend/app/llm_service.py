@@ -1,15 +1,20 @@
 from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.schema import Document
-from typing import List
+from typing import List, Optional, Sequence, Tuple
 import time
 import openai
 from app.config import settings
+from app.metrics import time_stage, count_for_request, LLM_CALLS
+from app.admission import admission_controller, AdmissionRejected, Priority
+from app.extractive import EmbedTexts, extractive_answer
 
 
 class LLMService:
     def __init__(self):
         self.use_fallback = False
+        # Set at startup so fallback answers can rank sentences with the retrieval model
+        self.embed_texts: Optional[EmbedTexts] = None
         
         if not settings.openai_api_key or settings.openai_api_key == "":
             self.use_fallback = True
@@ -20,6 +25,7 @@ class LLMService:
             # Configure OpenAI for v1 API
             openai.api_key = settings.openai_api_key
             openai.api_base = "https://api.openai.com/v1"  # v1 API endpoint
+            self.client = openai.OpenAI(api_key=settings.openai_api_key)
             
             # Test the API key
             self.llm = ChatOpenAI(
@@ -32,31 +38,70 @@ class LLMService:
             print(f"⚠️  Failed to initialize OpenAI: {e}. Using fallback mode.")
             self.use_fallback = True
     
+    def _create_chat_completion(self, stage: str, user_id: Optional[int], priority: Priority, **kwargs):
+        """Call the chat completion API once admitted, timing it as a request stage"""
+        with admission_controller.admit(user_id, priority):
+            with time_stage(stage):
+                try:
+                    response = self.client.chat.completions.create(**kwargs)
+                except openai.RateLimitError as e:
+                    # Stop admitting new calls until the provider is ready again
+                    admission_controller.backoff(self._retry_after_seconds(e))
+                    raise
+        if response.usage is not None:
+            count_for_request("prompt_tokens", response.usage.prompt_tokens)
+        return response
+    
+    @staticmethod
+    def _history_messages(history: Sequence[Tuple[str, str]]) -> List[dict]:
+        """Earlier conversation turns as chat messages, oldest first"""
+        messages = []
+        for previous_question, previous_answer in history:
+            messages.append({"role": "user", "content": previous_question})
+            if previous_answer:
+                messages.append({"role": "assistant", "content": previous_answer})
+        return messages
+    
+    @staticmethod
+    def _retry_after_seconds(error: openai.APIStatusError, default: float = 5.0) -> float:
+        try:
+            return float(error.response.headers.get("retry-after", default))
+        except (TypeError, ValueError):
+            return default
+    
     def _fallback_answer(self, question: str, context_documents: List[Document]) -> str:
-        """Simple fallback answer when OpenAI is not available"""
+        """Extractive fallback answer when OpenAI is not available"""
         if not context_documents:
             return "I don't have any documents to search through. Please upload some documents first."
         
-        # Simple keyword matching fallback
-        context = "\n\n".join([doc.page_content for doc in context_documents])
-        question_lower = question.lower()
-        
-        # Check if any document contains keywords from the question
-        relevant_parts = []
-        for doc in context_documents:
-            content_lower = doc.page_content.lower()
-            if any(word in content_lower for word in question_lower.split() if len(word) > 3):
-                relevant_parts.append(doc.page_content[:200] + "...")
-        
-        if relevant_parts:
-            return f"Based on the documents, here's what I found:\n\n" + "\n\n".join(relevant_parts[:3])
+        answer = extractive_answer(
+            question,
+            context_documents,
+            top_n=settings.fallback_answer_sentences,
+            min_score=settings.fallback_min_score,
+            embed_texts=self.embed_texts,
+            embedding_weight=settings.fallback_embedding_weight
+        )
+        if answer:
+            return f"Based on the documents, here's what I found:\n\n{answer}"
         else:
             return "I found some documents but couldn't find specific information to answer your question. Please try rephrasing your question or upload more relevant documents."
     
-    def answer_question(self, question: str, context_documents: List[Document]) -> str:
-        """Generate an answer based on the question and context documents"""
+    def answer_question(
+        self,
+        question: str,
+        context_documents: List[Document],
+        user_id: Optional[int] = None,
+        raise_errors: bool = False,
+        history: Sequence[Tuple[str, str]] = ()
+    ) -> str:
+        """Generate an answer based on the question and context documents.
+
+        `history` holds earlier (question, answer) turns of a conversation, sent as prior messages.
+        """
         
         if self.use_fallback:
+            LLM_CALLS.inc(kind="answer", outcome="fallback")
             return self._fallback_answer(question, context_documents)
         
         # Prepare context from documents
@@ -64,7 +109,10 @@ class LLMService:
         
         try:
             # Use OpenAI v1 API directly
-            response = openai.ChatCompletion.create(
+            response = self._create_chat_completion(
+                "llm_answer",
+                user_id,
+                Priority.INTERACTIVE,
                 model="gpt-3.5-turbo",
                 messages=[
                     {
@@ -77,6 +125,7 @@ class LLMService:
                         {context}
                         """
                     },
+                    *self._history_messages(history),
                     {
                         "role": "user",
                         "content": question
@@ -86,20 +135,32 @@ class LLMService:
                 temperature=0.7
             )
             
+            LLM_CALLS.inc(kind="answer", outcome="ok")
             return response.choices[0].message.content
             
+        except AdmissionRejected:
+            raise
         except Exception as e:
             print(f"OpenAI API error: {e}")
+            LLM_CALLS.inc(kind="answer", outcome="error")
+            if raise_errors:
+                raise
             # Fallback to keyword matching if API fails
             return self._fallback_answer(question, context_documents)
     
-    def summarize_documents(self, context_documents: List[Document]) -> str:
+    def summarize_documents(
+        self,
+        context_documents: List[Document],
+        user_id: Optional[int] = None,
+        raise_errors: bool = False
+    ) -> str:
         """Generate a summary of the provided documents"""
         
         if not context_documents:
             return "No documents to summarize. Please upload some documents first."
         
         if self.use_fallback:
+            LLM_CALLS.inc(kind="summary", outcome="fallback")
             return self._fallback_summarize(context_documents)
         
         # Prepare context from documents
@@ -107,7 +168,10 @@ class LLMService:
         
         try:
             # Use OpenAI v1 API directly for summarization
-            response = openai.ChatCompletion.create(
+            response = self._create_chat_completion(
+                "llm_summarize",
+                user_id,
+                Priority.BULK,
                 model="gpt-3.5-turbo",
                 messages=[
                     {
@@ -125,10 +189,16 @@ class LLMService:
                 temperature=0.3   # Lower temperature for more focused summaries
             )
             
+            LLM_CALLS.inc(kind="summary", outcome="ok")
             return response.choices[0].message.content
             
+        except AdmissionRejected:
+            raise
         except Exception as e:
             print(f"OpenAI API error during summarization: {e}")
+            LLM_CALLS.inc(kind="summary", outcome="error")
+            if raise_errors:
+                raise
             # Fallback to simple summary if API fails
             return self._fallback_summarize(context_documents)
     
@@ -146,16 +216,34 @@ class LLMService:
         
         return f"Summary of documents:\n\n{'. '.join(summary_sentences)}..."
     
-    def answer_question_with_timing(self, question: str, context_documents: List[Document]) -> tuple[str, float]:
+    @staticmethod
+    def is_summary_request(question: str) -> bool:
+        """Check if this is a summarization request"""
+        question_lower = question.lower().strip()
+        return any(word in question_lower for word in ['summarize', 'summary', 'summarise', 'summarization'])
+    
+    def degraded_answer(self, question: str, context_documents: List[Document]) -> str:
+        """Extractive answer from already-retrieved chunks, used when the LLM misses its deadline"""
+        with time_stage("degraded_answer"):
+            if self.is_summary_request(question):
+                return self._fallback_summarize(context_documents)
+            return self._fallback_answer(question, context_documents)
+    
+    def answer_question_with_timing(
+        self,
+        question: str,
+        context_documents: List[Document],
+        user_id: Optional[int] = None,
+        raise_errors: bool = False,
+        history: Sequence[Tuple[str, str]] = ()
+    ) -> tuple[str, float]:
         """Generate an answer with timing information"""
         start_time = time.time()
         
-        # Check if this is a summarization request
-        question_lower = question.lower().strip()
-        if any(word in question_lower for word in ['summarize', 'summary', 'summarise', 'summarization']):
-            answer = self.summarize_documents(context_documents)
+        if self.is_summary_request(question):
+            answer = self.summarize_documents(context_documents, user_id, raise_errors)
         else:
-            answer = self.answer_question(question, context_documents)
+            answer = self.answer_question(question, context_documents, user_id, raise_errors, history)
         
         end_time = time.time()
         response_time = end_time - start_time
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe bounded LRU cache with optional per-entry TTL and weight cap"""
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        max_weight: Optional[int] = None,
+        weigh: Optional[Callable[[Any], int]] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_weight = 0
+        # key -> (value, stored_at, weight)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+
+    def _remove(self, key: Hashable) -> tuple:
+        entry = self._data.pop(key)
+        self.total_weight -= entry[2]
+        return entry
+
+    def _notify_evicted(self, evicted: List[Tuple[Hashable, Any]]):
+        # Called outside the lock so eviction hooks may be slow or re-enter the cache
+        if self.on_evict is not None:
+            for key, value in evicted:
+                self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        expired = []
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                self._remove(key)
+                expired.append((key, entry[0]))
+                entry = _MISSING
+            if entry is _MISSING:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+        self._notify_evicted(expired)
+        return default if entry is _MISSING else entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        weight = self.weigh(value) if self.weigh is not None else 0
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic(), weight)
+            self.total_weight += weight
+            while len(self._data) > self.maxsize or (
+                self.max_weight is not None and self.total_weight > self.max_weight and len(self._data) > 1
+            ):
+                oldest_key = next(iter(self._data))
+                evicted.append((oldest_key, self._remove(oldest_key)[0]))
+                self.evictions += 1
+        self._notify_evicted(evicted)
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the cached value, creating it at most once even under concurrent callers"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another caller may have created it while we waited
+            with self._lock:
+                entry = self._data.get(key, _MISSING)
+                if entry is not _MISSING:
+                    self._data.move_to_end(key)
+                    return entry[0]
+            try:
+                value = factory()
+                self.set(key, value)
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            return self._remove(key)[0]
+
+    def clear(self):
+        with self._lock:
+            evicted = [(key, entry[0]) for key, entry in self._data.items()]
+            self._data.clear()
+            self.total_weight = 0
+        self._notify_evicted(evicted)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        stats = {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+        if self.max_weight is not None:
+            stats.update({"weight": self.total_weight, "max_weight": self.max_weight})
+        return stats
@@ -1,18 +1,38 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.database import engine
 from app.models import Base
-from app.routers import auth, documents, qa
+from app.routers import auth, documents, qa, admin
 from app.config import settings
+from app.metrics import registry, start_stage_collection, start_request_counts, HTTP_REQUEST_DURATION, HTTP_REQUESTS
+from app.profiling import wants_profile, profile_request
+from app.auth import get_email_from_token, is_admin_email
+from app.document_processor import UPLOAD_READ_CHUNK
+from app.warmup import start_query_embedding_warmup
+from app.llm_service import llm_service
+from app.vector_store import vector_store_manager
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fallback answers rank sentences with the same model that embeds the chunks
+    llm_service.embed_texts = vector_store_manager.embed_texts
+    start_query_embedding_warmup()
+    yield
+
+
 # Create FastAPI app
 app = FastAPI(
     title="AI Question Answering System",
     description="A simple AI-powered question-answering API service using LLM and vector database",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -24,10 +44,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time every request and collect its per-stage breakdown"""
+    start_stage_collection()
+    start_request_counts()
+    start_time = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Use the route template rather than the raw path to keep label cardinality bounded
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        elapsed = time.perf_counter() - start_time
+        HTTP_REQUEST_DURATION.observe(elapsed, method=request.method, path=path, status=status_code)
+        HTTP_REQUESTS.inc(method=request.method, path=path, status=status_code)
+
+
+async def profile_admin_requests(request: Request, call_next):
+    """Run the sampling profiler around a request when an admin asks for it"""
+    if not wants_profile(request):
+        return await call_next(request)
+    
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    email = get_email_from_token(token) if scheme.lower() == "bearer" else None
+    if not is_admin_email(email):
+        return await call_next(request)
+    
+    return await profile_request(request, call_next, user=email)
+
+
+# Only installed when enabled, so requests pay nothing for profiling otherwise
+if settings.profiling_enabled:
+    app.middleware("http")(profile_admin_requests)
+
+
+# Size limits of the endpoints that take a file, by (method, path)
+UPLOAD_LIMITS_MB = {
+    ("POST", "/documents/upload"): settings.max_upload_mb,
+    ("POST", "/documents/snapshot"): settings.max_snapshot_mb,
+}
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse uploads that declare an oversized body before any of it is parsed"""
+    max_mb = UPLOAD_LIMITS_MB.get((request.method, request.url.path))
+    if max_mb is not None:
+        content_length = request.headers.get("content-length", "")
+        # Leave headroom for the multipart boundaries and part headers
+        limit = max_mb * 1024 * 1024 + UPLOAD_READ_CHUNK
+        if content_length.isdigit() and int(content_length) > limit:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File size too large. Maximum size is {max_mb}MB."}
+            )
+    return await call_next(request)
+
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(documents.router)
 app.include_router(qa.router)
+app.include_router(admin.router)
 
 
 @app.get("/")
@@ -41,4 +125,10 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    return {"status": "healthy"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Expose latency histograms and counters in Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
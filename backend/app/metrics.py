@@ -0,0 +1,225 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# Buckets in seconds, tuned for request stages from sub-millisecond DB work up to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = "") -> str:
+    """Render a Prometheus label set like {stage="embed_query"}"""
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Increment the counter for the given label values"""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """Record a single observation for the given label values"""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram(
+    "qa_stage_duration_seconds",
+    "Time spent in each stage of request handling",
+    labelnames=("stage",)
+)
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    labelnames=("method", "path", "status")
+)
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total",
+    "Total HTTP requests handled",
+    labelnames=("method", "path", "status")
+)
+LLM_CALLS = registry.counter(
+    "llm_calls_total",
+    "LLM calls by kind and outcome",
+    labelnames=("kind", "outcome")
+)
+DOCUMENT_CHUNKS = registry.counter(
+    "vector_chunks_added_total",
+    "Document chunks added to the vector store"
+)
+QUERY_EMBEDDING_CACHE = registry.counter(
+    "query_embedding_cache_total",
+    "Query embedding cache lookups by outcome",
+    labelnames=("outcome",)
+)
+
+
+# Per-request stage breakdown, shared by everything running in the request's context
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+def start_stage_collection() -> Dict[str, float]:
+    """Start collecting stage timings for the current request context"""
+    timings: Dict[str, float] = {}
+    _stage_timings.set(timings)
+    return timings
+
+
+def current_stage_timings() -> Dict[str, float]:
+    """Return the stage timings collected so far for the current request"""
+    timings = _stage_timings.get()
+    return dict(timings) if timings is not None else {}
+
+
+@contextmanager
+def time_stage(stage: str):
+    """Time a block, export it as a histogram sample and add it to the request breakdown"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed, 6)
+
+
+# Per-request counts (prompt tokens, cache hits) that end up on the request's QueryLog
+_request_counts: ContextVar[Optional[Dict[str, int]]] = ContextVar("request_counts", default=None)
+
+
+def start_request_counts() -> Dict[str, int]:
+    """Start counting for the current context; work submitted from it adds to the same counts"""
+    counts: Dict[str, int] = {}
+    _request_counts.set(counts)
+    return counts
+
+
+def count_for_request(name: str, amount: int = 1):
+    counts = _request_counts.get()
+    if counts is not None:
+        counts[name] = counts.get(name, 0) + amount
+
+
+def current_request_counts() -> Dict[str, int]:
+    counts = _request_counts.get()
+    return dict(counts) if counts is not None else {}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, ForeignKey, Boolean, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -11,6 +11,7 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    chunking_config = Column(Text)  # JSON string of per-tenant chunking overrides
     
     # Relationships
     query_logs = relationship("QueryLog", back_populates="user")
@@ -27,6 +28,10 @@ class QueryLog(Base):
     response = Column(Text, nullable=False)
     response_time = Column(Float, nullable=False)  # in seconds
     source_documents = Column(Text)  # JSON string of source document IDs
+    stage_timings = Column(Text)  # JSON string of per-stage latencies in seconds
+    degraded = Column(Boolean, default=False)  # extractive answer served instead of the LLM
+    cache_hit = Column(Boolean, default=False)  # answer came from the answer cache
+    prompt_tokens = Column(Integer)  # LLM prompt tokens spent on this question, if known
     
     # Relationships
     user = relationship("User", back_populates="query_logs")
@@ -40,7 +45,29 @@ class Document(Base):
     filename = Column(String, nullable=False)
     file_type = Column(String, nullable=False)
     content = Column(Text, nullable=False)
+    content_hash = Column(String, index=True)  # SHA-256 of the uploaded bytes
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
+    chunk_count = Column(Integer)  # chunks produced at the last (re)indexing
+    avg_chunk_tokens = Column(Float)
     
     # Relationships
-    user = relationship("User", back_populates="documents") 
\ No newline at end of file
+    user = relationship("User", back_populates="documents")
+
+
+class QueryRollup(Base):
+    """Query counts and latency for one user (0 = all users) over one hour or day"""
+    __tablename__ = "query_rollups"
+    __table_args__ = (UniqueConstraint("user_id", "period", "bucket_start"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    period = Column(String, nullable=False)  # "hour" or "day"
+    bucket_start = Column(DateTime(timezone=True), nullable=False, index=True)
+    count = Column(Integer, nullable=False, default=0)
+    cache_hits = Column(Integer, nullable=False, default=0)
+    fallbacks = Column(Integer, nullable=False, default=0)  # degraded (extractive) answers
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    latency_histogram = Column(Text)  # JSON of log-spaced latency bucket -> count
+    latency_p50 = Column(Float)
+    latency_p95 = Column(Float)
+    latency_p99 = Column(Float)
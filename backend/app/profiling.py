@@ -0,0 +1,192 @@
+import heapq
+import itertools
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+
+
+# Endpoints that can be profiled on request
+PROFILED_PATHS = ("/qa/ask", "/documents/upload")
+
+_active_profiler: ContextVar[Optional["SamplingProfiler"]] = ContextVar("active_profiler", default=None)
+
+
+class SamplingProfiler:
+    """Periodically samples the stacks of the threads serving one request"""
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks: StackCounter = StackCounter()
+        self._thread_ids = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def track_thread(self, thread_id: int):
+        with self._lock:
+            self._thread_ids.add(thread_id)
+
+    def untrack_thread(self, thread_id: int):
+        with self._lock:
+            self._thread_ids.discard(thread_id)
+
+    def start(self):
+        self.track_thread(threading.get_ident())
+        self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                thread_ids = list(self._thread_ids)
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._stacks[self._extract_stack(frame)] += 1
+                    self.samples += 1
+
+    def _extract_stack(self, frame) -> Tuple[str, ...]:
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def collapsed(self) -> str:
+        """Render stacks in the collapsed format understood by flamegraph tools"""
+        return "\n".join(
+            f"{';'.join(stack)} {count}" for stack, count in self._stacks.most_common()
+        )
+
+    def call_tree(self) -> Dict[str, Any]:
+        """Merge the sampled stacks into a call tree with sample counts"""
+        root = {"name": "<root>", "samples": 0, "children": {}}
+        for stack, count in self._stacks.items():
+            node = root
+            node["samples"] += count
+            for name in stack:
+                child = node["children"].setdefault(name, {"name": name, "samples": 0, "children": {}})
+                child["samples"] += count
+                node = child
+        return _finalize_tree(root, self.interval)
+
+
+def _finalize_tree(node: Dict[str, Any], interval: float) -> Dict[str, Any]:
+    children = sorted(node["children"].values(), key=lambda child: child["samples"], reverse=True)
+    return {
+        "name": node["name"],
+        "samples": node["samples"],
+        "approx_seconds": round(node["samples"] * interval, 4),
+        "children": [_finalize_tree(child, interval) for child in children]
+    }
+
+
+@contextmanager
+def track_current_thread():
+    """Include the calling worker thread in the active request profile, if any"""
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    profiler.track_thread(thread_id)
+    try:
+        yield
+    finally:
+        profiler.untrack_thread(thread_id)
+
+
+class ProfileStore:
+    """Keeps the slowest N request profiles for later download"""
+
+    def __init__(self, max_profiles: int):
+        self.max_profiles = max_profiles
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, profile: Dict[str, Any]):
+        entry = (profile["duration"], next(self._counter), profile)
+        with self._lock:
+            if len(self._heap) < self.max_profiles:
+                heapq.heappush(self._heap, entry)
+            elif profile["duration"] > self._heap[0][0]:
+                evicted = heapq.heapreplace(self._heap, entry)
+                self._by_id.pop(evicted[2]["request_id"], None)
+            else:
+                return
+            self._by_id[profile["request_id"]] = profile
+
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._by_id.get(request_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Summaries of stored profiles, slowest first"""
+        with self._lock:
+            profiles = [entry[2] for entry in self._heap]
+        profiles.sort(key=lambda profile: profile["duration"], reverse=True)
+        return [
+            {key: profile[key] for key in ("request_id", "path", "user", "status", "duration", "samples", "timestamp")}
+            for profile in profiles
+        ]
+
+
+def wants_profile(request) -> bool:
+    """Check whether the caller asked for this request to be profiled"""
+    if request.url.path not in PROFILED_PATHS:
+        return False
+    flag = request.headers.get("x-profile") or request.query_params.get("profile")
+    return flag is not None and flag.lower() in ("1", "true", "yes")
+
+
+async def profile_request(request, call_next, user: str):
+    """Run a single request under the sampling profiler and store the result"""
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    profiler = SamplingProfiler(interval=settings.profiling_sample_interval)
+    token = _active_profiler.set(profiler)
+    start_time = time.perf_counter()
+    profiler.start()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        profiler.stop()
+        _active_profiler.reset(token)
+        profile_store.add({
+            "request_id": request_id,
+            "path": request.url.path,
+            "user": user,
+            "status": status_code,
+            "duration": round(time.perf_counter() - start_time, 6),
+            "samples": profiler.samples,
+            "timestamp": time.time(),
+            "call_tree": profiler.call_tree(),
+            "collapsed": profiler.collapsed()
+        })
+
+    response.headers["X-Request-ID"] = request_id
+    response.headers["X-Profile-Id"] = request_id
+    return response
+
+
+# Global instance
+profile_store = ProfileStore(settings.profiling_max_stored)
@@ -0,0 +1,58 @@
+from typing import List, Sequence, Tuple
+from langchain.schema import Document
+from app.config import settings
+from app.metrics import registry
+
+
+LOW_SCORE_SKIPS = registry.counter(
+    "qa_low_score_skips_total",
+    "Questions answered as not found without an LLM call because no chunk scored high enough"
+)
+
+ScoredDocument = Tuple[Document, float]
+
+
+def adaptive_k(
+    scores: Sequence[float],
+    mode: str = "gap",
+    min_k: int = 1,
+    relative_gap: float = 0.15,
+    min_similarity: float = 0.3
+) -> int:
+    """How many of the best-first `scores` to keep.
+
+    "gap" cuts at the first drop between neighbours larger than `relative_gap`
+    times the best score; "threshold" keeps scores of at least `min_similarity`;
+    "fixed" keeps everything. At least `min_k` results are always kept.
+    """
+    if not scores:
+        return 0
+    keep = len(scores)
+    if mode == "gap":
+        for i in range(1, len(scores)):
+            if scores[i - 1] - scores[i] > relative_gap * abs(scores[0]):
+                keep = i
+                break
+    elif mode == "threshold":
+        keep = sum(1 for score in scores if score >= min_similarity)
+    return max(keep, min(min_k, len(scores)))
+
+
+def trim_results(results: List[ScoredDocument]) -> List[ScoredDocument]:
+    """Cut best-first search results to the configured adaptive k"""
+    keep = adaptive_k(
+        [score for _, score in results],
+        mode=settings.retrieval_k_mode,
+        min_k=settings.retrieval_min_k,
+        relative_gap=settings.retrieval_relative_gap,
+        min_similarity=settings.retrieval_min_similarity
+    )
+    return results[:keep]
+
+
+def is_answerable(results: List[ScoredDocument]) -> bool:
+    """Whether the best chunk is relevant enough to be worth an LLM call"""
+    if results and results[0][1] >= settings.retrieval_answer_cutoff:
+        return True
+    LOW_SCORE_SKIPS.inc()
+    return False
@@ -0,0 +1,140 @@
+"""Pre-aggregated query statistics.
+
+Every QueryLog write also folds into rollup rows per user and per hour and
+day, plus the same rows for all users (user_id 0). Latency is kept as a
+sparse histogram over log-spaced buckets, so a row is updated by adding counts
+and its percentiles come out within about 5% without reading raw logs.
+"""
+import json
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models import QueryLog, QueryRollup
+from app.schemas import QueryRollupResponse
+
+
+ALL_USERS = 0
+PERIODS = ("hour", "day")
+
+# Bucket 0 holds latencies under LATENCY_BASE; bucket i >= 1 spans LATENCY_BASE * LATENCY_GROWTH ** (i-1) upwards
+LATENCY_BASE = 0.001
+LATENCY_GROWTH = 1.1
+
+
+def latency_bucket(seconds: float) -> int:
+    if seconds < LATENCY_BASE:
+        return 0
+    return int(math.log(seconds / LATENCY_BASE, LATENCY_GROWTH)) + 1
+
+
+def bucket_latency(index: int) -> float:
+    """Representative latency of a bucket: the geometric middle of its range"""
+    if index == 0:
+        return 0.0
+    return LATENCY_BASE * LATENCY_GROWTH ** (index - 0.5)
+
+
+def histogram_percentile(histogram: Dict[int, int], q: float) -> Optional[float]:
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for index in sorted(histogram):
+        seen += histogram[index]
+        if seen >= rank:
+            return round(bucket_latency(index), 4)
+    return round(bucket_latency(max(histogram)), 4)
+
+
+def period_start(moment: datetime, period: str) -> datetime:
+    moment = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if period == "day" else moment
+
+
+def _load_histogram(rollup: QueryRollup) -> Dict[int, int]:
+    return {int(index): count for index, count in json.loads(rollup.latency_histogram or "{}").items()}
+
+
+def _get_or_create(db: Session, user_id: int, period: str, bucket_start: datetime) -> QueryRollup:
+    def lookup():
+        return db.query(QueryRollup).filter(
+            QueryRollup.user_id == user_id,
+            QueryRollup.period == period,
+            QueryRollup.bucket_start == bucket_start
+        ).with_for_update().first()
+
+    rollup = lookup()
+    if rollup is not None:
+        return rollup
+    try:
+        # Another worker may create the same bucket at the same moment; the unique constraint decides
+        with db.begin_nested():
+            rollup = QueryRollup(
+                user_id=user_id, period=period, bucket_start=bucket_start,
+                count=0, cache_hits=0, fallbacks=0, prompt_tokens=0
+            )
+            db.add(rollup)
+        return rollup
+    except IntegrityError:
+        return lookup()
+
+
+def update_rollups(db: Session, query_logs: List[QueryLog], now: Optional[datetime] = None):
+    """Fold freshly added query logs into their rollup rows, in the caller's transaction"""
+    now = now or datetime.now(timezone.utc)
+    grouped: Dict[tuple, List[QueryLog]] = defaultdict(list)
+    for query_log in query_logs:
+        for period in PERIODS:
+            bucket_start = period_start(now, period)
+            grouped[(query_log.user_id, period, bucket_start)].append(query_log)
+            grouped[(ALL_USERS, period, bucket_start)].append(query_log)
+
+    # A fixed order keeps concurrent writers from locking rows in opposite orders
+    for (user_id, period, bucket_start), logs in sorted(grouped.items(), key=lambda item: item[0]):
+        rollup = _get_or_create(db, user_id, period, bucket_start)
+        histogram = _load_histogram(rollup)
+        for query_log in logs:
+            bucket = latency_bucket(query_log.response_time or 0.0)
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        rollup.count += len(logs)
+        rollup.cache_hits += sum(1 for query_log in logs if query_log.cache_hit)
+        rollup.fallbacks += sum(1 for query_log in logs if query_log.degraded)
+        rollup.prompt_tokens += sum(query_log.prompt_tokens or 0 for query_log in logs)
+        rollup.latency_histogram = json.dumps(histogram)
+        rollup.latency_p50 = histogram_percentile(histogram, 0.5)
+        rollup.latency_p95 = histogram_percentile(histogram, 0.95)
+        rollup.latency_p99 = histogram_percentile(histogram, 0.99)
+
+
+def get_rollups(
+    db: Session,
+    period: str,
+    user_id: int = ALL_USERS,
+    since: Optional[datetime] = None,
+    limit: int = 168
+) -> List[QueryRollupResponse]:
+    """Most recent rollups first; by default the last week of hours or half a year of days"""
+    query = db.query(QueryRollup).filter(QueryRollup.period == period, QueryRollup.user_id == user_id)
+    if since is not None:
+        query = query.filter(QueryRollup.bucket_start >= since)
+    rollups = query.order_by(QueryRollup.bucket_start.desc()).limit(limit).all()
+    return [
+        QueryRollupResponse(
+            user_id=rollup.user_id,
+            period=rollup.period,
+            bucket_start=rollup.bucket_start,
+            count=rollup.count,
+            cache_hits=rollup.cache_hits,
+            cache_hit_rate=round(rollup.cache_hits / rollup.count, 4) if rollup.count else 0.0,
+            fallback_rate=round(rollup.fallbacks / rollup.count, 4) if rollup.count else 0.0,
+            prompt_tokens=rollup.prompt_tokens,
+            latency_p50=rollup.latency_p50,
+            latency_p95=rollup.latency_p95,
+            latency_p99=rollup.latency_p99
+        )
+        for rollup in rollups
+    ]
@@ -0,0 +1,116 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import List, Optional
+from app.database import get_db
+from app.models import User
+from app.schemas import EmbeddingMigrationRequest, EmbeddingMigrationStatus, QueryRollupResponse
+from app.auth import get_current_admin_user
+from app.profiling import profile_store
+from app.ingestion import get_migration_job_status, start_migration_job, run_migration_job
+from app.sharding import ShardedVectorStore
+from app.rollups import ALL_USERS, PERIODS, get_rollups
+from app.vector_store import vector_store_manager
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/profiles")
+async def list_profiles(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """List stored request profiles, slowest first"""
+    return profile_store.list()
+
+
+@router.get("/profiles/{request_id}")
+async def get_profile(
+    request_id: str,
+    format: str = "json",
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Download a request profile as a call tree (json) or collapsed stacks (collapsed)"""
+    profile = profile_store.get(request_id)
+
+    if not profile:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+
+    if format == "collapsed":
+        return PlainTextResponse(
+            profile["collapsed"],
+            headers={"Content-Disposition": f'attachment; filename="profile_{request_id}.txt"'}
+        )
+
+    return profile
+
+
+@router.post(
+    "/embedding-migration",
+    response_model=EmbeddingMigrationStatus,
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def start_embedding_migration(
+    migration: EmbeddingMigrationRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Re-embed all documents with a new model in the background, then switch queries over"""
+    try:
+        # Loading the new model takes a while; keep it off the event loop
+        started = await run_in_threadpool(start_migration_job, migration.model)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    if not started:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="An embedding migration is already running"
+        )
+    background_tasks.add_task(run_migration_job)
+    return get_migration_job_status()
+
+
+@router.get("/embedding-migration", response_model=EmbeddingMigrationStatus)
+async def embedding_migration_status(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Active and target embedding models and the progress of the migration job"""
+    return get_migration_job_status()
+
+
+@router.get("/shards")
+async def shard_stats(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Per-shard disk size, open collections and recent vector store latency"""
+    if not isinstance(vector_store_manager.get(), ShardedVectorStore):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Vector store sharding is not enabled"
+        )
+    return await run_in_threadpool(vector_store_manager.shard_stats)
+
+
+@router.get("/rollups", response_model=List[QueryRollupResponse])
+async def query_rollups(
+    period: str = "hour",
+    user_id: int = ALL_USERS,
+    since: Optional[datetime] = None,
+    limit: int = Query(168, ge=1, le=5000),
+    current_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Per-hour or per-day query counts, latency percentiles, cache hits, fallbacks and prompt tokens"""
+    if period not in PERIODS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"period must be one of: {', '.join(PERIODS)}"
+        )
+    return get_rollups(db, period, user_id, since, limit)
@@ -1,13 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
+from starlette.background import BackgroundTask
 from typing import List
 import json
+import os
+import tempfile
 from app.database import get_db
 from app.models import User, Document
-from app.schemas import DocumentResponse
+from app.schemas import (
+    DocumentResponse, DocumentChunk, DocumentChunksResponse, ChunkingConfig, RechunkJobStatus, IngestionStats,
+    SnapshotImportResult
+)
 from app.auth import get_current_active_user
-from app.document_processor import DocumentProcessor
+from app.document_processor import DocumentProcessor, UploadTooLarge
+from app.config import settings
 from app.vector_store import vector_store_manager
+from app.metrics import time_stage
+from app.ingestion import (
+    get_chunking_config, record_chunk_stats, get_rechunk_status, start_rechunk_job, run_rechunk_job,
+    export_user_corpus, import_user_corpus
+)
+from app.snapshot import SnapshotError
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
@@ -20,19 +35,33 @@ async def upload_document(
 ):
     """Upload a document for processing"""
     
-    # Read file content
-    file_content = await file.read()
-    
-    # Validate file size (10MB limit)
-    if not DocumentProcessor.validate_file_size(file_content, max_size_mb=10):
+    # Stream the upload instead of reading it into memory in one go
+    try:
+        with time_stage("upload_read"):
+            upload = await DocumentProcessor.spool_upload(file, max_size_mb=settings.max_upload_mb)
+    except UploadTooLarge as e:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File size too large. Maximum size is 10MB."
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
         )
     
+    # An identical file was already uploaded: skip extraction and embedding entirely
+    existing = db.query(Document).filter(
+        Document.user_id == current_user.id,
+        Document.content_hash == upload.content_hash
+    ).first()
+    if existing and existing.chunk_count:
+        return DocumentResponse.model_validate(existing).model_copy(update={"duplicate": True})
+    if existing:
+        # Its indexing failed last time; the text is already saved, so only embed it again
+        await _index_document(existing, current_user, db, replace=True)
+        return DocumentResponse.model_validate(existing).model_copy(update={"duplicate": True})
+    
     try:
         # Extract text from file
-        text_content, file_type = DocumentProcessor.extract_text_from_file(file_content, file.filename)
+        text_content, file_type = await run_in_threadpool(
+            DocumentProcessor.extract_text_from_stream, upload.file, upload.head, file.filename
+        )
         
         # Validate content
         if not DocumentProcessor.validate_file_content(text_content):
@@ -46,30 +75,16 @@ async def upload_document(
             user_id=current_user.id,
             filename=file.filename,
             file_type=file_type,
-            content=text_content
+            content=text_content,
+            content_hash=upload.content_hash
         )
-        db.add(db_document)
-        db.commit()
-        db.refresh(db_document)
+        with time_stage("db_document_commit"):
+            db.add(db_document)
+            db.commit()
+            db.refresh(db_document)
         
         # Add to vector store
-        document_data = {
-            'id': db_document.id,
-            'filename': db_document.filename,
-            'content': db_document.content
-        }
-        
-        try:
-            vector_ids = vector_store_manager.add_documents([document_data], current_user.id)
-            print(f"✅ Document added to vector store with IDs: {vector_ids}")
-            
-            # Force persistence to ensure data is saved
-            vector_store_manager.vectorstore.persist()
-            
-        except Exception as e:
-            print(f"❌ Error adding document to vector store: {e}")
-            # Continue anyway as the document is saved in the database
-        
+        await _index_document(db_document, current_user, db)
         return db_document
         
     except ValueError as e:
@@ -84,6 +99,35 @@ async def upload_document(
         )
 
 
+async def _index_document(db_document: Document, user: User, db: Session, replace: bool = False):
+    """Chunk and embed a saved document off the event loop, recording its chunk stats.
+
+    A failure is logged and leaves chunk_count unset, so uploading the same file again retries it.
+    `replace` drops any chunks left behind by an earlier failed attempt first.
+    """
+    document_data = {
+        'id': db_document.id,
+        'filename': db_document.filename,
+        'content': db_document.content
+    }
+    chunking = get_chunking_config(user).model_dump()
+    
+    try:
+        if replace:
+            stats = await run_in_threadpool(vector_store_manager.rechunk_document, document_data, user.id, chunking)
+        else:
+            result = await run_in_threadpool(vector_store_manager.index_documents, [document_data], user.id, chunking)
+            stats = result["documents"][db_document.id]
+            print(f"✅ Document added to vector store with IDs: {result['ids']}")
+        record_chunk_stats(db_document, stats)
+        db.commit()
+        db.refresh(db_document)
+        
+    except Exception as e:
+        print(f"❌ Error adding document to vector store: {e}")
+        # Continue anyway as the document is saved in the database
+
+
 @router.get("/", response_model=List[DocumentResponse])
 async def list_documents(
     current_user: User = Depends(get_current_active_user),
@@ -94,6 +138,150 @@ async def list_documents(
     return documents
 
 
+@router.get("/chunking", response_model=ChunkingConfig)
+async def get_chunking(current_user: User = Depends(get_current_active_user)):
+    """Chunking settings applied to this user's uploads"""
+    return get_chunking_config(current_user)
+
+
+@router.put("/chunking", response_model=ChunkingConfig)
+async def update_chunking(
+    chunking: ChunkingConfig,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Change chunking settings; existing documents keep their chunks until /documents/rechunk runs"""
+    current_user.chunking_config = json.dumps(chunking.model_dump())
+    db.commit()
+    return chunking
+
+
+@router.post("/rechunk", response_model=RechunkJobStatus, status_code=status.HTTP_202_ACCEPTED)
+async def rechunk_documents(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Re-chunk and re-embed all of the user's documents in the background"""
+    if not start_rechunk_job(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A re-chunk job is already running"
+        )
+    background_tasks.add_task(run_rechunk_job, current_user.id)
+    return get_rechunk_status(current_user.id)
+
+
+@router.get("/rechunk", response_model=RechunkJobStatus)
+async def rechunk_status(current_user: User = Depends(get_current_active_user)):
+    """Progress of the user's latest re-chunk job"""
+    return get_rechunk_status(current_user.id)
+
+
+@router.get("/stats", response_model=IngestionStats)
+async def ingestion_stats(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Chunks per document and average chunk size in tokens"""
+    documents = db.query(Document).filter(Document.user_id == current_user.id).all()
+    indexed = [document for document in documents if document.chunk_count]
+    total_chunks = sum(document.chunk_count for document in indexed)
+    total_tokens = sum(document.chunk_count * (document.avg_chunk_tokens or 0) for document in indexed)
+    
+    return IngestionStats(
+        total_documents=len(documents),
+        total_chunks=total_chunks,
+        avg_chunks_per_document=round(total_chunks / len(indexed), 2) if indexed else 0.0,
+        avg_chunk_tokens=round(total_tokens / total_chunks, 1) if total_chunks else 0.0,
+        documents=documents
+    )
+
+
+@router.get("/snapshot")
+async def export_snapshot(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Download the user's corpus, embedding vectors included, as a Parquet snapshot"""
+    fd, path = tempfile.mkstemp(suffix=".zip")
+    try:
+        with os.fdopen(fd, "wb") as target:
+            await run_in_threadpool(export_user_corpus, db, current_user.id, target)
+    except Exception:
+        os.remove(path)
+        raise
+    
+    # Streamed from disk and removed once sent
+    return FileResponse(
+        path,
+        media_type="application/zip",
+        filename=f"corpus_user_{current_user.id}.zip",
+        background=BackgroundTask(os.remove, path)
+    )
+
+
+@router.post("/snapshot", response_model=SnapshotImportResult)
+async def import_snapshot(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Load a snapshot into the user's account, reusing its stored vectors"""
+    try:
+        with time_stage("upload_read"):
+            upload = await DocumentProcessor.spool_upload(file, max_size_mb=settings.max_snapshot_mb)
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    
+    try:
+        return await run_in_threadpool(import_user_corpus, db, current_user.id, upload.file)
+    except SnapshotError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+@router.get("/{document_id}/chunks", response_model=DocumentChunksResponse)
+async def get_document_chunks(
+    document_id: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Page through a document's indexed chunks in order"""
+    document = db.query(Document).filter(
+        Document.id == document_id,
+        Document.user_id == current_user.id
+    ).first()
+    
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    chunks = vector_store_manager.get_document_chunks(document_id, current_user.id, offset=offset, limit=limit)
+    
+    return DocumentChunksResponse(
+        document_id=document_id,
+        offset=offset,
+        limit=limit,
+        chunks=[
+            DocumentChunk(
+                chunk_index=chunk.metadata.get('chunk_index', 0),
+                content=chunk.page_content,
+                source=chunk.metadata.get('source', 'Unknown')
+            )
+            for chunk in chunks
+        ]
+    )
+
+
 @router.delete("/{document_id}")
 async def delete_document(
     document_id: int,
@@ -112,6 +300,11 @@ async def delete_document(
             detail="Document not found"
         )
     
+    try:
+        vector_store_manager.delete_document_chunks(document_id, current_user.id)
+    except Exception as e:
+        print(f"❌ Error removing document chunks from vector store: {e}")
+    
     db.delete(document)
     db.commit()
     
@@ -1,17 +1,239 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Union
+from contextlib import nullcontext
+import contextvars
+import fnmatch
 import json
+import time
 from app.database import get_db
-from app.models import User, QueryLog
-from app.schemas import QuestionRequest, QuestionResponse, QueryLogResponse
+from app.models import User, QueryLog, Document
+from app.schemas import (
+    QuestionRequest, QuestionResponse, QueryLogResponse,
+    BatchQuestionRequest, BatchQuestionResult, BatchQuestionResponse
+)
 from app.auth import get_current_active_user
 from app.vector_store import vector_store_manager
-from app.llm_service import llm_service
 from app.config import settings
+from app.metrics import (
+    time_stage, current_stage_timings, start_stage_collection, count_for_request, current_request_counts, start_request_counts
+)
+from app.coalescing import question_flight, normalize_question
+from app.profiling import track_current_thread
+from app.admission import AdmissionRejected
+from app.deadline import Deadline, DeadlineExceeded, bind_deadline
+from app.generation import generate_answer, answer_cache
+from app.retrieval import ScoredDocument, is_answerable
+from app.rollups import update_rollups
+from app.conversations import (
+    ConversationSession, can_reuse_results, condense_history, get_session, history_digest, retrieval_query, touch_session
+)
 
 router = APIRouter(prefix="/qa", tags=["question-answering"])
 
+NO_DOCUMENTS_MESSAGE = "I don't have any documents to search through. Please upload some documents first."
+EMPTY_SCOPE_MESSAGE = "None of your documents match the requested documents or filename pattern."
+NOT_FOUND_MESSAGE = "I found your documents but couldn't find specific information to answer your question. Please try rephrasing your question or ask about a different topic."
+
+
+def _resolve_document_scope(
+    db: Session,
+    user_id: int,
+    question_request: Union[QuestionRequest, BatchQuestionRequest]
+) -> Optional[Tuple[int, ...]]:
+    """Turn the requested document ids / filename pattern into the ids to search, None meaning all"""
+    if question_request.document_ids is None and question_request.filename_pattern is None:
+        return None
+    
+    query = db.query(Document.id, Document.filename).filter(Document.user_id == user_id)
+    if question_request.document_ids is not None:
+        query = query.filter(Document.id.in_(question_request.document_ids))
+    
+    document_ids = [
+        document_id for document_id, filename in query.all()
+        if question_request.filename_pattern is None
+        or fnmatch.fnmatch(filename.lower(), question_request.filename_pattern.lower())
+    ]
+    return tuple(sorted(document_ids))
+
+
+def _answer_question(
+    question: str,
+    user_id: int,
+    deadline: Deadline,
+    document_ids: Optional[Tuple[int, ...]] = None,
+    session: Optional[ConversationSession] = None
+):
+    """Retrieve context and generate an answer; runs in a worker thread.
+
+    Within a conversation, retrieval uses a standalone query condensed from the
+    earlier turns, which also reach the LLM as prior messages; the question
+    itself is answered as asked. An on-topic follow-up reuses the previous
+    turn's chunks, and the turn is recorded in the session.
+    """
+    # Sidecar searches stop waiting once the answer is due
+    bind_deadline(deadline)
+    with track_current_thread(), (session.lock if session is not None else nullcontext()):
+        corpus_version = vector_store_manager.get_corpus_version(user_id)
+        history = []
+        if session is not None:
+            history = condense_history(
+                list(session.turns), question, settings.conversation_history_tokens, vector_store_manager.count_tokens
+            )
+        query = retrieval_query(history, question)
+        
+        def finish(answer: tuple, results: Optional[List[ScoredDocument]] = None) -> tuple:
+            if session is not None:
+                session.add_turn(question, answer[0], results or [], document_ids, corpus_version)
+            return answer
+        
+        # Answers for an unchanged corpus can be reused, skipping retrieval and generation
+        cache_key = (user_id, normalize_question(question), document_ids, corpus_version)
+        if history:
+            # The same follow-up means something else after a different conversation
+            cache_key += (history_digest(history),)
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            count_for_request("answer_cache_hits")
+            response, source_documents = cached
+            return finish((response, 0.0, source_documents, None, False))
+        
+        # First check if user has any documents
+        has_docs = vector_store_manager.has_documents_for_user(user_id)
+        
+        if not has_docs:
+            # No documents found for user
+            return finish((NO_DOCUMENTS_MESSAGE, 0.0, [], None, False))
+        
+        if document_ids is not None and not document_ids:
+            return finish((EMPTY_SCOPE_MESSAGE, 0.0, [], None, False))
+        
+        if session is not None and can_reuse_results(session, question, document_ids, corpus_version):
+            # Same topic as the previous turn: its chunks still apply, so skip embedding and search
+            results = session.results
+        else:
+            # Search for relevant documents, restricted to the requested documents if any
+            results = vector_store_manager.similarity_search(query, user_id, document_ids=document_ids)
+        
+        if not is_answerable(results):
+            # Nothing relevant enough to be worth an LLM call
+            return finish((NOT_FOUND_MESSAGE, 0.0, [], None, False))
+        
+        # Extract source document information
+        relevant_docs = [doc for doc, _ in results]
+        source_documents = [doc.metadata.get('source', 'Unknown') for doc in relevant_docs]
+        source_scores = [round(score, 4) for _, score in results]
+        
+        # Generate answer using LLM within whatever is left of the deadline
+        response, response_time, degraded = generate_answer(
+            question, relevant_docs, user_id, deadline, cache_key, source_documents, history
+        )
+        return finish((response, response_time, source_documents, source_scores, degraded), results)
+
+
+def _generate_batch_item(question: str, results: List[ScoredDocument], user_id: int, cache_key: tuple) -> BatchQuestionResult:
+    """Answer one retrieved batch question, turning failures into a per-item error"""
+    start_time = time.perf_counter()
+    # Runs in its own context copy, so these counts and timings are this question's alone
+    counts = start_request_counts()
+    timings = start_stage_collection()
+    if not is_answerable(results):
+        return BatchQuestionResult(question=question, answer=NOT_FOUND_MESSAGE, source_documents=[])
+    
+    relevant_docs = [doc for doc, _ in results]
+    source_documents = [doc.metadata.get('source', 'Unknown') for doc in relevant_docs]
+    # Each question gets the same deadline a single /qa/ask would, starting when its turn comes
+    deadline = Deadline(settings.qa_answer_deadline)
+    bind_deadline(deadline)
+    try:
+        response, response_time, degraded = generate_answer(
+            question, relevant_docs, user_id, deadline, cache_key, source_documents
+        )
+    except AdmissionRejected as e:
+        return BatchQuestionResult(question=question, error=e.detail, status_code=e.status_code)
+    except Exception as e:
+        return BatchQuestionResult(question=question, error=str(e), status_code=500)
+    
+    return BatchQuestionResult(
+        question=question,
+        answer=response,
+        response_time=response_time,
+        elapsed=round(time.perf_counter() - start_time, 4),
+        source_documents=source_documents,
+        source_scores=[round(score, 4) for _, score in results],
+        degraded=degraded,
+        prompt_tokens=counts.get("prompt_tokens"),
+        stage_timings=dict(timings)
+    )
+
+
+def _answer_batch(
+    questions: List[str],
+    user_id: int,
+    deadline: Deadline,
+    document_ids: Optional[Tuple[int, ...]] = None
+) -> List[BatchQuestionResult]:
+    """Answer several questions with one embedding batch and one search; runs in a worker thread"""
+    # The shared search stops waiting once the batch's answers are due
+    bind_deadline(deadline)
+    with track_current_thread():
+        corpus_version = vector_store_manager.get_corpus_version(user_id)
+        cache_keys = [(user_id, normalize_question(question), document_ids, corpus_version) for question in questions]
+        results: List[Optional[BatchQuestionResult]] = [None] * len(questions)
+        
+        pending = []
+        for i, (question, cache_key) in enumerate(zip(questions, cache_keys)):
+            cached = answer_cache.get(cache_key)
+            if cached is not None:
+                results[i] = BatchQuestionResult(
+                    question=question, answer=cached[0], source_documents=cached[1], cache_hit=True
+                )
+            else:
+                pending.append(i)
+        if not pending:
+            return results
+        
+        message = None
+        if not vector_store_manager.has_documents_for_user(user_id):
+            message = NO_DOCUMENTS_MESSAGE
+        elif document_ids is not None and not document_ids:
+            message = EMPTY_SCOPE_MESSAGE
+        if message is not None:
+            for i in pending:
+                results[i] = BatchQuestionResult(question=questions[i], answer=message, source_documents=[])
+            return results
+        
+        try:
+            retrieved = vector_store_manager.similarity_search_batch(
+                [questions[i] for i in pending], user_id, document_ids=document_ids
+            )
+        except DeadlineExceeded:
+            for i in pending:
+                results[i] = BatchQuestionResult(
+                    question=questions[i], error="Searching your documents took too long", status_code=503
+                )
+            return results
+        except Exception as e:
+            print(f"Error in batch similarity search for user {user_id}: {e}")
+            for i in pending:
+                results[i] = BatchQuestionResult(question=questions[i], error="Document search failed", status_code=500)
+            return results
+        
+        # Bounded parallelism; repeated questions in a batch share one generation via the cache key
+        with ThreadPoolExecutor(max_workers=settings.qa_batch_parallelism) as pool:
+            futures = {
+                i: pool.submit(
+                    contextvars.copy_context().run,
+                    _generate_batch_item, questions[i], results_for_question, user_id, cache_keys[i]
+                )
+                for i, results_for_question in zip(pending, retrieved)
+            }
+            for i, future in futures.items():
+                results[i] = future.result()
+        return results
+
 
 @router.post("/ask", response_model=QuestionResponse)
 async def ask_question(
@@ -20,55 +242,72 @@ async def ask_question(
     db: Session = Depends(get_db)
 ):
     """Ask a question and get an AI-powered answer"""
+    deadline = Deadline(settings.qa_answer_deadline)
     
     try:
-        # First check if user has any documents
-        has_docs = vector_store_manager.has_documents_for_user(current_user.id)
-        
-        if not has_docs:
-            # No documents found for user
-            response = "I don't have any documents to search through. Please upload some documents first."
-            response_time = 0.0
-            source_documents = []
-        else:
-            # Search for relevant documents
-            relevant_docs = vector_store_manager.similarity_search(
-                question_request.question, 
-                current_user.id
+        # Identical concurrent questions against the same corpus share one computation;
+        # every caller still gets its own QueryLog entry below
+        document_ids = _resolve_document_scope(db, current_user.id, question_request)
+        if question_request.conversation_id is not None:
+            # A turn depends on its conversation's history, so it is never coalesced with other askers
+            session = get_session(current_user.id, question_request.conversation_id)
+            response, response_time, source_documents, source_scores, degraded = await run_in_threadpool(
+                _answer_question, question_request.question, current_user.id, deadline, document_ids, session
             )
-            
-            if not relevant_docs:
-                # No relevant documents found for the specific question
-                response = "I found your documents but couldn't find specific information to answer your question. Please try rephrasing your question or ask about a different topic."
-                response_time = 0.0
-                source_documents = []
-            else:
-                # Generate answer using LLM
-                response, response_time = llm_service.answer_question_with_timing(
-                    question_request.question, 
-                    relevant_docs
+            touch_session(current_user.id, question_request.conversation_id, session)
+            coalesced = False
+        else:
+            flight_key = (current_user.id, normalize_question(question_request.question), document_ids)
+            (response, response_time, source_documents, source_scores, degraded), coalesced = await question_flight.do(
+                flight_key,
+                lambda: run_in_threadpool(
+                    _answer_question, question_request.question, current_user.id, deadline, document_ids
                 )
-                
-                # Extract source document information
-                source_documents = [doc.metadata.get('source', 'Unknown') for doc in relevant_docs]
+            )
         
-        # Log the query
+        # Log the query along with the per-stage latency breakdown collected so far. A coalesced
+        # follower's breakdown holds only its own wait; it spent nothing on the LLM, so it is
+        # logged like a cache hit with that wait as its time, leaving the leader's cost counted once
+        counts = current_request_counts()
+        stage_timings = current_stage_timings()
         query_log = QueryLog(
             user_id=current_user.id,
             question=question_request.question,
             response=response,
-            response_time=response_time,
-            source_documents=json.dumps(source_documents) if source_documents else None
+            response_time=stage_timings.get("coalesced_wait", 0.0) if coalesced else response_time,
+            source_documents=json.dumps(source_documents) if source_documents else None,
+            stage_timings=json.dumps(stage_timings),
+            degraded=degraded,
+            cache_hit=coalesced or bool(counts.get("answer_cache_hits")),
+            prompt_tokens=counts.get("prompt_tokens")
         )
-        db.add(query_log)
-        db.commit()
+        with time_stage("db_log_commit"):
+            db.add(query_log)
+            update_rollups(db, [query_log])
+            db.commit()
         
         return QuestionResponse(
             answer=response,
             response_time=response_time,
-            source_documents=source_documents
+            source_documents=source_documents,
+            source_scores=source_scores,
+            conversation_id=question_request.conversation_id,
+            coalesced=coalesced,
+            degraded=degraded
         )
         
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except DeadlineExceeded:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Searching your documents took too long. Please try again shortly.",
+            headers={"Retry-After": "1"}
+        )
     except ValueError as e:
         if "OpenAI API key" in str(e):
             raise HTTPException(
@@ -101,6 +340,59 @@ async def ask_question(
             )
 
 
+@router.post("/ask/batch", response_model=BatchQuestionResponse)
+async def ask_questions_batch(
+    batch_request: BatchQuestionRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Ask several questions at once; results come back in request order with per-item errors"""
+    if len(batch_request.questions) > settings.qa_batch_max_questions:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may contain at most {settings.qa_batch_max_questions} questions."
+        )
+    
+    start_time = time.perf_counter()
+    deadline = Deadline(settings.qa_answer_deadline)
+    document_ids = _resolve_document_scope(db, current_user.id, batch_request)
+    results = await run_in_threadpool(_answer_batch, batch_request.questions, current_user.id, deadline, document_ids)
+    
+    # One insert for the whole batch. Each entry gets its question's own stages plus an equal share
+    # of the batch-wide ones (embedding, search), so summing entries counts every stage once
+    answered = [result for result in results if result.answer is not None]
+    batch_share = {
+        stage: round(seconds / max(len(answered), 1), 6) for stage, seconds in current_stage_timings().items()
+    }
+    
+    def stage_timings(result: BatchQuestionResult) -> str:
+        timings = dict(batch_share)
+        for stage, seconds in result.stage_timings.items():
+            timings[stage] = round(timings.get(stage, 0.0) + seconds, 6)
+        return json.dumps(timings)
+    
+    query_logs = [
+        QueryLog(
+            user_id=current_user.id,
+            question=result.question,
+            response=result.answer,
+            response_time=result.response_time,
+            source_documents=json.dumps(result.source_documents) if result.source_documents else None,
+            stage_timings=stage_timings(result),
+            degraded=result.degraded,
+            cache_hit=result.cache_hit,
+            prompt_tokens=result.prompt_tokens
+        )
+        for result in answered
+    ]
+    with time_stage("db_log_commit"):
+        db.add_all(query_logs)
+        update_rollups(db, query_logs)
+        db.commit()
+    
+    return BatchQuestionResponse(results=results, total_time=round(time.perf_counter() - start_time, 4))
+
+
 @router.get("/history", response_model=List[QueryLogResponse])
 async def get_query_history(
     current_user: User = Depends(get_current_active_user),
@@ -126,7 +418,8 @@ async def debug_user_documents(
         # Add additional info
         collection_info.update({
             "chroma_directory": settings.chroma_persist_directory,
-            "total_user_collections": len(vector_store_manager.user_collections)
+            "vector_store_mode": settings.vector_store_mode,
+            **vector_store_manager.collection_stats()
         })
         
         return collection_info
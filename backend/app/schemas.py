@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, model_validator
+from typing import Dict, Optional, List
 from datetime import datetime
 
 
@@ -35,12 +35,49 @@ class DocumentUpload(BaseModel):
 
 class QuestionRequest(BaseModel):
     question: str
+    # Optional scope; when both are given a chunk must satisfy both
+    document_ids: Optional[List[int]] = None
+    filename_pattern: Optional[str] = None  # shell-style glob, e.g. "report_*.pdf"
+    # Client-chosen id; questions sharing it are answered as one conversation
+    conversation_id: Optional[str] = Field(default=None, min_length=1, max_length=128)
 
 
 class QuestionResponse(BaseModel):
     answer: str
     response_time: float
     source_documents: Optional[List[str]] = None
+    source_scores: Optional[List[float]] = None  # cosine similarity per source; omitted for cached answers
+    conversation_id: Optional[str] = None
+    coalesced: bool = False  # answer was shared with an identical in-flight question
+    degraded: bool = False  # extractive answer because the LLM missed the deadline or failed
+
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1)
+    # Scope shared by every question in the batch
+    document_ids: Optional[List[int]] = None
+    filename_pattern: Optional[str] = None
+
+
+class BatchQuestionResult(BaseModel):
+    question: str
+    answer: Optional[str] = None
+    response_time: float = 0.0  # LLM time, as in QuestionResponse
+    elapsed: float = 0.0  # wall time spent on this question after retrieval
+    source_documents: Optional[List[str]] = None
+    source_scores: Optional[List[float]] = None
+    degraded: bool = False
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    # Kept for the query log only
+    cache_hit: bool = Field(default=False, exclude=True)
+    prompt_tokens: Optional[int] = Field(default=None, exclude=True)
+    stage_timings: Dict[str, float] = Field(default_factory=dict, exclude=True)  # this question's own stages
+
+
+class BatchQuestionResponse(BaseModel):
+    results: List[BatchQuestionResult]  # same order as the request
+    total_time: float
 
 
 class QueryLogResponse(BaseModel):
@@ -50,16 +87,98 @@ class QueryLogResponse(BaseModel):
     response: str
     response_time: float
     source_documents: Optional[str] = None
+    stage_timings: Optional[str] = None
+    degraded: Optional[bool] = False
+    cache_hit: Optional[bool] = False
+    prompt_tokens: Optional[int] = None
     
     class Config:
         from_attributes = True
 
 
+class QueryRollupResponse(BaseModel):
+    user_id: int  # 0 for all users
+    period: str
+    bucket_start: datetime
+    count: int
+    cache_hits: int
+    cache_hit_rate: float
+    fallback_rate: float  # share of degraded (extractive) answers
+    prompt_tokens: int
+    latency_p50: Optional[float] = None
+    latency_p95: Optional[float] = None
+    latency_p99: Optional[float] = None
+
+
 class DocumentResponse(BaseModel):
     id: int
     filename: str
     file_type: str
     uploaded_at: datetime
+    chunk_count: Optional[int] = None
+    avg_chunk_tokens: Optional[float] = None
+    duplicate: bool = False  # identical to a file the user already uploaded
     
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+
+class DocumentChunk(BaseModel):
+    chunk_index: int
+    content: str
+    source: str
+
+
+class DocumentChunksResponse(BaseModel):
+    document_id: int
+    offset: int
+    limit: int
+    chunks: List[DocumentChunk]
+
+
+class ChunkingConfig(BaseModel):
+    # Sizes are in embedding-model tokens; chunks are capped at the model's input length
+    chunk_tokens: int = Field(200, ge=32, le=512)
+    overlap_tokens: int = Field(32, ge=0)
+    respect_pages: bool = True  # never let a chunk span two PDF pages
+    
+    @model_validator(mode="after")
+    def check_overlap(self):
+        if self.overlap_tokens >= self.chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        return self
+
+
+class RechunkJobStatus(BaseModel):
+    status: str  # idle, running, completed or failed
+    total: int = 0
+    processed: int = 0
+    error: Optional[str] = None
+
+
+class IngestionStats(BaseModel):
+    total_documents: int
+    total_chunks: int
+    avg_chunks_per_document: float
+    avg_chunk_tokens: float
+    documents: List[DocumentResponse]
+
+
+class SnapshotImportResult(BaseModel):
+    embedding_model: str
+    documents_imported: int
+    documents_skipped: int  # already present in the account (same content hash)
+    chunks_imported: int
+
+
+class EmbeddingMigrationRequest(BaseModel):
+    model: str  # e.g. "sentence-transformers/all-mpnet-base-v2"
+
+
+class EmbeddingMigrationStatus(BaseModel):
+    status: str  # idle, running, completed or failed
+    active_model: str
+    target_model: Optional[str] = None
+    total: int = 0
+    processed: int = 0
+    error: Optional[str] = None
@@ -0,0 +1,360 @@
+"""Tenant sharding for the vector store.
+
+Users are spread over VECTOR_SHARDS shards with a consistent-hash ring, so
+changing the shard count only moves the users whose ring position changes
+owner. Each shard has its own Chroma and exact-index directories and can run
+in-process or as its own sidecar (`python -m app.vector_service --shard N`).
+
+After changing VECTOR_SHARDS, move the affected users before restarting the
+API workers:
+
+    python -m app.sharding rebalance --previous-shards 2 \
+        --previous-addresses /tmp/shard0.sock /tmp/shard1.sock
+
+Addresses are only needed in sidecar mode, and no embedding migration may be
+in progress while users move.
+"""
+import argparse
+import bisect
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from app.config import settings
+from app.metrics import registry
+
+
+SHARD_CALL_DURATION = registry.histogram(
+    "vector_shard_call_duration_seconds",
+    "Vector store call latency by shard",
+    labelnames=("shard",)
+)
+
+# Ring points per shard; more points give a more even spread
+VIRTUAL_NODES = 128
+
+# Recent call latencies kept per shard for percentile stats
+LATENCY_WINDOW = 1000
+
+# Chunks copied per round trip when moving a user between shards
+REBALANCE_BATCH_SIZE = 500
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    """Maps keys to shard indexes; adding a shard moves only about 1/N of the keys"""
+
+    def __init__(self, shard_count: int, virtual_nodes: int = VIRTUAL_NODES):
+        self.shard_count = shard_count
+        points = sorted(
+            (_hash(f"shard-{shard}#{replica}"), shard)
+            for shard in range(shard_count)
+            for replica in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, user_id: int) -> int:
+        position = bisect.bisect(self._hashes, _hash(f"user-{user_id}")) % len(self._hashes)
+        return self._shards[position]
+
+
+def shard_directories(shard: int) -> tuple:
+    """Chroma and exact-index directories of one shard.
+
+    Shards live next to the unsharded directories, e.g. `chroma_db_shards/shard_0`,
+    never inside them, so unsharded user collections and shards cannot collide.
+    """
+    name = f"shard_{shard}"
+    return (
+        os.path.join(os.path.normpath(settings.chroma_persist_directory) + "_shards", name),
+        os.path.join(os.path.normpath(settings.exact_index_directory) + "_shards", name)
+    )
+
+
+def shard_address(shard: int, shard_count: int, addresses: Optional[List[str]] = None) -> str:
+    """Sidecar address of a shard; `addresses` defaults to VECTOR_SHARD_ADDRESSES.
+
+    A single shard is the unsharded sidecar unless an address is given for it.
+    """
+    if shard_count == 1:
+        return addresses[0] if addresses else settings.vector_service_address
+    if addresses is None:
+        addresses = settings.vector_shard_addresses
+    if len(addresses) < shard_count:
+        raise ValueError("Sidecar mode needs one sidecar address per shard")
+    return addresses[shard]
+
+
+def create_shard_backend(shard: int, shard_count: int, addresses: Optional[List[str]] = None):
+    """In-process store for a shard, or a client for that shard's sidecar.
+
+    A single shard is the unsharded layout: the configured directories and sidecar address.
+    """
+    from app.vector_service import VectorStoreClient
+    from app.vector_store import VectorStoreManager
+    if settings.vector_store_mode == "sidecar":
+        return VectorStoreClient(shard_address(shard, shard_count, addresses))
+    if shard_count == 1:
+        return VectorStoreManager()
+    return VectorStoreManager(*shard_directories(shard))
+
+
+def _directory_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # removed while walking
+    return total
+
+
+class ShardedVectorStore:
+    """Drop-in stand-in for VectorStoreManager that routes each user to their shard"""
+
+    def __init__(self, backends: List[Any]):
+        self.backends = backends
+        self.ring = ConsistentHashRing(len(backends))
+        self._latencies = [deque(maxlen=LATENCY_WINDOW) for _ in backends]
+        self._calls = [0] * len(backends)
+        self._lock = threading.Lock()
+
+    def _timed(self, shard: int, fn: Callable[[], Any]) -> Any:
+        start_time = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            elapsed = time.perf_counter() - start_time
+            SHARD_CALL_DURATION.observe(elapsed, shard=shard)
+            with self._lock:
+                self._latencies[shard].append(elapsed)
+                self._calls[shard] += 1
+
+    def _for_user(self, user_id: int, method: str, *args, **kwargs) -> Any:
+        shard = self.ring.shard_for(user_id)
+        return self._timed(shard, lambda: getattr(self.backends[shard], method)(*args, **kwargs))
+
+    def _all(self, method: str, *args, **kwargs) -> List[Any]:
+        return [
+            self._timed(shard, lambda backend=backend: getattr(backend, method)(*args, **kwargs))
+            for shard, backend in enumerate(self.backends)
+        ]
+
+    # Per-user calls
+
+    def index_documents(self, documents, user_id, chunking=None):
+        return self._for_user(user_id, "index_documents", documents, user_id, chunking)
+
+    def add_documents(self, documents, user_id):
+        return self._for_user(user_id, "add_documents", documents, user_id)
+
+    def delete_document_chunks(self, document_id, user_id):
+        return self._for_user(user_id, "delete_document_chunks", document_id, user_id)
+
+    def rechunk_document(self, document, user_id, chunking=None):
+        return self._for_user(user_id, "rechunk_document", document, user_id, chunking)
+
+    def similarity_search(self, query, user_id, k=None, document_ids=None):
+        return self._for_user(user_id, "similarity_search", query, user_id, k=k, document_ids=document_ids)
+
+    def similarity_search_batch(self, queries, user_id, k=None, document_ids=None):
+        return self._for_user(user_id, "similarity_search_batch", queries, user_id, k=k, document_ids=document_ids)
+
+    def get_corpus_version(self, user_id):
+        return self._for_user(user_id, "get_corpus_version", user_id)
+
+    def has_documents_for_user(self, user_id):
+        return self._for_user(user_id, "has_documents_for_user", user_id)
+
+    def get_user_collection_info(self, user_id):
+        info = self._for_user(user_id, "get_user_collection_info", user_id)
+        return {**info, "shard": self.ring.shard_for(user_id)}
+
+    def delete_user_documents(self, user_id):
+        return self._for_user(user_id, "delete_user_documents", user_id)
+
+    def get_document_chunks(self, document_id, user_id, offset=0, limit=50):
+        return self._for_user(user_id, "get_document_chunks", document_id, user_id, offset=offset, limit=limit)
+
+    def get_user_chunks(self, user_id, offset=0, limit=None, include_embeddings=False):
+        return self._for_user(
+            user_id, "get_user_chunks", user_id, offset=offset, limit=limit, include_embeddings=include_embeddings
+        )
+
+    def import_chunks(self, user_id, ids, embeddings, texts, metadatas):
+        return self._for_user(user_id, "import_chunks", user_id, ids, embeddings, texts, metadatas)
+
+    def migrate_document(self, document, user_id, chunking=None):
+        return self._for_user(user_id, "migrate_document", document, user_id, chunking)
+
+    # Calls that are not tied to one user
+
+    def count_tokens(self, texts):
+        return self.backends[0].count_tokens(texts)
+
+    def embed_query(self, query):
+        return self.backends[0].embed_query(query)
+
+    def embed_queries(self, queries):
+        return self.backends[0].embed_queries(queries)
+
+    def embed_texts(self, texts):
+        return self.backends[0].embed_texts(texts)
+
+    def warm_query_embeddings(self, questions):
+        # In-process shards share one embedding cache, so only the first call embeds anything
+        return max(self._all("warm_query_embeddings", questions))
+
+    def get_embedding_model(self):
+        return self.backends[0].get_embedding_model()
+
+    def get_embedding_dimension(self):
+        return self.backends[0].get_embedding_dimension()
+
+    def get_migration_status(self):
+        return self.backends[0].get_migration_status()
+
+    def begin_migration(self, model_name):
+        return self._all("begin_migration", model_name)[0]
+
+    def complete_migration(self, user_ids):
+        # Each shard cuts over on its own users; the state files switch shard by shard
+        for shard, backend in enumerate(self.backends):
+            shard_users = [user_id for user_id in user_ids if self.ring.shard_for(user_id) == shard]
+            self._timed(shard, lambda: backend.complete_migration(shard_users))
+        return self.get_migration_status()
+
+    def reload_vectorstore(self):
+        self._all("reload_vectorstore")
+
+    def collection_stats(self):
+        return {"shards": self._all("collection_stats")}
+
+    def shard_stats(self) -> List[Dict[str, Any]]:
+        """Per-shard disk size, open collections and recent call latency"""
+        stats = []
+        for shard, backend in enumerate(self.backends):
+            with self._lock:
+                latencies = sorted(self._latencies[shard])
+                calls = self._calls[shard]
+            chroma_directory, exact_directory = (
+                shard_directories(shard) if len(self.backends) > 1
+                else (settings.chroma_persist_directory, settings.exact_index_directory)
+            )
+            collection_stats = backend.collection_stats()
+
+            def percentile(q: float) -> Optional[float]:
+                if not latencies:
+                    return None
+                return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 4)
+
+            stats.append({
+                "shard": shard,
+                "disk_bytes": _directory_bytes(chroma_directory) + _directory_bytes(exact_directory),
+                "open_collections": collection_stats.get("total_user_collections", 0),
+                "calls": calls,
+                "latency_p50": percentile(0.5),
+                "latency_p95": percentile(0.95),
+                "latency_p99": percentile(0.99),
+            })
+        return stats
+
+
+def move_user(user_id: int, source, target) -> int:
+    """Copy a user's stored chunks and vectors to another shard, then drop them at the source"""
+    moved = 0
+    while True:
+        # The source is not written to during the move, so paging by offset is stable
+        page = source.get_user_chunks(user_id, offset=moved, limit=REBALANCE_BATCH_SIZE, include_embeddings=True)
+        if not page["ids"]:
+            break
+        target.import_chunks(user_id, page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+        moved += len(page["ids"])
+    source.delete_user_documents(user_id)
+    return moved
+
+
+def rebalance(
+    previous_shards: int,
+    previous_addresses: List[str],
+    user_ids: List[int],
+    create_backend: Callable[..., Any] = create_shard_backend
+) -> Dict[str, int]:
+    """Move users whose shard differs between the previous and the configured shard count.
+
+    `previous_addresses` are the sidecars of the previous layout (ignored when running
+    in-process). Refuses to start while an embedding migration is in progress, since
+    moved chunks would skip the migration target.
+    """
+    # One backend per distinct storage location: shard i is the same directory under both
+    # counts, and the same sidecar when both layouts give it the same address
+    backends = {}
+
+    def backend(shard: int, shard_count: int, addresses: List[str]):
+        if settings.vector_store_mode == "sidecar":
+            key = shard_address(shard, shard_count, addresses)
+        else:
+            key = shard if shard_count > 1 else "unsharded"
+        if key not in backends:
+            backends[key] = create_backend(shard, shard_count, addresses)
+        return backends[key]
+
+    current_addresses = settings.vector_shard_addresses if settings.vector_shards > 1 else []
+    layouts = [(previous_shards, previous_addresses), (settings.vector_shards, current_addresses)]
+    for shard_count, addresses in layouts:
+        for shard in range(shard_count):
+            target_model = backend(shard, shard_count, addresses).get_migration_status()["target_model"]
+            if target_model is not None:
+                raise ValueError(
+                    f"An embedding migration to {target_model} is in progress; finish it before rebalancing"
+                )
+
+    before = ConsistentHashRing(previous_shards)
+    after = ConsistentHashRing(settings.vector_shards)
+
+    summary = {"users_moved": 0, "chunks_moved": 0}
+    for user_id in user_ids:
+        source, target = before.shard_for(user_id), after.shard_for(user_id)
+        source_backend = backend(source, previous_shards, previous_addresses)
+        target_backend = backend(target, settings.vector_shards, current_addresses)
+        if source_backend is target_backend:
+            continue
+        chunks = move_user(user_id, source_backend, target_backend)
+        print(f"Moved user {user_id} from shard {source} to shard {target} ({chunks} chunks)")
+        summary["users_moved"] += 1
+        summary["chunks_moved"] += chunks
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector store shard maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebalance_parser = subcommands.add_parser("rebalance", help="Move users after VECTOR_SHARDS changed")
+    rebalance_parser.add_argument("--previous-shards", type=int, required=True)
+    rebalance_parser.add_argument(
+        "--previous-addresses", nargs="*", default=[],
+        help="Sidecar address of each previous shard (sidecar mode only)"
+    )
+    args = parser.parse_args()
+
+    from app.database import SessionLocal
+    from app.models import User
+    db = SessionLocal()
+    try:
+        user_ids = [user_id for (user_id,) in db.query(User.id).order_by(User.id)]
+    finally:
+        db.close()
+
+    summary = rebalance(args.previous_shards, args.previous_addresses, user_ids)
+    print(f"✅ Rebalanced: {summary['users_moved']} users, {summary['chunks_moved']} chunks moved")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Corpus snapshots.
+
+A snapshot is an uncompressed zip holding two Parquet files and a manifest:
+
+    documents.parquet  one row per document (text, filename, type, hash)
+    chunks.parquet     one row per chunk (text, metadata, embedding vector)
+    manifest.json      format version, embedding model and row counts
+
+Both Parquet files are written and read one record batch at a time, so neither
+export nor import holds a whole tenant in memory. Parquet pages are already
+compressed, so the zip stores members as-is and stays cheap to seek in.
+"""
+import json
+import zipfile
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_BATCH_SIZE = 500
+
+DOCUMENTS_FILE = "documents.parquet"
+CHUNKS_FILE = "chunks.parquet"
+MANIFEST_FILE = "manifest.json"
+
+DOCUMENT_SCHEMA = pa.schema([
+    ("document_id", pa.int64()),
+    ("filename", pa.string()),
+    ("file_type", pa.string()),
+    ("content", pa.large_string()),
+    ("content_hash", pa.string()),
+])
+
+CHUNK_SCHEMA = pa.schema([
+    ("chunk_id", pa.string()),
+    ("document_id", pa.int64()),
+    ("chunk_index", pa.int64()),
+    ("text", pa.string()),
+    ("metadata", pa.string()),  # JSON, since metadata keys vary between versions
+    ("embedding", pa.list_(pa.float32())),
+])
+
+
+class SnapshotError(ValueError):
+    """The snapshot is malformed or incompatible with this server"""
+
+
+def write_snapshot(
+    target: BinaryIO,
+    document_batches: Iterable[List[Dict[str, Any]]],
+    chunk_batches: Iterable[Dict[str, List[Any]]],
+    embedding_model: str
+):
+    """Write a snapshot from batches of document rows and batches of chunk columns"""
+    counts = {"documents": 0, "chunks": 0}
+    stamp = {b"embedding_model": embedding_model.encode()}
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_STORED) as archive:
+        with archive.open(DOCUMENTS_FILE, "w", force_zip64=True) as member:
+            with pq.ParquetWriter(member, DOCUMENT_SCHEMA.with_metadata(stamp)) as writer:
+                for rows in document_batches:
+                    writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=DOCUMENT_SCHEMA))
+                    counts["documents"] += len(rows)
+
+        with archive.open(CHUNKS_FILE, "w", force_zip64=True) as member:
+            with pq.ParquetWriter(member, CHUNK_SCHEMA.with_metadata(stamp)) as writer:
+                for batch in chunk_batches:
+                    writer.write_batch(pa.RecordBatch.from_pydict(batch, schema=CHUNK_SCHEMA))
+                    counts["chunks"] += len(batch["chunk_id"])
+
+        manifest = {"format_version": SNAPSHOT_FORMAT_VERSION, "embedding_model": embedding_model, **counts}
+        archive.writestr(MANIFEST_FILE, json.dumps(manifest))
+
+
+class SnapshotReader:
+    """Reads a snapshot back one record batch at a time"""
+
+    def __init__(self, source: BinaryIO):
+        try:
+            self.archive = zipfile.ZipFile(source)
+            self.manifest = json.loads(self.archive.read(MANIFEST_FILE))
+        except (zipfile.BadZipFile, KeyError, json.JSONDecodeError) as e:
+            raise SnapshotError(f"Not a corpus snapshot: {e}")
+        if self.manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot format version: {self.manifest.get('format_version')}")
+
+    @property
+    def embedding_model(self) -> str:
+        return self.manifest["embedding_model"]
+
+    def _batches(self, name: str, batch_size: int) -> Iterator[pa.RecordBatch]:
+        with self.archive.open(name) as member:
+            yield from pq.ParquetFile(member).iter_batches(batch_size=batch_size)
+
+    def document_batches(self, batch_size: int = SNAPSHOT_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        for batch in self._batches(DOCUMENTS_FILE, batch_size):
+            yield batch.to_pylist()
+
+    def chunk_batches(self, batch_size: int = SNAPSHOT_BATCH_SIZE) -> Iterator[Dict[str, List[Any]]]:
+        for batch in self._batches(CHUNKS_FILE, batch_size):
+            yield batch.to_pydict()
+
+    def close(self):
+        self.archive.close()
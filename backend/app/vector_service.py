@@ -0,0 +1,247 @@
+"""Vector store sidecar.
+
+Runs a single VectorStoreManager (one embedding model, one Chroma writer) and
+serves it to API workers over a local socket. Start it with:
+
+    python -m app.vector_service
+
+and set VECTOR_STORE_MODE=sidecar for the API workers. With VECTOR_SHARDS > 1,
+start one sidecar per shard with `--shard N`.
+"""
+import argparse
+import os
+import threading
+from multiprocessing.connection import Client, Listener
+from typing import Any
+from app.config import settings
+from app.deadline import DeadlineExceeded, current_deadline
+from app.metrics import time_stage
+
+
+# Every call runs concurrently: the manager serializes its own writes and embeds
+# outside its write lock, so a slow upload never holds up searches. Writes are
+# never retried by the client, since a lost reply may hide a completed write.
+WRITE_METHODS = {
+    "add_documents",
+    "index_documents",
+    "delete_document_chunks",
+    "rechunk_document",
+    "import_chunks",
+    "begin_migration",
+    "migrate_document",
+    "complete_migration",
+    "delete_user_documents",
+    "reload_vectorstore",
+}
+READ_METHODS = {
+    "similarity_search",
+    "has_documents_for_user",
+    "get_corpus_version",
+    "get_user_collection_info",
+    "get_document_chunks",
+    "collection_stats",
+    "count_tokens",
+    "get_embedding_model",
+    "get_embedding_dimension",
+    "get_user_chunks",
+    "get_migration_status",
+    "embed_query",
+    "embed_queries",
+    "embed_texts",
+    "similarity_search_batch",
+    "warm_query_embeddings",
+}
+# Only searches give up at the request deadline; cheap lookups such as get_corpus_version
+# always complete, so a slow search never turns them into a failed request
+DEADLINE_METHODS = {"similarity_search", "similarity_search_batch"}
+
+
+def _authkey() -> bytes:
+    return settings.vector_service_authkey.encode()
+
+
+class VectorStoreServer:
+    def __init__(self, manager, address: str = None):
+        self.manager = manager
+        self.address = address or settings.vector_service_address
+
+    def dispatch(self, method: str, args: tuple, kwargs: dict) -> Any:
+        if method in WRITE_METHODS or method in READ_METHODS:
+            return getattr(self.manager, method)(*args, **kwargs)
+        raise AttributeError(f"Unknown vector store method: {method}")
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ("ok", self.dispatch(method, args, kwargs))
+                except Exception as e:
+                    reply = ("error", e)
+                try:
+                    conn.send(reply)
+                except OSError:
+                    # The client hung up without waiting for the reply, e.g. past its deadline
+                    return
+                except Exception as e:
+                    # Result or exception was not picklable
+                    conn.send(("error", RuntimeError(f"{type(e).__name__}: {e}")))
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)  # stale socket from a previous run
+        with Listener(self.address, authkey=_authkey()) as listener:
+            print(f"✅ Vector store service listening on {self.address}")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+class VectorStoreClient:
+    """Drop-in stand-in for VectorStoreManager that forwards calls to the sidecar"""
+
+    def __init__(self, address: str = None):
+        self.address = address or settings.vector_service_address
+        # One connection per thread; a connection carries one request at a time
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, authkey=_authkey())
+            self._local.conn = conn
+        return conn
+
+    def _receive(self, conn, method: str):
+        """Wait for the reply; searches give up when the current request's deadline passes"""
+        deadline = current_deadline()
+        if method in DEADLINE_METHODS and deadline is not None and deadline.expires_at is not None:
+            if not conn.poll(deadline.remaining()):
+                # A late reply must not be read as the answer to this thread's next call
+                conn.close()
+                self._local.conn = None
+                raise DeadlineExceeded(f"Vector store call {method} did not finish before the deadline")
+        return conn.recv()
+
+    def _call(self, method: str, *args, **kwargs) -> Any:
+        with time_stage(f"vector_rpc_{method}"):
+            try:
+                conn = self._connection()
+                conn.send((method, args, kwargs))
+                status, payload = self._receive(conn, method)
+            except DeadlineExceeded:
+                raise
+            except (EOFError, OSError):
+                self._local.conn = None
+                # Writes are not retried since the sidecar may already have applied them
+                if method in WRITE_METHODS:
+                    raise
+                # The sidecar restarted; reconnect once and retry
+                conn = self._connection()
+                conn.send((method, args, kwargs))
+                status, payload = self._receive(conn, method)
+        if status == "error":
+            raise payload
+        return payload
+
+    def add_documents(self, documents, user_id):
+        return self._call("add_documents", documents, user_id)
+
+    def index_documents(self, documents, user_id, chunking=None):
+        return self._call("index_documents", documents, user_id, chunking)
+
+    def delete_document_chunks(self, document_id, user_id):
+        return self._call("delete_document_chunks", document_id, user_id)
+
+    def rechunk_document(self, document, user_id, chunking=None):
+        return self._call("rechunk_document", document, user_id, chunking)
+
+    def count_tokens(self, texts):
+        return self._call("count_tokens", texts)
+
+    def similarity_search(self, query, user_id, k=None, document_ids=None):
+        return self._call("similarity_search", query, user_id, k=k, document_ids=document_ids)
+
+    def embed_query(self, query):
+        return self._call("embed_query", query)
+
+    def embed_queries(self, queries):
+        return self._call("embed_queries", queries)
+
+    def similarity_search_batch(self, queries, user_id, k=None, document_ids=None):
+        return self._call("similarity_search_batch", queries, user_id, k=k, document_ids=document_ids)
+
+    def embed_texts(self, texts):
+        return self._call("embed_texts", texts)
+
+    def warm_query_embeddings(self, questions):
+        return self._call("warm_query_embeddings", questions)
+
+    def get_corpus_version(self, user_id):
+        return self._call("get_corpus_version", user_id)
+
+    def has_documents_for_user(self, user_id):
+        return self._call("has_documents_for_user", user_id)
+
+    def reload_vectorstore(self):
+        return self._call("reload_vectorstore")
+
+    def get_user_collection_info(self, user_id):
+        return self._call("get_user_collection_info", user_id)
+
+    def collection_stats(self):
+        return self._call("collection_stats")
+
+    def delete_user_documents(self, user_id):
+        return self._call("delete_user_documents", user_id)
+
+    def get_embedding_model(self):
+        return self._call("get_embedding_model")
+
+    def get_embedding_dimension(self):
+        return self._call("get_embedding_dimension")
+
+    def get_user_chunks(self, user_id, offset=0, limit=None, include_embeddings=False):
+        return self._call("get_user_chunks", user_id, offset=offset, limit=limit, include_embeddings=include_embeddings)
+
+    def import_chunks(self, user_id, ids, embeddings, texts, metadatas):
+        return self._call("import_chunks", user_id, ids, embeddings, texts, metadatas)
+
+    def get_migration_status(self):
+        return self._call("get_migration_status")
+
+    def begin_migration(self, model_name):
+        return self._call("begin_migration", model_name)
+
+    def migrate_document(self, document, user_id, chunking=None):
+        return self._call("migrate_document", document, user_id, chunking)
+
+    def complete_migration(self, user_ids):
+        return self._call("complete_migration", user_ids)
+
+    def get_document_chunks(self, document_id, user_id, offset=0, limit=50):
+        return self._call("get_document_chunks", document_id, user_id, offset=offset, limit=limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector store sidecar")
+    parser.add_argument("--shard", type=int, help="serve one shard when VECTOR_SHARDS > 1")
+    args = parser.parse_args()
+
+    if args.shard is not None:
+        from app.sharding import shard_directories
+        from app.vector_store import VectorStoreManager
+        manager = VectorStoreManager(*shard_directories(args.shard))
+        VectorStoreServer(manager, settings.vector_shard_addresses[args.shard]).serve_forever()
+        return
+
+    from app.vector_store import VectorStoreManager
+    # Build the one manager this process serves; the module-level store follows VECTOR_STORE_MODE instead
+    VectorStoreServer(VectorStoreManager()).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
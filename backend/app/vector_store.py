@@ -1,136 +1,578 @@
 import chromadb
 from chromadb.config import Settings as ChromaSettings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from chromadb.errors import NotFoundError
 from langchain_community.vectorstores import Chroma
 from langchain.schema import Document
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from contextlib import contextmanager
 import json
 import os
+import shutil
+import threading
+import uuid
 from app.config import settings
+from app.metrics import time_stage, DOCUMENT_CHUNKS, QUERY_EMBEDDING_CACHE
+from app.coalescing import normalize_question
+from app.lru import LRUCache
+from app.exact_index import ExactIndex
+from app.chunking import TokenChunker
+from app.embedding_versions import EmbeddingState, EmbeddingVersion, version_suffix
+from app.retrieval import trim_results
 
 
-class VectorStoreManager:
-    def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}
+# Rough in-memory cost of one chunk: vector, HNSW links, text and metadata
+APPROX_BYTES_PER_CHUNK = 4096
+
+# Batch size used when copying vectors between index backends
+PROMOTION_BATCH_SIZE = 500
+
+# Question embeddings keyed by (model, normalized question), shared by every store in the process
+query_embedding_cache = LRUCache(maxsize=settings.query_embedding_cache_size)
+
+
+class ChromaIndex:
+    """Gives a per-user Chroma collection the same interface as ExactIndex"""
+    
+    def __init__(self, handle: Chroma):
+        self.handle = handle
+        self.collection = handle._collection
+    
+    def add(self, ids: List[str], embeddings: List[List[float]], texts: List[str], metadatas: List[Dict[str, Any]]):
+        self.collection.add(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+    
+    def search(
+        self,
+        query_embedding: List[float],
+        k: int,
+        document_ids: Optional[List[int]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Top-k documents with their cosine similarity, best first, optionally within some documents"""
+        return self.search_many([query_embedding], k, document_ids)[0]
+    
+    def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        k: int,
+        document_ids: Optional[List[int]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Top-k results for several queries in one Chroma query"""
+        count = self.count()
+        if not count:
+            return [[] for _ in query_embeddings]
+        # The where clause is applied by Chroma before the vector search, not on its results
+        where = {"document_id": {"$in": list(document_ids)}} if document_ids is not None else None
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=min(k, count),
+            where=where,
+            include=["documents", "metadatas", "distances"]
+        )
+        # Collections use squared L2 and load_embeddings normalizes every vector, so cosine = 1 - d / 2
+        return [
+            [
+                (Document(page_content=text, metadata=metadata), 1 - distance / 2)
+                for text, metadata, distance in zip(texts, metadatas, distances)
+            ]
+            for texts, metadatas, distances in zip(
+                results["documents"], results["metadatas"], results["distances"]
+            )
+        ]
+    
+    def count(self) -> int:
+        return self.collection.count()
+    
+    def get(self, offset: int = 0, limit: Optional[int] = None, include_embeddings: bool = False) -> Dict[str, Any]:
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        results = self.collection.get(offset=offset, limit=limit, include=include)
+        result = {
+            "ids": results["ids"],
+            "documents": results["documents"],
+            "metadatas": results["metadatas"]
+        }
+        if include_embeddings:
+            result["embeddings"] = [list(map(float, embedding)) for embedding in results["embeddings"]]
+        return result
+    
+    def get_document_chunks(self, document_id: int, offset: int, limit: int) -> List[Document]:
+        """Chunks of one document ordered by chunk_index, one page at a time"""
+        # chunk_index is contiguous per document, so a page is a range filter on it
+        results = self.collection.get(
+            where={"$and": [
+                {"document_id": document_id},
+                {"chunk_index": {"$gte": offset}},
+                {"chunk_index": {"$lt": offset + limit}}
+            ]},
+            include=["documents", "metadatas"]
         )
+        chunks = [
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(results["documents"], results["metadatas"])
+        ]
+        return sorted(chunks, key=lambda chunk: chunk.metadata.get("chunk_index", 0))
+    
+    def delete_document(self, document_id: int) -> int:
+        """Remove every chunk of one document; returns how many were removed"""
+        existing = self.collection.get(where={"document_id": document_id}, include=[])["ids"]
+        if existing:
+            self.collection.delete(ids=existing)
+        return len(existing)
+    
+    def approx_bytes(self) -> int:
+        return self.count() * APPROX_BYTES_PER_CHUNK
+
+
+class VectorStoreManager:
+    def __init__(self, persist_directory: Optional[str] = None, exact_index_directory: Optional[str] = None):
+        # Shards pass their own directories; a single store uses the configured ones
+        self.persist_directory = persist_directory or settings.chroma_persist_directory
+        self.exact_index_directory = exact_index_directory or settings.exact_index_directory
         
         # Ensure the directory exists
-        os.makedirs(settings.chroma_persist_directory, exist_ok=True)
+        os.makedirs(self.persist_directory, exist_ok=True)
+        
+        # Model serving queries, and the model being migrated to if a migration is under way
+        self.embedding_state = EmbeddingState.load(self.persist_directory, settings.embedding_model)
+        if self.embedding_state.active.model_name != settings.embedding_model:
+            target = self.embedding_state.target
+            if target is not None and target.model_name == settings.embedding_model:
+                print(
+                    f"⚠️  Collections are embedded with {self.embedding_state.active.model_name}; "
+                    f"queries use it until the migration to {settings.embedding_model} completes"
+                )
+            else:
+                print(
+                    f"⚠️  Collections are embedded with {self.embedding_state.active.model_name}; "
+                    f"migrate them to use {settings.embedding_model}"
+                )
+        # Load the active model up front so the first request doesn't pay for it
+        self.embedding_state.active.embeddings
+        
+        # Bounded cache of user-specific collection handles
+        self.user_collections = LRUCache(
+            maxsize=settings.vector_max_open_collections,
+            max_weight=settings.vector_collections_memory_mb * 1024 * 1024,
+            weigh=self._estimate_index_bytes,
+            on_evict=self._close_user_collection
+        )
+        # Handles for the migration target, kept apart so queries never see a half-built version
+        self.migration_collections = LRUCache(
+            maxsize=settings.vector_max_open_collections,
+            max_weight=settings.vector_collections_memory_mb * 1024 * 1024,
+            weigh=self._estimate_index_bytes,
+            on_evict=self._close_user_collection
+        )
+        
+        self.query_embeddings = query_embedding_cache
+        
+        # Serializes writes so promotion between backends never races an insert
+        self._write_lock = threading.Lock()
         
-        # Store user-specific collections
-        self.user_collections = {}
+        # Reads in flight per version suffix, so a cutover drops old storage only once they finish
+        self._readers: Dict[str, int] = {}
+        self._readers_changed = threading.Condition()
+        
+        # Bumped whenever a user's documents change, so cached answers can be invalidated
+        self.corpus_versions = {}
         
         # Initialize main vector store for backward compatibility
         self.vectorstore = Chroma(
-            persist_directory=settings.chroma_persist_directory,
+            persist_directory=self.persist_directory,
             embedding_function=self.embeddings,
-            client_settings=ChromaSettings(
-                anonymized_telemetry=False,
-                persist_directory=settings.chroma_persist_directory
-            )
+            client_settings=self._client_settings()
         )
         
         # Force persistence to ensure data is saved
         self.vectorstore.persist()
-        
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
+    
+    @property
+    def embeddings(self):
+        return self.embedding_state.active.embeddings
+    
+    @property
+    def embedding_model_name(self) -> str:
+        return self.embedding_state.active.model_name
+    
+    def _client_settings(self) -> ChromaSettings:
+        """Chroma client settings; every handle must use identical settings to share a client"""
+        return ChromaSettings(
+            anonymized_telemetry=False,
+            persist_directory=self.persist_directory,
+            # Let Chroma drop cold segments from memory under the same budget as our handle cache
+            chroma_segment_cache_policy="LRU",
+            chroma_memory_limit_bytes=settings.vector_collections_memory_mb * 1024 * 1024
         )
     
-    def _get_user_collection(self, user_id: int):
-        """Get or create a user-specific collection"""
-        if user_id not in self.user_collections:
-            # Create user-specific collection
-            user_collection_name = f"user_{user_id}_docs"
-            user_collection = Chroma(
-                collection_name=user_collection_name,
-                persist_directory=settings.chroma_persist_directory,
-                embedding_function=self.embeddings,
-                client_settings=ChromaSettings(
-                    anonymized_telemetry=False,
-                    persist_directory=settings.chroma_persist_directory
-                )
-            )
-            self.user_collections[user_id] = user_collection
-            print(f"✅ Created collection for user {user_id}: {user_collection_name}")
+    @staticmethod
+    def _estimate_index_bytes(user_index) -> int:
+        try:
+            return user_index.approx_bytes()
+        except Exception:
+            return 0
+    
+    @staticmethod
+    def _close_user_collection(user_id: int, user_collection):
+        """Release an evicted handle; Chroma writes are durable on add, so there is nothing to flush"""
+        print(f"♻️  Evicted collection handle for user {user_id}")
+    
+    def _exact_index_directory(self, user_id: int, version: EmbeddingVersion) -> str:
+        return os.path.join(self.exact_index_directory, f"user_{user_id}{version.suffix}")
+    
+    @staticmethod
+    def _collection_name(user_id: int, version: EmbeddingVersion) -> str:
+        return f"user_{user_id}_docs{version.suffix}"
+    
+    def _open_chroma_index(self, user_id: int, version: EmbeddingVersion) -> ChromaIndex:
+        # Create user-specific collection
+        user_collection_name = self._collection_name(user_id, version)
+        user_collection = Chroma(
+            collection_name=user_collection_name,
+            persist_directory=self.persist_directory,
+            embedding_function=version.embeddings,
+            client_settings=self._client_settings()
+        )
+        print(f"✅ Created collection for user {user_id}: {user_collection_name}")
+        return ChromaIndex(user_collection)
+    
+    def _has_chroma_collection(self, user_id: int, version: EmbeddingVersion) -> bool:
+        """Whether the user has a Chroma collection, without creating one"""
+        try:
+            self.vectorstore._client.get_collection(self._collection_name(user_id, version))
+        except (NotFoundError, ValueError):
+            return False
+        return True
+    
+    def _open_user_collection(self, user_id: int, version: EmbeddingVersion):
+        """Open the user's exact index if they are small enough, else their Chroma collection"""
+        with time_stage("vector_collection_open"):
+            if settings.vector_index_backend == "auto":
+                exact_directory = self._exact_index_directory(user_id, version)
+                # New tenants start on the exact index, which creates nothing until the first write
+                if ExactIndex.exists(exact_directory) or not self._has_chroma_collection(user_id, version):
+                    return ExactIndex(exact_directory)
+                chroma_index = self._open_chroma_index(user_id, version)
+                if chroma_index.count() == 0:
+                    return ExactIndex(exact_directory)
+                return chroma_index
+            return self._open_chroma_index(user_id, version)
+    
+    def _collection_cache(self, version: EmbeddingVersion) -> Optional[LRUCache]:
+        if version is self.embedding_state.active:
+            return self.user_collections
+        if version is self.embedding_state.target:
+            return self.migration_collections
+        return None  # retired by a cutover; only reads that started before it still use it
+    
+    def _get_user_collection(self, user_id: int, version: Optional[EmbeddingVersion] = None):
+        """Get or create a user-specific collection, for the active model unless told otherwise"""
+        version = version or self.embedding_state.active
+        cache = self._collection_cache(version)
+        if cache is None:
+            return self._open_user_collection(user_id, version)
+        # Concurrent first requests for a user open the collection only once
+        return cache.get_or_create(user_id, lambda: self._open_user_collection(user_id, version))
+    
+    @contextmanager
+    def _reading(self):
+        """Pin the active version for one read, so its embeddings and collections come from the same model"""
+        with self._readers_changed:
+            version = self.embedding_state.active
+            self._readers[version.suffix] = self._readers.get(version.suffix, 0) + 1
+        try:
+            yield version
+        finally:
+            with self._readers_changed:
+                self._readers[version.suffix] -= 1
+                if not self._readers[version.suffix]:
+                    del self._readers[version.suffix]
+                self._readers_changed.notify_all()
+    
+    def _maybe_promote(self, user_id: int, user_index, version: EmbeddingVersion):
+        """Move a tenant that outgrew the exact index into an HNSW-backed Chroma collection"""
+        if not isinstance(user_index, ExactIndex) or user_index.count() <= settings.exact_index_max_chunks:
+            return user_index
+        
+        with time_stage("vector_index_promote"):
+            chroma_index = self._open_chroma_index(user_id, version)
+            # Copy stored vectors across so nothing is embedded twice
+            for offset in range(0, user_index.count(), PROMOTION_BATCH_SIZE):
+                batch = user_index.get(offset=offset, limit=PROMOTION_BATCH_SIZE, include_embeddings=True)
+                chroma_index.add(batch["ids"], batch["embeddings"], batch["documents"], batch["metadatas"])
+            user_index.destroy()
         
-        return self.user_collections[user_id]
+        print(f"✅ Promoted user {user_id} to an ANN collection ({chroma_index.count()} chunks)")
+        return chroma_index
     
-    def add_documents(self, documents: List[Dict[str, Any]], user_id: int) -> List[str]:
-        """Add documents to the vector store with user isolation"""
+    def count_tokens(self, texts: List[str], version: Optional[EmbeddingVersion] = None) -> List[int]:
+        """Token counts from the embedding model's own tokenizer, in one batch"""
+        if not texts:
+            return []
+        embeddings = (version or self.embedding_state.active).embeddings
+        encoded = embeddings.client.tokenizer(list(texts), add_special_tokens=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+    
+    def _get_chunker(
+        self,
+        chunking: Optional[Dict[str, Any]] = None,
+        version: Optional[EmbeddingVersion] = None
+    ) -> TokenChunker:
+        """Chunker for a tenant's settings, capped so no chunk is truncated by the model"""
+        version = version or self.embedding_state.active
+        config = {
+            "chunk_tokens": settings.chunk_tokens,
+            "overlap_tokens": settings.chunk_overlap_tokens,
+            "respect_pages": True,
+            **(chunking or {})
+        }
+        # Leave room for the [CLS] and [SEP] tokens the model adds
+        max_tokens = version.embeddings.client.max_seq_length - 2
+        return TokenChunker(
+            chunk_tokens=min(config["chunk_tokens"], max_tokens),
+            overlap_tokens=config["overlap_tokens"],
+            respect_pages=config["respect_pages"],
+            count_tokens=lambda texts: self.count_tokens(texts, version)
+        )
+    
+    def _index_into(
+        self,
+        version: EmbeddingVersion,
+        documents: List[Dict[str, Any]],
+        user_id: int,
+        chunking: Optional[Dict[str, Any]] = None,
+        replace: bool = False
+    ) -> Dict[str, Any]:
+        """Chunk, embed and store documents in one model version's collection"""
+        chunker = self._get_chunker(chunking, version)
         processed_docs = []
+        document_stats = {}
         
         for doc in documents:
-            # Split text into chunks
-            chunks = self.text_splitter.split_text(doc['content'])
+            # Split text into token-sized chunks along sentence and page boundaries
+            with time_stage("chunk_split"):
+                chunks = chunker.split(doc['content'])
+            
+            document_stats[doc['id']] = {
+                "chunks": len(chunks),
+                "avg_tokens": round(sum(c.token_count for c in chunks) / len(chunks), 1) if chunks else 0.0
+            }
             
             # Create documents with metadata
             for i, chunk in enumerate(chunks):
                 processed_docs.append(
                     Document(
-                        page_content=chunk,
+                        page_content=chunk.text,
                         metadata={
                             'user_id': user_id,
                             'document_id': doc['id'],
                             'filename': doc['filename'],
                             'chunk_index': i,
+                            'page': chunk.page,
+                            'token_count': chunk.token_count,
                             'source': f"{doc['filename']}_chunk_{i}"
                         }
                     )
                 )
         
-        # Get user-specific collection
-        user_collection = self._get_user_collection(user_id)
+        if not processed_docs:
+            return {"ids": [], "documents": document_stats}
         
-        # Add to user-specific collection
-        ids = user_collection.add_documents(processed_docs)
-        user_collection.persist()
+        texts = [doc.page_content for doc in processed_docs]
+        metadatas = [doc.metadata for doc in processed_docs]
+        ids = [str(uuid.uuid4()) for _ in processed_docs]
         
-        print(f"✅ Added {len(processed_docs)} chunks to user {user_id} collection")
+        with time_stage("embed_documents"):
+            embeddings = version.embeddings.embed_documents(texts)
         
-        return ids
-    
-    def similarity_search(self, query: str, user_id: int, k: int = 4) -> List[Document]:
-        """Search for similar documents, filtered by user_id"""
-        try:
+        with self._write_lock:
             # Get user-specific collection
-            user_collection = self._get_user_collection(user_id)
+            user_collection = self._get_user_collection(user_id, version)
             
-            # Force persistence before search to ensure latest data
-            user_collection.persist()
+            # Replacing makes re-indexing idempotent when a document is written twice
+            if replace:
+                for doc in documents:
+                    user_collection.delete_document(doc['id'])
             
-            # Search in user-specific collection (no need for user_id filter since it's isolated)
-            results = user_collection.similarity_search(
-                query,
-                k=k
-            )
+            with time_stage("vector_add"):
+                user_collection.add(ids, embeddings, texts, metadatas)
+            user_collection = self._maybe_promote(user_id, user_collection, version)
+            
+            # Re-insert so the handle's memory estimate reflects the new chunks
+            cache = self._collection_cache(version)
+            if cache is not None:
+                cache.set(user_id, user_collection)
+        
+        return {"ids": ids, "documents": document_stats}
+    
+    def index_documents(
+        self,
+        documents: List[Dict[str, Any]],
+        user_id: int,
+        chunking: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Chunk, embed and store documents; returns chunk ids and per-document chunk stats"""
+        active = self.embedding_state.active
+        result = self._index_into(active, documents, user_id, chunking)
+        
+        # Keep an in-progress migration target in step with new uploads
+        target = self.embedding_state.target
+        if active is not self.embedding_state.active:
+            # A cutover finished while this upload was embedding; the version now serving queries needs it too
+            result = self._index_into(self.embedding_state.active, documents, user_id, chunking, replace=True)
+        elif target is not None:
+            self._index_into(target, documents, user_id, chunking, replace=True)
+        
+        if result["ids"]:
+            DOCUMENT_CHUNKS.inc(len(result["ids"]))
+            self.corpus_versions[user_id] = self.corpus_versions.get(user_id, 0) + 1
+            print(f"✅ Added {len(result['ids'])} chunks to user {user_id} collection")
+        
+        return result
+    
+    def add_documents(self, documents: List[Dict[str, Any]], user_id: int) -> List[str]:
+        """Add documents to the vector store with user isolation"""
+        return self.index_documents(documents, user_id)["ids"]
+    
+    def delete_document_chunks(self, document_id: int, user_id: int) -> int:
+        """Remove one document's chunks from the user's collection"""
+        with self._write_lock:
+            user_collection = self._get_user_collection(user_id)
+            with time_stage("vector_delete"):
+                removed = user_collection.delete_document(document_id)
+            self.user_collections.set(user_id, user_collection)
+            
+            target = self.embedding_state.target
+            if target is not None:
+                target_collection = self._get_user_collection(user_id, target)
+                target_collection.delete_document(document_id)
+                self.migration_collections.set(user_id, target_collection)
+        if removed:
+            self.corpus_versions[user_id] = self.corpus_versions.get(user_id, 0) + 1
+        return removed
+    
+    def rechunk_document(
+        self,
+        document: Dict[str, Any],
+        user_id: int,
+        chunking: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Replace a document's chunks with ones cut under the given chunking settings"""
+        self.delete_document_chunks(document['id'], user_id)
+        return self.index_documents([document], user_id, chunking)["documents"][document['id']]
+    
+    def similarity_search(
+        self,
+        query: str,
+        user_id: int,
+        k: Optional[int] = None,
+        document_ids: Optional[List[int]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Best-first (document, cosine similarity) pairs for the user, optionally within some documents.
+
+        Without an explicit k, up to RETRIEVAL_MAX_K chunks are fetched and cut adaptively.
+        """
+        try:
+            with self._reading() as version:
+                # Get user-specific collection
+                user_collection = self._get_user_collection(user_id, version)
+                
+                # Embed the query separately so its cost shows up apart from the search itself
+                with time_stage("embed_query"):
+                    query_embedding = self.embed_queries([query], version)[0]
+                
+                # Search in user-specific collection (no need for user_id filter since it's isolated)
+                with time_stage("vector_search"):
+                    results = user_collection.search(query_embedding, k or settings.retrieval_max_k, document_ids)
             
-            return results
+            return results if k else trim_results(results)
         except Exception as e:
             print(f"Error in similarity search for user {user_id}: {e}")
             return []
     
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a question, reusing the vector of an earlier identical question"""
+        return self.embed_queries([query])[0]
+    
+    def embed_queries(self, queries: List[str], version: Optional[EmbeddingVersion] = None) -> List[List[float]]:
+        """Embed questions, taking cached vectors where possible and batching the rest"""
+        version = version or self.embedding_state.active
+        model = version.model_name
+        keys = [(model, normalize_question(query)) for query in queries]
+        embeddings = [self.query_embeddings.get(key) for key in keys]
+        
+        # Distinct uncached questions, embedded together in one model call
+        missing = {}
+        for key, query, embedding in zip(keys, queries, embeddings):
+            if embedding is None:
+                missing.setdefault(key, query)
+        QUERY_EMBEDDING_CACHE.inc(len(queries) - embeddings.count(None), outcome="hit")
+        QUERY_EMBEDDING_CACHE.inc(embeddings.count(None), outcome="miss")
+        
+        if missing:
+            if len(missing) == 1:
+                computed = [version.embeddings.embed_query(next(iter(missing.values())))]
+            else:
+                computed = version.embeddings.embed_documents(list(missing.values()))
+            for key, embedding in zip(missing, computed):
+                self.query_embeddings.set(key, embedding)
+            by_key = dict(zip(missing, computed))
+            embeddings = [
+                embedding if embedding is not None else by_key[key]
+                for key, embedding in zip(keys, embeddings)
+            ]
+        return embeddings
+    
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embed arbitrary passages in one model call, bypassing the question cache"""
+        with time_stage("embed_texts"):
+            return self.embeddings.embed_documents(texts)
+    
+    def similarity_search_batch(
+        self,
+        queries: List[str],
+        user_id: int,
+        k: Optional[int] = None,
+        document_ids: Optional[List[int]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Search for several questions at once: one embedding batch and one index query"""
+        with self._reading() as version:
+            user_collection = self._get_user_collection(user_id, version)
+            
+            with time_stage("embed_query"):
+                query_embeddings = self.embed_queries(queries, version)
+            
+            with time_stage("vector_search"):
+                results = user_collection.search_many(query_embeddings, k or settings.retrieval_max_k, document_ids)
+        
+        return results if k else [trim_results(result) for result in results]
+    
+    def warm_query_embeddings(self, questions: List[str]) -> int:
+        """Embed questions that are not cached yet in one batch; returns how many were added"""
+        version = self.embedding_state.active
+        model = version.model_name
+        pending = {}
+        for question in questions:
+            key = (model, normalize_question(question))
+            if key not in self.query_embeddings and key not in pending:
+                pending[key] = question
+        if not pending:
+            return 0
+        
+        with time_stage("embed_query_warmup"):
+            embeddings = version.embeddings.embed_documents(list(pending.values()))
+        for key, embedding in zip(pending, embeddings):
+            self.query_embeddings.set(key, embedding)
+        return len(pending)
+    
+    def get_corpus_version(self, user_id: int) -> int:
+        """Return a counter that changes whenever the user's indexed documents change"""
+        return self.corpus_versions.get(user_id, 0)
+    
     def has_documents_for_user(self, user_id: int) -> bool:
         """Check if user has any documents in the vector store"""
         try:
-            # Get user-specific collection
-            user_collection = self._get_user_collection(user_id)
+            # A count is enough; no need to embed a probe query
+            with self._reading() as version, time_stage("vector_probe"):
+                has_docs = self._get_user_collection(user_id, version).count() > 0
             
-            # Force persistence to ensure latest data
-            user_collection.persist()
-            
-            # Try to get at least one document from the user's collection
-            results = user_collection.similarity_search(
-                "test",  # Any query will do
-                k=1
-            )
-            
-            has_docs = len(results) > 0
             print(f"User {user_id} has documents: {has_docs}")
             return has_docs
             
@@ -141,19 +583,18 @@ class VectorStoreManager:
     def reload_vectorstore(self):
         """Force reload the vector store from disk"""
         try:
-            # Clear user collections cache
-            self.user_collections = {}
-            
-            # Reinitialize the main vector store
-            self.vectorstore = Chroma(
-                persist_directory=settings.chroma_persist_directory,
-                embedding_function=self.embeddings,
-                client_settings=ChromaSettings(
-                    anonymized_telemetry=False,
-                    persist_directory=settings.chroma_persist_directory
+            with self._write_lock:
+                # Clear user collections cache
+                self.user_collections.clear()
+                self.migration_collections.clear()
+                
+                # Reinitialize the main vector store
+                self.vectorstore = Chroma(
+                    persist_directory=self.persist_directory,
+                    embedding_function=self.embeddings,
+                    client_settings=self._client_settings()
                 )
-            )
-            self.vectorstore.persist()
+                self.vectorstore.persist()
             print("✅ Vector store reloaded successfully")
         except Exception as e:
             print(f"❌ Error reloading vector store: {e}")
@@ -161,17 +602,21 @@ class VectorStoreManager:
     def get_user_collection_info(self, user_id: int) -> dict:
         """Get information about a user's collection"""
         try:
-            user_collection = self._get_user_collection(user_id)
-            
-            # Try to get some sample documents
-            sample_docs = user_collection.similarity_search("test", k=5)
+            with self._reading() as version:
+                user_collection = self._get_user_collection(user_id, version)
+                
+                # Try to get some sample documents
+                document_count = user_collection.count()
+                samples = user_collection.get(limit=3)
             
             return {
                 "user_id": user_id,
                 "collection_name": f"user_{user_id}_docs",
-                "document_count": len(sample_docs),
-                "sample_sources": [doc.metadata.get('source', 'Unknown') for doc in sample_docs[:3]],
-                "has_documents": len(sample_docs) > 0
+                "index_backend": "exact" if isinstance(user_collection, ExactIndex) else "chroma",
+                "embedding_model": version.model_name,
+                "document_count": document_count,
+                "sample_sources": [metadata.get('source', 'Unknown') for metadata in samples["metadatas"]],
+                "has_documents": document_count > 0
             }
         except Exception as e:
             return {
@@ -180,23 +625,178 @@ class VectorStoreManager:
                 "has_documents": False
             }
     
+    def collection_stats(self) -> dict:
+        """Summary of the collection handles held by this process"""
+        return {
+            "total_user_collections": len(self.user_collections),
+            "collection_cache": self.user_collections.stats(),
+            "query_embedding_cache": self.query_embeddings.stats(),
+            "embedding_models": self.get_migration_status()
+        }
+    
+    def _drop_user_storage(self, user_id: int, version: EmbeddingVersion):
+        """Remove a user's collection and exact index for one model version"""
+        try:
+            self.vectorstore._client.delete_collection(self._collection_name(user_id, version))
+        except Exception:
+            pass  # the user never had a Chroma collection under this version
+        shutil.rmtree(self._exact_index_directory(user_id, version), ignore_errors=True)
+    
     def delete_user_documents(self, user_id: int):
-        """Delete all documents for a specific user"""
-        # This is a simplified approach - in production you might want more sophisticated deletion
-        # For now, we'll rely on the filter in similarity_search to isolate users
-        pass
-    
-    def get_document_chunks(self, document_id: int, user_id: int) -> List[Document]:
-        """Get all chunks for a specific document"""
-        filter_dict = {
-            "user_id": user_id,
-            "document_id": document_id
+        """Delete all of a user's indexed chunks, e.g. after moving them to another shard"""
+        with self._write_lock:
+            self.user_collections.pop(user_id)
+            self.migration_collections.pop(user_id)
+            for version in (self.embedding_state.active, self.embedding_state.target):
+                if version is not None:
+                    self._drop_user_storage(user_id, version)
+        self.corpus_versions[user_id] = self.corpus_versions.get(user_id, 0) + 1
+    
+    def get_migration_status(self) -> Dict[str, Optional[str]]:
+        target = self.embedding_state.target
+        return {
+            "active_model": self.embedding_state.active.model_name,
+            "target_model": target.model_name if target else None
         }
+    
+    def begin_migration(self, model_name: str) -> Dict[str, Optional[str]]:
+        """Start dual-writing to a collection version for a new embedding model"""
+        state = self.embedding_state
+        if model_name == state.active.model_name:
+            raise ValueError(f"{model_name} is already the active embedding model")
+        if state.target is not None and state.target.model_name != model_name:
+            raise ValueError(f"A migration to {state.target.model_name} is already in progress")
+        
+        if state.target is None:
+            target = EmbeddingVersion(model_name, version_suffix(model_name))
+            # Fail now, not halfway through, if the model cannot be loaded
+            target.embeddings
+            with self._write_lock:
+                state.target = target
+                state.save()
+        print(f"🔁 Migrating embeddings from {state.active.model_name} to {model_name}")
+        return self.get_migration_status()
+    
+    def migrate_document(
+        self,
+        document: Dict[str, Any],
+        user_id: int,
+        chunking: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Re-embed one document into the migration target; safe to repeat"""
+        target = self.embedding_state.target
+        if target is None:
+            raise ValueError("No embedding model migration is in progress")
+        result = self._index_into(target, [document], user_id, chunking, replace=True)
+        return result["documents"][document['id']]
+    
+    def complete_migration(self, user_ids: List[int]) -> Dict[str, Optional[str]]:
+        """Switch queries to the migrated version in one step, then drop the old collections"""
+        state = self.embedding_state
+        if state.target is None:
+            raise ValueError("No embedding model migration is in progress")
         
-        # This would require a more sophisticated query in a real implementation
-        # For now, we'll return empty list as this is not critical for the demo
-        return []
+        with self._write_lock, self._readers_changed:
+            previous = state.active
+            state.active, state.target = state.target, None
+            state.save()
+            # Handles are reopened lazily under the new version
+            self.user_collections.clear()
+            self.migration_collections.clear()
+            for user_id in user_ids:
+                self.corpus_versions[user_id] = self.corpus_versions.get(user_id, 0) + 1
+        print(f"✅ Switched embeddings to {state.active.model_name}")
+        
+        with time_stage("vector_migration_cleanup"):
+            # Reads that started before the switch still search the old collections
+            with self._readers_changed:
+                self._readers_changed.wait_for(lambda: not self._readers.get(previous.suffix))
+            for user_id in user_ids:
+                self._drop_user_storage(user_id, previous)
+        return self.get_migration_status()
+    
+    def get_embedding_model(self) -> str:
+        """Name of the model that produced the stored vectors"""
+        return self.embedding_model_name
+    
+    def get_embedding_dimension(self) -> int:
+        """Length of the vectors the active model produces"""
+        return self.embedding_state.active.embeddings.client.get_sentence_embedding_dimension()
+    
+    def get_user_chunks(
+        self,
+        user_id: int,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        include_embeddings: bool = False
+    ) -> Dict[str, Any]:
+        """One page of a user's raw chunks: ids, texts, metadata and optionally vectors"""
+        with self._reading() as version:
+            user_collection = self._get_user_collection(user_id, version)
+            return user_collection.get(offset=offset, limit=limit, include_embeddings=include_embeddings)
+    
+    def import_chunks(
+        self,
+        user_id: int,
+        ids: List[str],
+        embeddings: List[List[float]],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> int:
+        """Bulk-load chunks whose vectors were already computed, e.g. from a snapshot"""
+        if not ids:
+            return 0
+        if self.embedding_state.target is not None:
+            raise RuntimeError("An embedding model migration is in progress; import after it completes")
+        with self._write_lock:
+            user_collection = self._get_user_collection(user_id)
+            with time_stage("vector_add"):
+                user_collection.add(ids, embeddings, texts, metadatas)
+            user_collection = self._maybe_promote(user_id, user_collection, self.embedding_state.active)
+            self.user_collections.set(user_id, user_collection)
+        
+        DOCUMENT_CHUNKS.inc(len(ids))
+        self.corpus_versions[user_id] = self.corpus_versions.get(user_id, 0) + 1
+        return len(ids)
+    
+    def get_document_chunks(self, document_id: int, user_id: int, offset: int = 0, limit: int = 50) -> List[Document]:
+        """Get one page of a document's chunks, ordered by chunk_index"""
+        with self._reading() as version, time_stage("vector_get_chunks"):
+            return self._get_user_collection(user_id, version).get_document_chunks(document_id, offset, limit)
+
+
+def create_vector_store_manager():
+    """Embedded manager, or a client for the shared sidecar when running several workers"""
+    if settings.vector_shards > 1:
+        from app.sharding import ShardedVectorStore, create_shard_backend
+        return ShardedVectorStore([
+            create_shard_backend(shard, settings.vector_shards) for shard in range(settings.vector_shards)
+        ])
+    if settings.vector_store_mode == "sidecar":
+        from app.vector_service import VectorStoreClient
+        return VectorStoreClient()
+    return VectorStoreManager()
+
+
+class LazyVectorStore:
+    """Builds the configured store on first use, so importing this module loads no model"""
+    
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+    
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+    
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
 
 
-# Global instance
-vector_store_manager = VectorStoreManager() 
\ No newline at end of file
+# Global instance; the vector store sidecar imports this module but never uses it
+vector_store_manager = LazyVectorStore(create_vector_store_manager)
+ 
\ No newline at end of file
@@ -0,0 +1,53 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.coalescing import normalize_question
+from app.database import SessionLocal
+from app.models import QueryLog
+from app.vector_store import vector_store_manager
+
+
+def frequent_recent_questions(db: Session, days: int, per_user: int) -> List[str]:
+    """Each user's most frequently asked questions over the last `days` days"""
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    rows = (
+        db.query(QueryLog.user_id, QueryLog.question, func.count(QueryLog.id).label("asked"))
+        .filter(QueryLog.timestamp >= since)
+        .group_by(QueryLog.user_id, QueryLog.question)
+        .all()
+    )
+
+    # Spellings that normalize alike count as one question
+    counts: Dict[int, Dict[str, list]] = {}
+    for user_id, question, asked in rows:
+        entry = counts.setdefault(user_id, {}).setdefault(normalize_question(question), [question, 0])
+        entry[1] += asked
+
+    questions = []
+    for per_question in counts.values():
+        ranked = sorted(per_question.values(), key=lambda entry: entry[1], reverse=True)
+        questions.extend(question for question, _ in ranked[:per_user])
+    return questions
+
+
+def warm_query_embedding_cache():
+    """Pre-compute embeddings for the questions users are most likely to ask again"""
+    db = SessionLocal()
+    try:
+        questions = frequent_recent_questions(
+            db, settings.query_embedding_warm_days, settings.query_embedding_warm_per_user
+        )
+        warmed = vector_store_manager.warm_query_embeddings(questions)
+        print(f"✅ Pre-warmed {warmed} query embeddings")
+    except Exception as e:
+        print(f"❌ Query embedding warm-up failed: {e}")
+    finally:
+        db.close()
+
+
+def start_query_embedding_warmup():
+    # In the background so startup is not held up by embedding
+    threading.Thread(target=warm_query_embedding_cache, name="query-embedding-warmup", daemon=True).start()
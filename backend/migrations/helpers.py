@@ -0,0 +1,40 @@
+"""Shared steps for the schema revisions.
+
+Tables are still created by `Base.metadata.create_all` at startup, so a fresh
+database already has every column while an older one lacks the columns added
+since it was created. Revisions therefore only add what is missing, and skip
+tables that do not exist yet (create_all will make them whole).
+"""
+from typing import List
+import sqlalchemy as sa
+from alembic import op
+
+
+def add_missing_columns(table: str, columns: List[sa.Column], indexes: List[str] = ()):
+    """Add the columns (and single-column indexes on them) that `table` does not have yet"""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return
+    existing = {column["name"] for column in inspector.get_columns(table)}
+    for column in columns:
+        if column.name not in existing:
+            op.add_column(table, column)
+    existing_indexes = {index["name"] for index in inspector.get_indexes(table)}
+    for column_name in indexes:
+        name = f"ix_{table}_{column_name}"
+        if name not in existing_indexes:
+            op.create_index(name, table, [column_name])
+
+
+def drop_columns(table: str, names: List[str]):
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return
+    existing = {column["name"] for column in inspector.get_columns(table)}
+    for index in inspector.get_indexes(table):
+        if set(index["column_names"]) & set(names):
+            op.drop_index(index["name"], table_name=table)
+    with op.batch_alter_table(table) as batch:
+        for name in names:
+            if name in existing:
+                batch.drop_column(name)
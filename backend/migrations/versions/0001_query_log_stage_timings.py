@@ -0,0 +1,21 @@
+"""Add query_logs.stage_timings
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+from migrations.helpers import add_missing_columns, drop_columns
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_missing_columns("query_logs", [sa.Column("stage_timings", sa.Text())])
+
+
+def downgrade():
+    drop_columns("query_logs", ["stage_timings"])
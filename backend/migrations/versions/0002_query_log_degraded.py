@@ -0,0 +1,21 @@
+"""Add query_logs.degraded
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+from migrations.helpers import add_missing_columns, drop_columns
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_missing_columns("query_logs", [sa.Column("degraded", sa.Boolean())])
+
+
+def downgrade():
+    drop_columns("query_logs", ["degraded"])
@@ -0,0 +1,26 @@
+"""Add per-tenant chunking settings and per-document chunk stats
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+from migrations.helpers import add_missing_columns, drop_columns
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_missing_columns("users", [sa.Column("chunking_config", sa.Text())])
+    add_missing_columns("documents", [
+        sa.Column("chunk_count", sa.Integer()),
+        sa.Column("avg_chunk_tokens", sa.Float())
+    ])
+
+
+def downgrade():
+    drop_columns("documents", ["chunk_count", "avg_chunk_tokens"])
+    drop_columns("users", ["chunking_config"])
@@ -0,0 +1,21 @@
+"""Add documents.content_hash
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+from migrations.helpers import add_missing_columns, drop_columns
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_missing_columns("documents", [sa.Column("content_hash", sa.String())], indexes=["content_hash"])
+
+
+def downgrade():
+    drop_columns("documents", ["content_hash"])
@@ -0,0 +1,25 @@
+"""Add query_logs.cache_hit and query_logs.prompt_tokens
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+from migrations.helpers import add_missing_columns, drop_columns
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # query_rollups is a new table, so create_all makes it at startup
+    add_missing_columns("query_logs", [
+        sa.Column("cache_hit", sa.Boolean()),
+        sa.Column("prompt_tokens", sa.Integer())
+    ])
+
+
+def downgrade():
+    drop_columns("query_logs", ["cache_hit", "prompt_tokens"])
@@ -0,0 +1,100 @@
+import threading
+import time
+import pytest
+from app.admission import AdmissionController, AdmissionRejected, Priority, TokenBucket
+
+
+def make_controller(**overrides):
+    options = dict(
+        max_concurrent=1,
+        max_per_user=1,
+        max_queued_per_user=4,
+        requests_per_minute=6000,
+        burst=10,
+        queue_timeout=5.0
+    )
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+def test_token_bucket_reports_wait_when_empty():
+    bucket = TokenBucket(rate=1.0, capacity=1)
+    now = time.monotonic()
+    assert bucket.try_acquire(now) == 0.0
+    assert bucket.try_acquire(now) == pytest.approx(1.0, abs=0.01)
+
+
+def test_per_user_queue_limit_rejects_with_429():
+    controller = make_controller(max_queued_per_user=0)
+    with pytest.raises(AdmissionRejected) as exc_info:
+        with controller.admit(user_id=1):
+            pass
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.retry_after >= 1
+
+
+def test_deadline_rejects_queued_call_with_503():
+    controller = make_controller()
+    with controller.admit(user_id=1):
+        with pytest.raises(AdmissionRejected) as exc_info:
+            with controller.admit(user_id=2, deadline=time.monotonic() + 0.05):
+                pass
+    assert exc_info.value.status_code == 503
+    assert controller.stats()["queued"] == 0
+
+
+def test_rate_limit_rejects_when_token_arrives_after_deadline():
+    controller = make_controller(requests_per_minute=1, burst=1)
+    with controller.admit(user_id=1):
+        pass
+    with pytest.raises(AdmissionRejected) as exc_info:
+        with controller.admit(user_id=1, deadline=time.monotonic() + 1):
+            pass
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.retry_after > 1
+
+
+def test_interactive_calls_are_admitted_before_bulk():
+    controller = make_controller(max_per_user=10)
+    order = []
+    holder_ready = threading.Event()
+    release_holder = threading.Event()
+
+    def holder():
+        with controller.admit(user_id=0):
+            holder_ready.set()
+            release_holder.wait()
+
+    def worker(name, priority):
+        with controller.admit(user_id=None, priority=priority):
+            order.append(name)
+
+    threads = [threading.Thread(target=holder)]
+    threads[0].start()
+    holder_ready.wait()
+    for name, priority in [("bulk", Priority.BULK), ("interactive", Priority.INTERACTIVE)]:
+        thread = threading.Thread(target=worker, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.05)
+    release_holder.set()
+    for thread in threads:
+        thread.join()
+
+    assert order == ["interactive", "bulk"]
+
+
+def test_slot_taken_in_one_thread_covers_calls_in_another():
+    controller = make_controller()
+    admitted_at = controller.acquire(user_id=1)
+
+    def generate():
+        with controller.holding(user_id=1, admitted_at=admitted_at):
+            # Admitted already, so this must not queue behind its own slot
+            with controller.admit(user_id=1, deadline=time.monotonic() + 0.05):
+                pass
+
+    thread = threading.Thread(target=generate)
+    thread.start()
+    thread.join()
+    assert controller.stats()["active"] == 0
@@ -0,0 +1,46 @@
+import pytest
+from app.chunking import PAGE_BREAK, TokenChunker, split_sentences
+from app.schemas import ChunkingConfig
+
+
+def test_split_sentences_keeps_punctuation():
+    text = "First sentence. Second one? Third!\n\nNew paragraph"
+    assert split_sentences(text) == ["First sentence.", "Second one?", "Third!", "New paragraph"]
+
+
+def test_chunks_stay_within_budget_and_end_on_sentences():
+    text = " ".join(f"Sentence number {i} has five words." for i in range(20))
+    chunker = TokenChunker(chunk_tokens=20, overlap_tokens=6)
+
+    chunks = chunker.split(text)
+
+    assert len(chunks) > 1
+    assert all(chunk.token_count <= 20 for chunk in chunks)
+    assert all(chunk.text.endswith(".") for chunk in chunks)
+    # The last sentence of a chunk is repeated at the start of the next one
+    assert chunks[1].text.startswith(split_sentences(chunks[0].text)[-1])
+
+
+def test_chunks_do_not_cross_page_breaks():
+    text = "Page one text." + PAGE_BREAK + "Page two text." + PAGE_BREAK + "Page three text."
+
+    chunks = TokenChunker(chunk_tokens=100, overlap_tokens=0).split(text)
+    assert [(chunk.page, chunk.text) for chunk in chunks] == [
+        (0, "Page one text."), (1, "Page two text."), (2, "Page three text.")
+    ]
+
+    merged = TokenChunker(chunk_tokens=100, overlap_tokens=0, respect_pages=False).split(text)
+    assert len(merged) == 1
+
+
+def test_long_sentence_is_split_on_words():
+    text = " ".join(["word"] * 25)
+
+    chunks = TokenChunker(chunk_tokens=10, overlap_tokens=0).split(text)
+
+    assert [chunk.token_count for chunk in chunks] == [10, 10, 5]
+
+
+def test_chunking_config_rejects_overlap_not_smaller_than_chunk():
+    with pytest.raises(ValueError):
+        ChunkingConfig(chunk_tokens=64, overlap_tokens=64)
@@ -0,0 +1,101 @@
+import asyncio
+from app.coalescing import SingleFlight, normalize_question
+from app.metrics import current_stage_timings, start_stage_collection, time_stage
+
+
+def test_normalize_question():
+    assert normalize_question("  What is   the Policy? ") == "what is the policy"
+    assert normalize_question("what is the policy") == "what is the policy"
+
+
+def test_concurrent_identical_calls_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(*[flight.do("key", compute) for _ in range(5)])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["answer"] * 5
+    assert sum(shared for _, shared in results) == 4
+
+
+def test_followers_receive_leader_error():
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(
+            flight.do("key", compute), flight.do("key", compute), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_sequential_calls_are_not_coalesced():
+    async def run():
+        flight = SingleFlight()
+
+        async def compute():
+            return 1
+
+        first = await flight.do("key", compute)
+        second = await flight.do("key", compute)
+        return first, second, flight.inflight_count()
+
+    first, second, inflight = asyncio.run(run())
+    assert first == (1, False)
+    assert second == (1, False)
+    assert inflight == 0
+
+
+def test_cancelled_leader_does_not_fail_followers():
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        flight = SingleFlight()
+        leader = asyncio.ensure_future(flight.do("key", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("key", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader.cancelled()
+
+    (result, shared), leader_cancelled = asyncio.run(run())
+    assert leader_cancelled
+    assert result == "answer"
+    assert shared
+
+
+def test_follower_timings_hold_only_its_own_wait():
+    async def compute():
+        with time_stage("llm_call"):
+            await asyncio.sleep(0.05)
+        return "answer"
+
+    async def ask(flight):
+        # Each request collects its own breakdown, as the metrics middleware does
+        start_stage_collection()
+        _, shared = await flight.do("key", compute)
+        return shared, current_stage_timings()
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(ask(flight), ask(flight))
+
+    (leader_shared, leader_timings), (follower_shared, follower_timings) = asyncio.run(run())
+    assert not leader_shared and follower_shared
+    assert set(leader_timings) == {"llm_call"}
+    assert set(follower_timings) == {"coalesced_wait"}
+    assert follower_timings["coalesced_wait"] >= 0.04
@@ -0,0 +1,50 @@
+from langchain.schema import Document
+from app.conversations import (
+    ConversationSession, Turn, can_reuse_results, condense_history, history_digest, is_on_topic, retrieval_query
+)
+
+
+CHUNKS = [(Document(page_content="Plans: the Basic plan costs 10 dollars and the Pro plan costs 30 dollars.", metadata={}), 0.6)]
+
+
+def _session():
+    session = ConversationSession(max_turns=5)
+    session.add_turn("What plans do you offer?", "Basic and Pro.", CHUNKS, None, 1)
+    return session
+
+
+def test_history_keeps_recent_turns_in_order_within_budget():
+    turns = [Turn("first question here", "first answer here"), Turn("second question here", "second answer here")]
+
+    # 3 tokens for the question leave room for the newest turn only
+    history = condense_history(turns, "and the price?", budget=9)
+    assert history == [("second question here", "second answer here")]
+    assert condense_history(turns, "and the price?", budget=15) == [
+        ("first question here", "first answer here"), ("second question here", "second answer here")
+    ]
+
+    assert condense_history(turns, "and the price?", budget=5) == [("second question", "")]
+    assert condense_history([], "standalone?", budget=5) == []
+
+
+def test_retrieval_query_carries_the_history_but_the_question_stays_as_asked():
+    history = [("Summarize the Q3 report", "Revenue grew.")]
+    query = retrieval_query(history, "Who is the author?")
+    assert query.startswith("Earlier in this conversation:\nSummarize the Q3 report\nRevenue grew.")
+    assert query.endswith("Current question: Who is the author?")
+    assert retrieval_query([], "Who is the author?") == "Who is the author?"
+    assert history_digest(history) != history_digest([])
+
+
+def test_follow_ups_that_refer_back_or_overlap_are_on_topic():
+    session = _session()
+    assert is_on_topic(session, "What about the second one?", 0.2)
+    assert is_on_topic(session, "How much does the Pro plan cost?", 0.2)
+    assert not is_on_topic(session, "Where is your office located in Berlin?", 0.2)
+
+
+def test_results_are_not_reused_across_scope_or_corpus_changes():
+    session = _session()
+    assert can_reuse_results(session, "And the second one?", None, 1)
+    assert not can_reuse_results(session, "And the second one?", (3,), 1)
+    assert not can_reuse_results(session, "And the second one?", None, 2)
@@ -0,0 +1,32 @@
+import asyncio
+import hashlib
+import io
+import pytest
+from fastapi import UploadFile
+from app.document_processor import DocumentProcessor, UploadTooLarge, SNIFF_BYTES
+
+
+def _upload(content: bytes) -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename="notes.txt")
+
+
+def test_spool_upload_hashes_and_rewinds():
+    content = b"The quarterly report covers revenue and costs. " * 5000
+    upload = asyncio.run(DocumentProcessor.spool_upload(_upload(content), max_size_mb=1))
+
+    assert upload.size == len(content)
+    assert upload.content_hash == hashlib.sha256(content).hexdigest()
+    assert upload.head == content[:SNIFF_BYTES]
+    assert upload.file.read() == content
+
+
+def test_spool_upload_stops_at_size_limit():
+    upload = _upload(b"x" * (1024 * 1024 + 1))
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(DocumentProcessor.spool_upload(upload, max_size_mb=1))
+
+
+def test_extract_text_from_stream_sniffs_leading_bytes():
+    content = "Plain text document with enough content.".encode()
+    text, file_type = DocumentProcessor.extract_text_from_stream(io.BytesIO(content), content[:16], "notes.txt")
+    assert (text, file_type) == ("Plain text document with enough content.", "txt")
@@ -0,0 +1,88 @@
+import threading
+import time
+from types import SimpleNamespace
+from app import embedding_versions
+from app.embedding_versions import EmbeddingState, EmbeddingVersion, version_suffix
+from app.lru import LRUCache
+from app.vector_store import VectorStoreManager
+
+
+def test_state_defaults_to_unversioned_storage(tmp_path):
+    state = EmbeddingState.load(str(tmp_path), "model-a")
+
+    assert state.active.model_name == "model-a"
+    assert state.active.suffix == ""
+    assert state.target is None
+
+
+def test_state_round_trips_and_cuts_over(tmp_path):
+    state = EmbeddingState.load(str(tmp_path), "model-a")
+    state.target = EmbeddingVersion("model-b", version_suffix("model-b"))
+    state.save()
+
+    reloaded = EmbeddingState.load(str(tmp_path), "model-a")
+    assert reloaded.target.model_name == "model-b"
+    assert reloaded.target.suffix == version_suffix("model-b") != ""
+
+    reloaded.active, reloaded.target = reloaded.target, None
+    reloaded.save()
+    final = EmbeddingState.load(str(tmp_path), "model-a")
+    assert (final.active.model_name, final.target) == ("model-b", None)
+
+
+def test_models_are_loaded_with_normalized_embeddings(monkeypatch):
+    loaded = []
+
+    class FakeEmbeddings:
+        def __init__(self, **kwargs):
+            loaded.append(kwargs)
+
+    monkeypatch.setattr(embedding_versions, "HuggingFaceEmbeddings", FakeEmbeddings)
+    monkeypatch.setattr(embedding_versions, "_models", {})
+
+    model = embedding_versions.load_embeddings("model-a")
+    assert embedding_versions.load_embeddings("model-a") is model
+    assert len(loaded) == 1
+    assert loaded[0]["encode_kwargs"] == {"normalize_embeddings": True}
+
+
+def test_pre_versioning_data_stays_on_the_legacy_model(tmp_path):
+    (tmp_path / "chroma.sqlite3").write_bytes(b"")
+
+    state = EmbeddingState.load(str(tmp_path), "model-b")
+
+    # Existing collections were embedded with the old hard-coded model, not the configured one
+    assert (state.active.model_name, state.active.suffix) == (embedding_versions.LEGACY_MODEL, "")
+    assert state.target.model_name == "model-b"
+    assert state.target.suffix == version_suffix("model-b")
+    # Persisted, so a later start with yet another model cannot reinterpret the legacy data
+    reloaded = EmbeddingState.load(str(tmp_path), "model-c")
+    assert reloaded.active.model_name == embedding_versions.LEGACY_MODEL
+    assert reloaded.target.model_name == "model-b"
+
+
+def test_cutover_waits_for_reads_pinned_to_the_old_version(tmp_path):
+    dropped = []
+    manager = VectorStoreManager.__new__(VectorStoreManager)
+    manager.embedding_state = EmbeddingState(
+        str(tmp_path), EmbeddingVersion("model-a", ""), EmbeddingVersion("model-b", version_suffix("model-b"))
+    )
+    manager.user_collections = LRUCache(maxsize=10)
+    manager.migration_collections = LRUCache(maxsize=10)
+    manager.corpus_versions = {}
+    manager.exact_index_directory = str(tmp_path / "exact")
+    manager._write_lock = threading.Lock()
+    manager._readers = {}
+    manager._readers_changed = threading.Condition()
+    manager.vectorstore = SimpleNamespace(_client=SimpleNamespace(delete_collection=dropped.append))
+
+    with manager._reading() as version:
+        cutover = threading.Thread(target=manager.complete_migration, args=([1],))
+        cutover.start()
+        time.sleep(0.05)
+        # Queries now use the new model, but this read keeps the old collections alive
+        assert manager.embedding_state.active.model_name == "model-b"
+        assert version.model_name == "model-a"
+        assert dropped == []
+    cutover.join(1)
+    assert dropped == ["user_1_docs"]
@@ -0,0 +1,224 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from chromadb.errors import NotFoundError
+from app.config import settings
+from app.embedding_versions import EmbeddingVersion
+from app.exact_index import ExactIndex
+from app.vector_store import VectorStoreManager
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def test_search_returns_best_matches_first(tmp_path):
+    index = ExactIndex(str(tmp_path / "user_1"))
+    index.add(
+        ["a", "b", "c"],
+        [_unit([1, 0, 0]), _unit([0, 1, 0]), _unit([1, 1, 0])],
+        ["alpha", "beta", "gamma"],
+        [{"chunk_index": 0}, {"chunk_index": 1}, {"chunk_index": 2}]
+    )
+
+    results = index.search([1, 0.1, 0], k=2)
+    assert [doc.page_content for doc, _ in results] == ["alpha", "gamma"]
+    assert results[0][1] > results[1][1]
+
+
+def test_index_is_memory_mapped_and_reloads(tmp_path):
+    directory = str(tmp_path / "user_1")
+    index = ExactIndex(directory)
+    index.add(["a"], [_unit([1, 2, 3])], ["alpha"], [{"chunk_index": 0}])
+    index.add(["b"], [_unit([3, 2, 1])], ["beta"], [{"chunk_index": 1}])
+
+    reloaded = ExactIndex(directory)
+    assert ExactIndex.exists(directory)
+    assert all(isinstance(segment.vectors, np.memmap) for segment in reloaded._segments)
+    assert all(segment.vectors.dtype == np.float16 for segment in reloaded._segments)
+    assert reloaded.count() == 2
+    assert reloaded.get(offset=1)["documents"] == ["beta"]
+
+
+def test_get_includes_embeddings_and_destroy_removes_files(tmp_path):
+    directory = str(tmp_path / "user_1")
+    index = ExactIndex(directory)
+    index.add(["a"], [_unit([1, 0])], ["alpha"], [{}])
+
+    batch = index.get(include_embeddings=True)
+    assert np.allclose(batch["embeddings"][0], [1, 0], atol=1e-3)
+
+    index.destroy()
+    assert not ExactIndex.exists(directory)
+    assert index.search([1, 0], k=1) == []
+
+
+def test_document_filter_is_applied_before_ranking(tmp_path):
+    index = ExactIndex(str(tmp_path / "user_1"))
+    index.add(
+        ["a", "b", "c"],
+        [_unit([1, 0]), _unit([0.9, 0.1]), _unit([0, 1])],
+        ["alpha", "beta", "gamma"],
+        [
+            {"document_id": 1, "chunk_index": 0},
+            {"document_id": 1, "chunk_index": 1},
+            {"document_id": 2, "chunk_index": 0}
+        ]
+    )
+
+    results = index.search([1, 0], k=2, document_ids=[2])
+    assert [doc.page_content for doc, _ in results] == ["gamma"]
+    assert index.search([1, 0], k=2, document_ids=[3]) == []
+
+
+def test_document_chunks_are_paged_in_order(tmp_path):
+    index = ExactIndex(str(tmp_path / "user_1"))
+    index.add(
+        ["c2", "c0", "c1", "other"],
+        [_unit([1, 0])] * 4,
+        ["two", "zero", "one", "other"],
+        [
+            {"document_id": 1, "chunk_index": 2},
+            {"document_id": 1, "chunk_index": 0},
+            {"document_id": 1, "chunk_index": 1},
+            {"document_id": 2, "chunk_index": 0}
+        ]
+    )
+
+    assert [doc.page_content for doc in index.get_document_chunks(1, offset=0, limit=2)] == ["zero", "one"]
+    assert [doc.page_content for doc in index.get_document_chunks(1, offset=2, limit=2)] == ["two"]
+
+
+def test_delete_document_removes_only_its_rows(tmp_path):
+    directory = str(tmp_path / "user_1")
+    index = ExactIndex(directory)
+    index.add(
+        ["a", "b", "c"],
+        [_unit([1, 0, 0]), _unit([0, 1, 0]), _unit([0, 0, 1])],
+        ["alpha", "beta", "gamma"],
+        [{"document_id": 1, "chunk_index": 0}, {"document_id": 2, "chunk_index": 0}, {"document_id": 1, "chunk_index": 1}]
+    )
+
+    assert index.delete_document(1) == 2
+    assert index.delete_document(1) == 0
+    assert ExactIndex(directory).get()["documents"] == ["beta"]
+    assert [doc.page_content for doc, _ in index.search([0, 1, 0], k=3)] == ["beta"]
+
+
+def test_search_many_matches_individual_searches(tmp_path):
+    index = ExactIndex(str(tmp_path / "user_1"))
+    index.add(
+        ["a", "b", "c"],
+        [_unit([1, 0, 0]), _unit([0, 1, 0]), _unit([0, 0, 1])],
+        ["alpha", "beta", "gamma"],
+        [{"document_id": 1}, {"document_id": 1}, {"document_id": 2}]
+    )
+    queries = [[0.1, 1, 0], [0, 0.2, 1]]
+
+    batched = index.search_many(queries, k=2, document_ids=[1])
+
+    assert len(batched) == 2
+    for query, results in zip(queries, batched):
+        single = index.search(query, k=2, document_ids=[1])
+        assert [doc.page_content for doc, _ in results] == [doc.page_content for doc, _ in single]
+    assert [doc.page_content for doc, _ in batched[0]] == ["beta", "alpha"]
+
+
+def test_small_adds_are_appended_and_merged(tmp_path):
+    directory = tmp_path / "user_1"
+    index = ExactIndex(str(directory))
+    index.add(["a", "b", "c", "d"], [_unit([1, 0])] * 4, ["a", "b", "c", "d"], [{}] * 4)
+    first = index._segments[0].name
+    index.add(["e"], [_unit([0, 1])], ["e"], [{}])
+
+    # The big segment is left alone; only the new row is written
+    assert [segment.name for segment in index._segments][0] == first
+    assert len(index._segments) == 2
+    # Trailing segments merge once they reach half their neighbour's size
+    index.add(["f"], [_unit([0, 1])], ["f"], [{}])
+    assert [len(segment.ids) for segment in index._segments] == [6]
+    assert sorted(path.name for path in directory.iterdir() if path.name.startswith("segment_")) == sorted(
+        segment.name for segment in index._segments
+    )
+
+
+def test_delete_is_a_tombstone_until_most_rows_are_gone(tmp_path):
+    index = ExactIndex(str(tmp_path / "user_1"))
+    index.add(
+        ["a", "b", "c"],
+        [_unit([1, 0])] * 3,
+        ["alpha", "beta", "gamma"],
+        [{"document_id": 1}, {"document_id": 2}, {"document_id": 3}]
+    )
+    segment = index._segments[0].name
+
+    index.delete_document(1)
+    assert index._segments[0].name == segment
+    assert index._tombstones == {"a"}
+    assert index.count() == 2
+
+    index.delete_document(2)
+    assert index._segments[0].name != segment
+    assert index._tombstones == set()
+    assert index.get()["documents"] == ["gamma"]
+
+
+def test_writes_from_another_instance_are_seen(tmp_path):
+    directory = str(tmp_path / "user_1")
+    worker_a = ExactIndex(directory)
+    worker_b = ExactIndex(directory)
+
+    worker_a.add(["a"], [_unit([1, 0])], ["alpha"], [{"document_id": 1}])
+    worker_b.add(["b"], [_unit([0, 1])], ["beta"], [{"document_id": 2}])
+
+    # Neither write overwrote the other
+    assert sorted(worker_a.get()["documents"]) == ["alpha", "beta"]
+    worker_a.delete_document(2)
+    assert worker_b.get()["documents"] == ["alpha"]
+
+
+def test_unlisted_segment_from_a_crashed_write_is_ignored(tmp_path):
+    directory = tmp_path / "user_1"
+    index = ExactIndex(str(directory))
+    index.add(["a"], [_unit([1, 0])], ["alpha"], [{}])
+    # A writer that died after writing its segment but before swapping the manifest
+    index._write_segment(np.asarray([_unit([0, 1])], dtype=np.float16), ["b"], ["beta"], [{}])
+
+    assert ExactIndex(str(directory)).get()["documents"] == ["alpha"]
+
+
+def test_single_file_layout_is_upgraded_on_first_write(tmp_path):
+    directory = tmp_path / "user_1"
+    directory.mkdir()
+    np.save(directory / ExactIndex.VECTORS_FILE, np.asarray([_unit([1, 0])], dtype=np.float16))
+    (directory / ExactIndex.TABLE_FILE).write_text('{"ids": ["a"], "texts": ["alpha"], "metadatas": [{}]}')
+
+    index = ExactIndex(str(directory))
+    assert ExactIndex.exists(str(directory))
+    assert index.get()["documents"] == ["alpha"]
+
+    index.add(["b"], [_unit([0, 1])], ["beta"], [{}])
+    assert not (directory / ExactIndex.VECTORS_FILE).exists()
+    assert ExactIndex(str(directory)).get()["documents"] == ["alpha", "beta"]
+
+
+def test_new_tenant_reads_do_not_create_a_chroma_collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "vector_index_backend", "auto")
+    looked_up = []
+
+    def get_collection(name):
+        looked_up.append(name)
+        raise NotFoundError(f"Collection {name} does not exist")
+
+    manager = VectorStoreManager.__new__(VectorStoreManager)
+    manager.exact_index_directory = str(tmp_path)
+    manager.vectorstore = SimpleNamespace(_client=SimpleNamespace(get_collection=get_collection))
+    manager._open_chroma_index = lambda user_id, version: pytest.fail("opened a Chroma collection on read")
+
+    index = manager._open_user_collection(5, EmbeddingVersion("model-a", ""))
+
+    assert isinstance(index, ExactIndex)
+    assert index.count() == 0
+    assert looked_up == ["user_5_docs"]
+    assert list(tmp_path.iterdir()) == []
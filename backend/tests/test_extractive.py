@@ -0,0 +1,39 @@
+from langchain.schema import Document
+from app.extractive import extractive_answer, rank_sentences
+
+
+DOCS = [
+    Document(
+        page_content="Our office opens at nine. The refund policy allows returns within thirty days. Shipping is free.",
+        metadata={"source": "policy.txt_chunk_0"}
+    ),
+    Document(
+        page_content="The refund policy allows returns within thirty days. Gift cards are never refundable.",
+        metadata={"source": "policy.txt_chunk_1"}
+    ),
+]
+
+
+def test_best_sentence_ranks_first_and_overlap_is_deduplicated():
+    ranked = rank_sentences("What is the refund policy?", DOCS)
+
+    sentence, source, score = ranked[0]
+    assert sentence == "The refund policy allows returns within thirty days."
+    assert source == "policy.txt_chunk_0"
+    assert [s for s, _, _ in ranked].count(sentence) == 1
+    assert score > ranked[1][2]
+
+
+def test_embedding_scores_are_blended_in():
+    # A fake model that only recognises the word "gift"
+    def embed_texts(texts):
+        return [[1.0, 0.0] if "gift" in text.lower() else [0.0, 1.0] for text in texts]
+
+    ranked = rank_sentences("Can I return a gift?", DOCS, embed_texts=embed_texts, embedding_weight=0.9)
+    assert ranked[0][0] == "Gift cards are never refundable."
+
+
+def test_no_match_returns_none():
+    assert extractive_answer("Who won the football match?", DOCS) is None
+    answer = extractive_answer("refund policy", DOCS, top_n=1)
+    assert answer == "The refund policy allows returns within thirty days. [policy.txt_chunk_0]"
@@ -0,0 +1,83 @@
+import time
+from langchain.schema import Document
+from app import generation
+from app.admission import AdmissionController
+from app.deadline import Deadline
+from app.llm_service import llm_service
+
+
+DOCS = [Document(page_content="The refund policy allows returns within thirty days.", metadata={"source": "policy.txt_chunk_0"})]
+
+
+def test_slow_llm_returns_degraded_answer_and_fills_cache(monkeypatch):
+    def slow_answer(question, context_documents, user_id=None, raise_errors=False, history=()):
+        time.sleep(0.2)
+        return "LLM answer", 0.2
+
+    monkeypatch.setattr(llm_service, "answer_question_with_timing", slow_answer)
+    monkeypatch.setattr(llm_service, "use_fallback", False)
+    cache_key = (1, "what is the refund policy", 0)
+
+    answer, _, degraded = generation.generate_answer(
+        "What is the refund policy?", DOCS, 1, Deadline(0.01), cache_key, ["policy.txt_chunk_0"]
+    )
+    assert degraded
+    assert "refund policy" in answer
+
+    time.sleep(0.3)
+    assert generation.answer_cache.get(cache_key) == ("LLM answer", ["policy.txt_chunk_0"])
+
+
+def test_llm_error_falls_back_without_caching(monkeypatch):
+    def failing_answer(question, context_documents, user_id=None, raise_errors=False, history=()):
+        raise RuntimeError("API down")
+
+    monkeypatch.setattr(llm_service, "answer_question_with_timing", failing_answer)
+    monkeypatch.setattr(llm_service, "use_fallback", False)
+    cache_key = (2, "what is the refund policy", 0)
+
+    answer, _, degraded = generation.generate_answer(
+        "What is the refund policy?", DOCS, 2, Deadline(5), cache_key, []
+    )
+    assert degraded
+    assert generation.answer_cache.get(cache_key) is None
+
+
+def test_follow_up_routing_and_prompt_use_the_question_as_asked(monkeypatch):
+    calls = []
+
+    def answer(question, context_documents, user_id=None, raise_errors=False, history=()):
+        calls.append(("answer", question, list(history)))
+        return "An answer"
+
+    def summarize(context_documents, user_id=None, raise_errors=False):
+        calls.append(("summary",))
+        return "A summary"
+
+    monkeypatch.setattr(llm_service, "answer_question", answer)
+    monkeypatch.setattr(llm_service, "summarize_documents", summarize)
+
+    history = [("Summarize the Q3 report", "Revenue grew.")]
+    generation.generate_answer(
+        "Who is the author?", DOCS, 1, Deadline(5), (1, "who is the author", 0, "digest"), [], history
+    )
+    assert calls == [("answer", "Who is the author?", history)]
+
+
+def test_call_waits_for_admission_before_taking_a_pool_worker(monkeypatch):
+    controller = AdmissionController(
+        max_concurrent=1, max_per_user=1, max_queued_per_user=4, requests_per_minute=6000, burst=10, queue_timeout=30
+    )
+    monkeypatch.setattr(generation, "admission_controller", controller)
+    monkeypatch.setattr(llm_service, "use_fallback", False)
+    cache_key = (3, "what is the refund policy", 0)
+
+    with controller.admit(user_id=9):
+        start = time.monotonic()
+        answer, _, degraded = generation.generate_answer(
+            "What is the refund policy?", DOCS, 3, Deadline(0.1), cache_key, []
+        )
+    # Gave up at the answer deadline rather than the 30s queue timeout, without submitting anything
+    assert degraded
+    assert time.monotonic() - start < 1
+    assert cache_key not in generation._pending
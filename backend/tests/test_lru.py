@@ -0,0 +1,54 @@
+import threading
+import time
+from app.lru import LRUCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    evicted = []
+    cache = LRUCache(maxsize=2, on_evict=lambda key, value: evicted.append(key))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "b" not in cache
+    assert evicted == ["b"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_weight_cap_evicts_until_under_budget():
+    cache = LRUCache(maxsize=10, max_weight=10, weigh=lambda value: value)
+    cache.set("a", 4)
+    cache.set("b", 4)
+    cache.set("c", 4)
+
+    assert "a" not in cache
+    assert cache.total_weight == 8
+
+
+def test_ttl_expires_entries():
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_get_or_create_runs_factory_once_under_concurrency():
+    cache = LRUCache(maxsize=2)
+    calls = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return "handle"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_create("user_1", factory))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["handle"] * 5
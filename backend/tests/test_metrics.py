@@ -0,0 +1,45 @@
+from app.metrics import (
+    MetricsRegistry,
+    current_stage_timings,
+    start_stage_collection,
+    time_stage,
+    registry,
+)
+
+
+def test_counter_renders_prometheus_text():
+    metrics = MetricsRegistry()
+    counter = metrics.counter("test_calls_total", "Test calls", labelnames=("outcome",))
+    counter.inc(outcome="ok")
+    counter.inc(2, outcome="ok")
+
+    output = metrics.render()
+    assert "# TYPE test_calls_total counter" in output
+    assert 'test_calls_total{outcome="ok"} 3.0' in output
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = MetricsRegistry()
+    histogram = metrics.histogram("test_seconds", "Test latency", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5.0)
+
+    output = metrics.render()
+    assert 'test_seconds_bucket{le="0.1"} 1' in output
+    assert 'test_seconds_bucket{le="1.0"} 2' in output
+    assert 'test_seconds_bucket{le="+Inf"} 3' in output
+    assert "test_seconds_count 3" in output
+
+
+def test_time_stage_records_request_breakdown():
+    start_stage_collection()
+    with time_stage("embed_query"):
+        pass
+    with time_stage("embed_query"):
+        pass
+
+    timings = current_stage_timings()
+    assert set(timings) == {"embed_query"}
+    assert timings["embed_query"] >= 0
+    assert 'qa_stage_duration_seconds_count{stage="embed_query"}' in registry.render()
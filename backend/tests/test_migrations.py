@@ -0,0 +1,66 @@
+import os
+import sqlalchemy as sa
+from alembic import command
+from alembic.config import Config
+
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(__file__)), "alembic.ini")
+
+# The tables as created by the first release, before any column was added
+BASELINE_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR NOT NULL, hashed_password VARCHAR NOT NULL, created_at DATETIME)",
+    "CREATE TABLE documents (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, filename VARCHAR NOT NULL, "
+    "file_type VARCHAR NOT NULL, content TEXT NOT NULL, uploaded_at DATETIME)",
+    "CREATE TABLE query_logs (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, timestamp DATETIME, question TEXT NOT NULL, "
+    "response TEXT NOT NULL, response_time FLOAT NOT NULL, source_documents TEXT)",
+]
+
+
+def _upgrade(url: str):
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("sqlalchemy.url", url)
+    command.upgrade(config, "head")
+
+
+def test_upgrade_adds_the_new_columns_to_an_old_database(tmp_path):
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = sa.create_engine(url)
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(sa.text(statement))
+
+    _upgrade(url)
+
+    inspector = sa.inspect(engine)
+    columns = {column["name"] for column in inspector.get_columns("query_logs")}
+    assert {"stage_timings", "degraded", "cache_hit", "prompt_tokens"} <= columns
+    assert "chunking_config" in {column["name"] for column in inspector.get_columns("users")}
+    document_columns = {column["name"] for column in inspector.get_columns("documents")}
+    assert {"chunk_count", "avg_chunk_tokens", "content_hash"} <= document_columns
+    assert "ix_documents_content_hash" in {index["name"] for index in inspector.get_indexes("documents")}
+
+
+def test_upgrade_is_a_no_op_on_a_database_created_by_create_all(tmp_path):
+    from app.database import Base
+    import app.models  # noqa: F401
+
+    url = f"sqlite:///{tmp_path / 'new.db'}"
+    Base.metadata.create_all(bind=sa.create_engine(url))
+    _upgrade(url)
+    _upgrade(url)
+
+
+def test_downgrade_removes_the_added_columns(tmp_path):
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = sa.create_engine(url)
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(sa.text(statement))
+    _upgrade(url)
+
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("sqlalchemy.url", url)
+    command.downgrade(config, "base")
+
+    document_columns = {column["name"] for column in sa.inspect(engine).get_columns("documents")}
+    assert "content_hash" not in document_columns
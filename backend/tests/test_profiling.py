@@ -0,0 +1,62 @@
+import threading
+import time
+from app.profiling import ProfileStore, SamplingProfiler
+
+
+def _profile(request_id, duration):
+    return {
+        "request_id": request_id,
+        "path": "/qa/ask",
+        "user": "admin@example.com",
+        "status": 200,
+        "duration": duration,
+        "samples": 0,
+        "timestamp": 0.0,
+        "call_tree": {},
+        "collapsed": ""
+    }
+
+
+def test_profile_store_keeps_slowest():
+    store = ProfileStore(max_profiles=2)
+    store.add(_profile("a", 0.5))
+    store.add(_profile("b", 2.0))
+    store.add(_profile("c", 1.0))
+    store.add(_profile("d", 0.1))
+
+    assert [p["request_id"] for p in store.list()] == ["b", "c"]
+    assert store.get("a") is None
+    assert store.get("c")["duration"] == 1.0
+
+
+def test_sampling_profiler_builds_call_tree():
+    def busy_wait():
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            pass
+
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    busy_wait()
+    profiler.stop()
+
+    assert profiler.samples > 0
+    assert "busy_wait" in profiler.collapsed()
+    tree = profiler.call_tree()
+    assert tree["samples"] == profiler.samples
+    assert tree["children"]
+
+
+def test_tracked_worker_threads_are_sampled():
+    profiler = SamplingProfiler(interval=0.001)
+    stop = threading.Event()
+    worker = threading.Thread(target=stop.wait)
+    worker.start()
+    profiler.track_thread(worker.ident)
+    profiler.start()
+    time.sleep(0.05)
+    profiler.stop()
+    stop.set()
+    worker.join()
+
+    assert "wait" in profiler.collapsed()
@@ -0,0 +1,46 @@
+import contextvars
+from langchain.schema import Document
+from app.deadline import Deadline, current_deadline
+from app.metrics import current_stage_timings, start_stage_collection, time_stage
+from app.routers import qa
+
+
+class FakeStore:
+    def get_corpus_version(self, user_id):
+        return 0
+
+    def has_documents_for_user(self, user_id):
+        return True
+
+    def similarity_search_batch(self, queries, user_id, k=None, document_ids=None):
+        self.deadline = current_deadline()
+        with time_stage("vector_search"):
+            return [[(Document(page_content=query, metadata={"source": "a.txt"}), 0.9)] for query in queries]
+
+
+def test_batch_workers_bind_deadlines_and_keep_their_own_timings(monkeypatch):
+    store = FakeStore()
+    generation_deadlines = []
+
+    def generate_answer(question, relevant_docs, user_id, deadline, cache_key, source_documents):
+        generation_deadlines.append((deadline, current_deadline()))
+        with time_stage("llm_call"):
+            return f"answer to {question}", 0.1, False
+
+    monkeypatch.setattr(qa, "vector_store_manager", store)
+    monkeypatch.setattr(qa, "generate_answer", generate_answer)
+    batch_deadline = Deadline(30)
+
+    def answer():
+        start_stage_collection()
+        results = qa._answer_batch(["first question", "second question"], 9001, batch_deadline)
+        return results, current_stage_timings()
+
+    results, batch_timings = contextvars.copy_context().run(answer)
+
+    assert store.deadline is batch_deadline
+    assert len(generation_deadlines) == 2
+    assert all(bound is passed for passed, bound in generation_deadlines)
+    # Generation stages stay with their question instead of piling up in the batch-wide breakdown
+    assert set(batch_timings) == {"vector_search"}
+    assert all(set(result.stage_timings) == {"llm_call"} for result in results)
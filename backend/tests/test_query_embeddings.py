@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.embedding_versions import EmbeddingVersion
+from app.lru import LRUCache
+from app.models import QueryLog
+from app.vector_store import VectorStoreManager
+from app.warmup import frequent_recent_questions
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return [float(len(text))]
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def _manager(model_name="model-a", cache=None):
+    """A manager with only the parts the query embedding cache touches"""
+    embeddings = FakeEmbeddings()
+    version = EmbeddingVersion(model_name, "")
+    version._embeddings = embeddings
+    manager = VectorStoreManager.__new__(VectorStoreManager)
+    manager.embedding_state = SimpleNamespace(active=version, target=None)
+    manager.query_embeddings = cache if cache is not None else LRUCache(maxsize=100)
+    return manager, embeddings
+
+
+def test_cache_hit_skips_the_model():
+    manager, embeddings = _manager()
+
+    first = manager.embed_query("What is the refund policy?")
+    second = manager.embed_query("what is the   refund policy")
+
+    assert second == first
+    assert embeddings.calls == [["What is the refund policy?"]]
+
+
+def test_cache_key_includes_the_model_name():
+    cache = LRUCache(maxsize=100)
+    manager_a, embeddings_a = _manager("model-a", cache)
+    manager_b, embeddings_b = _manager("model-b", cache)
+
+    manager_a.embed_query("What is the refund policy?")
+    manager_b.embed_query("What is the refund policy?")
+
+    assert len(embeddings_a.calls) == len(embeddings_b.calls) == 1
+    assert ("model-a", "what is the refund policy") in cache
+    assert ("model-b", "what is the refund policy") in cache
+
+
+def test_embed_queries_batches_only_the_missing_questions():
+    manager, embeddings = _manager()
+    manager.embed_query("cached question")
+
+    vectors = manager.embed_queries(["Cached question?", "new one", "another new one", "New one"])
+
+    assert embeddings.calls[1:] == [["new one", "another new one"]]
+    assert vectors == [[15.0], [7.0], [15.0], [7.0]]
+
+
+def test_warm_up_ranks_questions_per_user():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    now = datetime.now(timezone.utc)
+
+    def ask(user_id, question, times, days_ago=0):
+        for _ in range(times):
+            db.add(QueryLog(
+                user_id=user_id, question=question, response="a", response_time=0.1,
+                timestamp=now - timedelta(days=days_ago)
+            ))
+
+    ask(1, "What is the refund policy?", 2)
+    ask(1, "what is the refund policy", 2)
+    ask(1, "Who signed the contract?", 3)
+    ask(1, "Where is the office?", 1)
+    ask(1, "An old favourite", 10, days_ago=30)
+    ask(2, "How much is shipping?", 1)
+    db.commit()
+
+    questions = frequent_recent_questions(db, days=7, per_user=2)
+
+    # Spellings that normalize alike are counted together; each user gets their own top questions
+    assert len(questions) == 3
+    assert questions[0].lower().rstrip("?") == "what is the refund policy"
+    assert questions[1:] == ["Who signed the contract?", "How much is shipping?"]
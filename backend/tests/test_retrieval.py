@@ -0,0 +1,28 @@
+from langchain.schema import Document
+from app.config import settings
+from app.retrieval import adaptive_k, is_answerable
+
+
+SCORES = [0.62, 0.58, 0.41, 0.40, 0.12]
+
+
+def test_gap_mode_cuts_at_the_first_large_drop():
+    assert adaptive_k(SCORES, mode="gap", relative_gap=0.15) == 2
+    # Evenly spaced scores have no elbow, so everything is kept
+    assert adaptive_k([0.5, 0.48, 0.46, 0.44], mode="gap", relative_gap=0.15) == 4
+
+
+def test_threshold_and_fixed_modes_respect_min_k():
+    assert adaptive_k(SCORES, mode="threshold", min_similarity=0.4) == 4
+    assert adaptive_k(SCORES, mode="threshold", min_similarity=0.9, min_k=1) == 1
+    assert adaptive_k(SCORES, mode="fixed") == 5
+    assert adaptive_k([], mode="gap") == 0
+
+
+def test_low_best_score_is_not_answerable(monkeypatch):
+    monkeypatch.setattr(settings, "retrieval_answer_cutoff", 0.2)
+    doc = Document(page_content="text", metadata={})
+
+    assert is_answerable([(doc, 0.35), (doc, 0.1)])
+    assert not is_answerable([(doc, 0.15)])
+    assert not is_answerable([])
@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import QueryLog
+from app.rollups import ALL_USERS, get_rollups, histogram_percentile, latency_bucket, update_rollups
+
+
+NOW = datetime(2026, 3, 4, 15, 42, tzinfo=timezone.utc)
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def _log(user_id, response_time, **kwargs):
+    return QueryLog(user_id=user_id, question="q", response="a", response_time=response_time, **kwargs)
+
+
+def test_percentiles_are_within_bucket_resolution():
+    latencies = [0.1 * i for i in range(1, 101)]
+    histogram = {}
+    for latency in latencies:
+        histogram[latency_bucket(latency)] = histogram.get(latency_bucket(latency), 0) + 1
+
+    assert abs(histogram_percentile(histogram, 0.5) - 5.0) / 5.0 < 0.06
+    assert abs(histogram_percentile(histogram, 0.99) - 9.9) / 9.9 < 0.06
+    assert histogram_percentile({}, 0.5) is None
+
+
+def test_rollups_accumulate_per_user_and_overall():
+    db = _session()
+    update_rollups(db, [_log(1, 0.5, prompt_tokens=100), _log(1, 0.0, cache_hit=True)], now=NOW)
+    db.commit()
+    update_rollups(db, [_log(2, 2.0, degraded=True, prompt_tokens=50)], now=NOW)
+    db.commit()
+
+    [user_hour] = get_rollups(db, "hour", user_id=1)
+    assert user_hour.count == 2
+    assert user_hour.cache_hit_rate == 0.5
+    assert user_hour.prompt_tokens == 100
+
+    [overall_day] = get_rollups(db, "day", user_id=ALL_USERS)
+    assert overall_day.bucket_start.hour == 0
+    assert overall_day.count == 3
+    assert overall_day.prompt_tokens == 150
+    assert round(overall_day.fallback_rate, 2) == 0.33
+    assert 1.9 < overall_day.latency_p99 < 2.1
@@ -0,0 +1,119 @@
+import os
+from collections import Counter
+import pytest
+from app.config import settings
+from app.sharding import ConsistentHashRing, ShardedVectorStore, move_user, rebalance, shard_directories
+
+
+class RecordingBackend:
+    def __init__(self, chunks=None):
+        self.calls = []
+        self.chunks = chunks or {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+
+    def has_documents_for_user(self, user_id):
+        self.calls.append(("has_documents_for_user", user_id))
+        return True
+
+    def get_user_chunks(self, user_id, offset=0, limit=None, include_embeddings=False):
+        end = None if limit is None else offset + limit
+        return {key: values[offset:end] for key, values in self.chunks.items()}
+
+    def import_chunks(self, user_id, ids, embeddings, texts, metadatas):
+        self.chunks["ids"] += ids
+        self.chunks["embeddings"] += embeddings
+        self.chunks["documents"] += texts
+        self.chunks["metadatas"] += metadatas
+        return len(ids)
+
+    def delete_user_documents(self, user_id):
+        self.calls.append(("delete_user_documents", user_id))
+
+    def get_migration_status(self):
+        return {"active_model": "model-a", "target_model": None}
+
+
+def test_ring_spreads_users_and_is_stable():
+    ring = ConsistentHashRing(4)
+    counts = Counter(ring.shard_for(user_id) for user_id in range(4000))
+
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 600
+    assert all(ring.shard_for(user_id) == ConsistentHashRing(4).shard_for(user_id) for user_id in range(100))
+
+
+def test_adding_a_shard_moves_only_users_to_the_new_shard():
+    before, after = ConsistentHashRing(4), ConsistentHashRing(5)
+    moved = [user_id for user_id in range(4000) if before.shard_for(user_id) != after.shard_for(user_id)]
+
+    assert all(after.shard_for(user_id) == 4 for user_id in moved)
+    assert len(moved) < 4000 * 0.3
+
+
+def test_sharded_store_routes_by_user():
+    backends = [RecordingBackend(), RecordingBackend()]
+    store = ShardedVectorStore(backends)
+
+    store.has_documents_for_user(7)
+
+    shard = store.ring.shard_for(7)
+    assert backends[shard].calls == [("has_documents_for_user", 7)]
+    assert backends[1 - shard].calls == []
+
+
+def test_move_user_copies_then_drops_source():
+    source = RecordingBackend({
+        "ids": ["a", "b", "c"],
+        "embeddings": [[1.0], [2.0], [3.0]],
+        "documents": ["x", "y", "z"],
+        "metadatas": [{}, {}, {}]
+    })
+    target = RecordingBackend()
+
+    assert move_user(3, source, target) == 3
+    assert target.chunks["ids"] == ["a", "b", "c"]
+    assert source.calls == [("delete_user_documents", 3)]
+
+
+def test_shard_directories_sit_beside_the_unsharded_ones(monkeypatch):
+    monkeypatch.setattr(settings, "chroma_persist_directory", "./chroma_db/")
+    monkeypatch.setattr(settings, "exact_index_directory", "./exact_index")
+
+    assert shard_directories(1) == (
+        os.path.join("chroma_db_shards", "shard_1"),
+        os.path.join("exact_index_shards", "shard_1")
+    )
+
+
+def test_rebalance_reaches_the_previous_sidecars(monkeypatch):
+    monkeypatch.setattr(settings, "vector_store_mode", "sidecar")
+    monkeypatch.setattr(settings, "vector_shards", 2)
+    monkeypatch.setattr(settings, "vector_shard_addresses", ["/tmp/new0.sock", "/tmp/new1.sock"])
+    backends = {}
+
+    def create_backend(shard, shard_count, addresses):
+        address = addresses[0] if shard_count == 1 else addresses[shard]
+        return backends.setdefault(address, RecordingBackend({
+            "ids": ["a"], "embeddings": [[1.0]], "documents": ["x"], "metadatas": [{}]
+        }))
+
+    summary = rebalance(1, ["/tmp/old.sock"], list(range(20)), create_backend)
+
+    # Every user leaves the unsharded sidecar for the shard the new ring gives them
+    assert summary["users_moved"] == 20
+    assert backends["/tmp/old.sock"].calls == [("delete_user_documents", user_id) for user_id in range(20)]
+    moved_to_shard_1 = sum(ConsistentHashRing(2).shard_for(user_id) == 1 for user_id in range(20))
+    assert len(backends["/tmp/new1.sock"].chunks["ids"]) == 1 + moved_to_shard_1
+
+
+def test_rebalance_refuses_during_an_embedding_migration(monkeypatch):
+    monkeypatch.setattr(settings, "vector_store_mode", "embedded")
+    monkeypatch.setattr(settings, "vector_shards", 2)
+
+    class MigratingBackend(RecordingBackend):
+        def get_migration_status(self):
+            return {"active_model": "model-a", "target_model": "model-b"}
+
+    backend = MigratingBackend()
+    with pytest.raises(ValueError, match="migration"):
+        rebalance(1, [], [1, 2, 3], lambda shard, shard_count, addresses: backend)
+    assert backend.calls == []
@@ -0,0 +1,103 @@
+import io
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import ingestion
+from app.database import Base
+from app.models import Document
+from app.snapshot import SnapshotError, SnapshotReader, write_snapshot
+
+
+def _chunk_batch(start, count, document_id):
+    return {
+        "chunk_id": [f"c{i}" for i in range(start, start + count)],
+        "document_id": [document_id] * count,
+        "chunk_index": list(range(count)),
+        "text": [f"chunk {i}" for i in range(start, start + count)],
+        "metadata": ['{"chunk_index": %d}' % i for i in range(count)],
+        "embedding": [[float(i), 0.5, -0.5] for i in range(start, start + count)],
+    }
+
+
+def test_snapshot_round_trips_in_batches():
+    documents = [[
+        {"document_id": 1, "filename": "a.txt", "file_type": "txt", "content": "alpha", "content_hash": "h1"},
+        {"document_id": 2, "filename": "b.pdf", "file_type": "pdf", "content": "beta", "content_hash": None},
+    ]]
+    target = io.BytesIO()
+    write_snapshot(target, documents, [_chunk_batch(0, 3, 1), _chunk_batch(3, 2, 2)], "test-model")
+
+    target.seek(0)
+    reader = SnapshotReader(target)
+    assert reader.embedding_model == "test-model"
+    assert reader.manifest["chunks"] == 5
+    assert [row["filename"] for rows in reader.document_batches() for row in rows] == ["a.txt", "b.pdf"]
+
+    batches = list(reader.chunk_batches(batch_size=2))
+    assert [len(batch["chunk_id"]) for batch in batches] == [2, 2, 1]
+    assert batches[2]["embedding"] == [[4.0, 0.5, -0.5]]
+    assert batches[1]["document_id"] == [1, 2]
+
+
+def test_reader_rejects_non_snapshots():
+    with pytest.raises(SnapshotError):
+        SnapshotReader(io.BytesIO(b"not a zip"))
+
+
+class FakeStore:
+    def __init__(self, dimension=3, fail_on_batch=None):
+        self.dimension = dimension
+        self.fail_on_batch = fail_on_batch
+        self.batches = 0
+        self.deleted = []
+
+    def get_migration_status(self):
+        return {"active_model": "test-model", "target_model": None}
+
+    def get_embedding_dimension(self):
+        return self.dimension
+
+    def import_chunks(self, user_id, ids, embeddings, texts, metadatas):
+        self.batches += 1
+        if self.batches == self.fail_on_batch:
+            raise RuntimeError("An embedding model migration is in progress; import after it completes")
+        return len(ids)
+
+    def delete_document_chunks(self, document_id, user_id):
+        self.deleted.append(document_id)
+
+
+def _import(monkeypatch, store):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    monkeypatch.setattr(ingestion, "vector_store_manager", store)
+
+    documents = [[
+        {"document_id": i, "filename": f"{i}.txt", "file_type": "txt", "content": "text", "content_hash": f"h{i}"}
+        for i in range(1, 4)
+    ]]
+    source = io.BytesIO()
+    write_snapshot(source, documents, [_chunk_batch(0, 2, 1), _chunk_batch(2, 2, 2), _chunk_batch(4, 2, 3)], "test-model")
+    source.seek(0)
+    try:
+        return ingestion.import_user_corpus(db, 1, source), db
+    except (SnapshotError, RuntimeError) as e:
+        return e, db
+
+
+def test_wrong_dimension_is_refused_before_anything_is_written(monkeypatch):
+    error, db = _import(monkeypatch, FakeStore(dimension=384))
+
+    assert isinstance(error, SnapshotError)
+    assert "384" in str(error)
+    assert db.query(Document).count() == 0
+
+
+def test_failed_import_removes_what_it_added(monkeypatch):
+    store = FakeStore(fail_on_batch=1)
+    error, db = _import(monkeypatch, store)
+
+    assert isinstance(error, RuntimeError)
+    assert db.query(Document).count() == 0
+    assert sorted(store.deleted) == [1, 2, 3]
@@ -0,0 +1,107 @@
+import contextvars
+import os
+import tempfile
+import threading
+import time
+import pytest
+from app.deadline import Deadline, DeadlineExceeded, bind_deadline
+from app.vector_service import VectorStoreClient, VectorStoreServer
+
+
+class FakeManager:
+    def __init__(self):
+        self.documents = {}
+
+    def add_documents(self, documents, user_id):
+        self.documents.setdefault(user_id, []).extend(documents)
+        return [str(i) for i in range(len(documents))]
+
+    def has_documents_for_user(self, user_id):
+        return bool(self.documents.get(user_id))
+
+    def get_corpus_version(self, user_id):
+        raise ValueError("boom")
+
+
+def test_client_forwards_calls_to_sidecar():
+    address = os.path.join(tempfile.mkdtemp(), "vector.sock")
+    server = VectorStoreServer(FakeManager(), address=address)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    while not os.path.exists(address):
+        pass
+
+    client = VectorStoreClient(address=address)
+    assert client.has_documents_for_user(1) is False
+    assert client.add_documents([{"id": 1, "filename": "a.txt", "content": "hello"}], 1) == ["0"]
+    assert client.has_documents_for_user(1) is True
+
+    try:
+        client.get_corpus_version(1)
+        assert False, "expected the sidecar error to be re-raised"
+    except ValueError as e:
+        assert str(e) == "boom"
+
+
+def test_slow_write_does_not_block_reads():
+    class SlowIndexManager(FakeManager):
+        def __init__(self):
+            super().__init__()
+            self.embedding = threading.Event()
+            self.release = threading.Event()
+
+        def index_documents(self, documents, user_id, chunking=None):
+            # Stands in for embedding, which the manager does outside its own write lock
+            self.embedding.set()
+            self.release.wait(5)
+            return self.add_documents(documents, user_id)
+
+    manager = SlowIndexManager()
+    server = VectorStoreServer(manager, address="unused")
+    writer = threading.Thread(
+        target=server.dispatch, args=("index_documents", ([{"id": 1}], 1), {})
+    )
+    writer.start()
+    assert manager.embedding.wait(1)
+
+    assert server.dispatch("has_documents_for_user", (1,), {}) is False
+    manager.release.set()
+    writer.join()
+    assert server.dispatch("has_documents_for_user", (1,), {}) is True
+
+
+def test_client_search_gives_up_at_the_request_deadline():
+    class SlowSearchManager(FakeManager):
+        def similarity_search(self, query, user_id, k=None, document_ids=None):
+            time.sleep(0.3)
+            return []
+
+    address = os.path.join(tempfile.mkdtemp(), "vector.sock")
+    server = VectorStoreServer(SlowSearchManager(), address=address)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    while not os.path.exists(address):
+        pass
+
+    def search_with_deadline():
+        client = VectorStoreClient(address=address)
+        bind_deadline(Deadline(0.05))
+        with pytest.raises(DeadlineExceeded):
+            client.similarity_search("refunds", 1)
+        # The late reply is dropped with the old connection instead of answering the next call,
+        # and cheap lookups still complete although the deadline has passed
+        assert client.has_documents_for_user(1) is False
+
+    contextvars.copy_context().run(search_with_deadline)
+
+
+def test_module_level_store_is_built_on_first_use():
+    from app.vector_store import LazyVectorStore, vector_store_manager
+
+    # Importing the module, as the sidecar entry point does, must not load a model
+    assert vector_store_manager._instance is None
+
+    built = []
+    store = LazyVectorStore(lambda: built.append(1) or FakeManager())
+    assert not built
+    assert store.has_documents_for_user(1) is False
+    assert store.has_documents_for_user(2) is False
+    assert built == [1]